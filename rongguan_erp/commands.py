@@ -0,0 +1,43 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-pending-request-qty")
+@pass_context
+def rebuild_pending_request_qty(context):
+	"""重建待处理请购数量汇总表（RG Pending Request Qty）"""
+	import frappe
+
+	from rongguan_erp.utils.pending_request_qty import rebuild_pending_request_qty as rebuild
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		count = rebuild()
+		frappe.db.commit()
+		click.echo(f"已重建 {count} 条待处理请购汇总")
+	finally:
+		frappe.destroy()
+
+
+@click.command("rebuild-material-where-used")
+@pass_context
+def rebuild_material_where_used(context):
+	"""重建物料反查索引（RG Material Where Used）"""
+	import frappe
+
+	from rongguan_erp.utils.material_where_used import rebuild_material_where_used as rebuild
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		count = rebuild()
+		frappe.db.commit()
+		click.echo(f"已重建 {count} 条物料反查索引")
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_pending_request_qty, rebuild_material_where_used]
@@ -145,9 +145,79 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Employee": {
+		"on_update": "rongguan_erp.utils.employee_directory.clear_employee_user_map",
+		"after_rename": "rongguan_erp.utils.employee_directory.clear_employee_user_map",
+		"on_trash": "rongguan_erp.utils.employee_directory.clear_employee_user_map"
+	},
+	"User": {
+		"after_insert": "rongguan_erp.utils.employee_directory.clear_employee_user_map",
+		"after_rename": "rongguan_erp.utils.employee_directory.clear_employee_user_map",
+		"on_trash": "rongguan_erp.utils.employee_directory.clear_employee_user_map"
+	},
+	"Item Attribute": {
+		"on_update": "rongguan_erp.utils.item_attribute_classification.clear_attribute_classification",
+		"after_rename": "rongguan_erp.utils.item_attribute_classification.clear_attribute_classification",
+		"on_trash": "rongguan_erp.utils.item_attribute_classification.clear_attribute_classification"
+	},
+	"Item": {
+		"on_update": "rongguan_erp.utils.pagination.clear_cached_counts_on_write",
+		"after_rename": "rongguan_erp.utils.pagination.clear_cached_counts_on_write",
+		"on_trash": "rongguan_erp.utils.pagination.clear_cached_counts_on_write"
+	},
+	"Tag Link": {
+		"after_insert": "rongguan_erp.utils.item_attribute_classification.clear_attribute_classification_on_tag",
+		"on_trash": "rongguan_erp.utils.item_attribute_classification.clear_attribute_classification_on_tag"
+	},
+	"Operation": {
+		"after_rename": "rongguan_erp.utils.operation_provisioning.clear_known_operations",
+		"on_trash": "rongguan_erp.utils.operation_provisioning.clear_known_operations"
+	},
+	"BOM": {
+		"on_submit": "rongguan_erp.utils.material_where_used.update_where_used",
+		"on_update_after_submit": [
+			"rongguan_erp.utils.exploded_bom_cache.clear_exploded_bom_cache",
+			"rongguan_erp.utils.material_where_used.update_where_used"
+		],
+		"on_cancel": [
+			"rongguan_erp.utils.exploded_bom_cache.clear_exploded_bom_cache",
+			"rongguan_erp.utils.material_where_used.update_where_used"
+		],
+		"on_trash": [
+			"rongguan_erp.utils.exploded_bom_cache.clear_exploded_bom_cache",
+			"rongguan_erp.utils.material_where_used.update_where_used"
+		]
+	},
+	"Material Request": {
+		"on_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_cancel": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_update_after_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty"
+	},
+	"Purchase Order": {
+		"on_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_cancel": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_update_after_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty"
+	},
+	"Stock Entry": {
+		"on_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_cancel": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty"
+	},
+	"Work Order": {
+		"on_submit": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty",
+		"on_cancel": "rongguan_erp.utils.pending_request_qty.update_pending_request_qty"
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"daily": [
+		"rongguan_erp.utils.pending_request_qty.rebuild_pending_request_qty"
+	]
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"rongguan_erp.tasks.all"
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, guinan.lin@foxmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+
+from rongguan_erp.utils.material_where_used import rebuild_material_where_used
+
+
+def execute():
+	"""生成 RG Material Where Used，并为反查时按 BOM 关联订单的字段加索引。"""
+	frappe.db.add_index("Sales Order Item", ["custom_updated_bom_no"])
+	frappe.db.add_index("Sales Order Item", ["bom_no"])
+	frappe.db.add_index("Work Order", ["bom_no"])
+	rebuild_material_where_used()
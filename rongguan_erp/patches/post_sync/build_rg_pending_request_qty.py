@@ -0,0 +1,9 @@
+# Copyright (c) 2026, guinan.lin@foxmail.com and contributors
+# For license information, please see license.txt
+
+from rongguan_erp.utils.pending_request_qty import rebuild_pending_request_qty
+
+
+def execute():
+	"""首次安装汇总表时按现有请购数据生成 RG Pending Request Qty。"""
+	rebuild_pending_request_qty()
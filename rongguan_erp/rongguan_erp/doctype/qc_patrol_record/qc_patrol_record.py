@@ -4,7 +4,16 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
-from frappe.utils import nowdate, getdate
+from frappe.utils import nowdate, getdate, cint
+import json
+from rongguan_erp.utils.pagination import (
+	InvalidCursorError,
+	cached_count,
+	keyset_condition,
+	keyset_order_by,
+	next_cursor_for,
+	parse_order_by
+)
 
 
 class QCPatrolRecord(Document):
@@ -17,7 +26,9 @@ def get_qc_patrol_records(
 	page_size=20, 
 	filters=None, 
 	search=None,
-	order_by="modified desc"
+	order_by="modified desc",
+	cursor=None,
+	with_count=None
 ):
 	"""
 	获取QC巡查记录的分页查询方法
@@ -28,6 +39,9 @@ def get_qc_patrol_records(
 		filters (dict): 过滤条件
 		search (str): 搜索关键词
 		order_by (str): 排序方式
+		cursor (str): 游标分页，传入上一次返回的 pagination.next_cursor 获取下一页（此时忽略 page）
+		with_count (int): 是否计算总数；页码模式默认计算（精确计数），游标模式默认不计算，
+			需要总数时可单独调用 get_qc_patrol_records_count
 	
 	Returns:
 		dict: 包含记录列表和分页信息的字典
@@ -36,68 +50,31 @@ def get_qc_patrol_records(
 		# 参数验证和默认值设置
 		page = int(page) if page else 1
 		page_size = int(page_size) if page_size else 20
-		filters = filters or {}
-		
-		# 构建查询条件
-		conditions = []
-		params = {}
-		
-		# 基础过滤条件
-		if filters.get("patrol_date_from"):
-			conditions.append("patrol_date >= %(patrol_date_from)s")
-			params["patrol_date_from"] = filters.get("patrol_date_from")
-		
-		if filters.get("patrol_date_to"):
-			conditions.append("patrol_date <= %(patrol_date_to)s")
-			params["patrol_date_to"] = filters.get("patrol_date_to")
-		
-		if filters.get("inspector"):
-			conditions.append("inspector LIKE %(inspector)s")
-			params["inspector"] = f"%{filters.get('inspector')}%"
-		
-		if filters.get("factory"):
-			conditions.append("factory = %(factory)s")
-			params["factory"] = filters.get("factory")
-		
-		if filters.get("process_stage"):
-			conditions.append("process_stage = %(process_stage)s")
-			params["process_stage"] = filters.get("process_stage")
-		
-		if filters.get("overall_evaluation"):
-			conditions.append("overall_evaluation = %(overall_evaluation)s")
-			params["overall_evaluation"] = filters.get("overall_evaluation")
-		
-		if filters.get("need_recheck"):
-			conditions.append("need_recheck = %(need_recheck)s")
-			params["need_recheck"] = filters.get("need_recheck")
-		
-		# 搜索条件
-		if search:
-			search_conditions = [
-				"report_number LIKE %(search)s",
-				"product_name LIKE %(search)s",
-				"order_number LIKE %(search)s",
-				"inspector LIKE %(search)s"
-			]
-			conditions.append(f"({' OR '.join(search_conditions)})")
-			params["search"] = f"%{search}%"
-		
-		# 构建WHERE子句
-		where_clause = " AND ".join(conditions) if conditions else "1=1"
-		
-		# 计算总数
-		count_sql = f"""
-			SELECT COUNT(*) as total
-			FROM `tabQC Patrol Record`
-			WHERE {where_clause}
-		"""
-		total_count = frappe.db.sql(count_sql, params, as_dict=True)[0].total
+		use_cursor = bool(cursor)
+		with_count = cint(with_count) if with_count not in (None, "") else not use_cursor
+		
+		where_clause, params = _build_qc_patrol_conditions(filters, search)
 		
-		# 计算分页
-		offset = (page - 1) * page_size
-		total_pages = (total_count + page_size - 1) // page_size
+		# 计算总数（可选，精确计数）
+		total_count = _count_qc_patrol_records(where_clause, params, filters, search, use_cache=False) \
+			if with_count else None
 		
-		# 查询主表数据
+		# 游标模式需要单字段排序；页码模式保持原有排序写法
+		sort = parse_order_by(order_by, default="modified desc")
+		if use_cursor:
+			if not sort:
+				raise InvalidCursorError(_("游标分页只支持单字段排序，当前排序: {0}").format(order_by))
+			cursor_condition, cursor_params = keyset_condition(sort[0], sort[1], cursor)
+			page_where = f"({where_clause}) AND {cursor_condition}"
+			params.update(cursor_params)
+			order_clause = keyset_order_by(sort[0], sort[1])
+			offset = 0
+		else:
+			page_where = where_clause
+			order_clause = keyset_order_by(sort[0], sort[1]) if sort else order_by
+			offset = (page - 1) * page_size
+		
+		# 查询主表数据（多取一条用于判断是否有下一页）
 		main_sql = f"""
 			SELECT 
 				name,
@@ -120,16 +97,19 @@ def get_qc_patrol_records(
 				modified,
 				modified_by
 			FROM `tabQC Patrol Record`
-			WHERE {where_clause}
-			ORDER BY {order_by}
+			WHERE {page_where}
+			ORDER BY {order_clause}
 			LIMIT %(page_size)s OFFSET %(offset)s
 		"""
 		params.update({
-			"page_size": page_size,
+			"page_size": page_size + 1,
 			"offset": offset
 		})
 		
 		main_records = frappe.db.sql(main_sql, params, as_dict=True)
+		has_next = len(main_records) > page_size
+		main_records = main_records[:page_size]
+		next_cursor = next_cursor_for(main_records, order_by or "modified desc", has_next)
 		
 		# 获取子表数据
 		for record in main_records:
@@ -151,19 +131,25 @@ def get_qc_patrol_records(
 			)
 			record["problem_records"] = problem_records
 		
+		# 分页信息
+		pagination = {
+			"page_size": page_size,
+			"has_next": has_next,
+			"next_cursor": next_cursor
+		}
+		if not use_cursor:
+			pagination["current_page"] = page
+			pagination["has_prev"] = page > 1
+		if total_count is not None:
+			pagination["total_count"] = total_count
+			pagination["total_pages"] = (total_count + page_size - 1) // page_size
+		
 		# 返回结果
 		return {
 			"success": True,
 			"data": {
 				"records": main_records,
-				"pagination": {
-					"current_page": page,
-					"page_size": page_size,
-					"total_count": total_count,
-					"total_pages": total_pages,
-					"has_next": page < total_pages,
-					"has_prev": page > 1
-				}
+				"pagination": pagination
 			},
 			"message": f"成功获取 {len(main_records)} 条记录"
 		}
@@ -177,6 +163,112 @@ def get_qc_patrol_records(
 		}
 
 
+@frappe.whitelist()
+def get_qc_patrol_records_count(filters=None, search=None):
+	"""
+	获取QC巡查记录总数（get_qc_patrol_records 的伴随调用，结果短期缓存）
+	
+	Args:
+		filters (dict): 过滤条件，与 get_qc_patrol_records 相同
+		search (str): 搜索关键词
+	
+	Returns:
+		dict: 包含 total_count 的字典
+	"""
+	try:
+		where_clause, params = _build_qc_patrol_conditions(filters, search)
+		return {
+			"success": True,
+			"data": {
+				"total_count": _count_qc_patrol_records(where_clause, params, filters, search)
+			},
+			"message": "成功获取记录总数"
+		}
+		
+	except Exception as e:
+		frappe.log_error(f"获取QC巡查记录总数失败: {str(e)}", "QC Patrol Record API Error")
+		return {
+			"success": False,
+			"message": f"获取QC巡查记录总数失败: {str(e)}",
+			"data": None
+		}
+
+
+def _count_qc_patrol_records(where_clause, params, filters, search, use_cache=True):
+	"""计算QC巡查记录总数（use_cache 时按过滤条件短期缓存）"""
+	def counter():
+		count_sql = f"""
+			SELECT COUNT(*) as total
+			FROM `tabQC Patrol Record`
+			WHERE {where_clause}
+		"""
+		return frappe.db.sql(count_sql, params, as_dict=True)[0].total
+	
+	if not use_cache:
+		return counter()
+	return cached_count("QC Patrol Record", filters, counter=counter, extra_key=search)
+
+
+def _build_qc_patrol_conditions(filters, search):
+	"""
+	构建QC巡查记录查询的 WHERE 子句
+	
+	Returns:
+		tuple: (WHERE 子句, 参数字典)
+	"""
+	if isinstance(filters, str):
+		filters = json.loads(filters)
+	filters = filters or {}
+	
+	# 构建查询条件
+	conditions = []
+	params = {}
+	
+	# 基础过滤条件
+	if filters.get("patrol_date_from"):
+		conditions.append("patrol_date >= %(patrol_date_from)s")
+		params["patrol_date_from"] = filters.get("patrol_date_from")
+	
+	if filters.get("patrol_date_to"):
+		conditions.append("patrol_date <= %(patrol_date_to)s")
+		params["patrol_date_to"] = filters.get("patrol_date_to")
+	
+	if filters.get("inspector"):
+		conditions.append("inspector LIKE %(inspector)s")
+		params["inspector"] = f"%{filters.get('inspector')}%"
+	
+	if filters.get("factory"):
+		conditions.append("factory = %(factory)s")
+		params["factory"] = filters.get("factory")
+	
+	if filters.get("process_stage"):
+		conditions.append("process_stage = %(process_stage)s")
+		params["process_stage"] = filters.get("process_stage")
+	
+	if filters.get("overall_evaluation"):
+		conditions.append("overall_evaluation = %(overall_evaluation)s")
+		params["overall_evaluation"] = filters.get("overall_evaluation")
+	
+	if filters.get("need_recheck"):
+		conditions.append("need_recheck = %(need_recheck)s")
+		params["need_recheck"] = filters.get("need_recheck")
+	
+	# 搜索条件
+	if search:
+		search_conditions = [
+			"report_number LIKE %(search)s",
+			"product_name LIKE %(search)s",
+			"order_number LIKE %(search)s",
+			"inspector LIKE %(search)s"
+		]
+		conditions.append(f"({' OR '.join(search_conditions)})")
+		params["search"] = f"%{search}%"
+	
+	# 构建WHERE子句
+	where_clause = " AND ".join(conditions) if conditions else "1=1"
+	return where_clause, params
+
+
 @frappe.whitelist()
 def get_qc_patrol_record_detail(record_name):
 	"""
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, guinan.lin@foxmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class RGMaterialWhereUsed(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique("RG Material Where Used", ["material", "bom"], constraint_name="unique_material_bom")
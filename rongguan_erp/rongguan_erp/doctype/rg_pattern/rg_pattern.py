@@ -4,6 +4,8 @@
 import frappe
 from frappe.model.document import Document
 
+from rongguan_erp.utils.item_attribute_classification import classify_items
+
 
 class RGPattern(Document):
 	def validate(self):
@@ -152,29 +154,11 @@ def get_sales_order_items_by_pattern(pattern_name):
 			ORDER BY soi.idx
 		""", (pattern_doc.sales_order,), as_dict=True)
 		
-		# 为每个item获取颜色和尺码信息
+		# 一次性获取所有item的颜色和尺码信息
+		item_attributes = classify_items([item.item_code for item in sales_order_items])
 		result = []
 		for item in sales_order_items:
-			# 获取Item的变体属性信息
-			item_variants = frappe.db.sql("""
-				SELECT 
-					iva.attribute,
-					iva.attribute_value,
-					ia._user_tags
-				FROM `tabItem Variant Attribute` iva
-				LEFT JOIN `tabItem Attribute` ia ON iva.attribute = ia.name
-				WHERE iva.parent = %s
-				AND (ia._user_tags LIKE %s OR ia._user_tags LIKE %s)
-			""", (item.item_code, '%颜色%', '%尺寸%'), as_dict=True)
-			
-			# 处理属性信息
-			color = ""
-			size = ""
-			for variant in item_variants:
-				if variant._user_tags and '颜色' in variant._user_tags:
-					color = variant.attribute_value
-				elif variant._user_tags and '尺寸' in variant._user_tags:
-					size = variant.attribute_value
+			color, size = item_attributes.get(item.item_code, ("", ""))
 			
 			# 获取工单号 - 单独的事务处理
 			work_order = ""
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, guinan.lin@foxmail.com and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("RG Pending Request Qty", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, guinan.lin@foxmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class RGPendingRequestQty(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique("RG Pending Request Qty", ["item_code", "warehouse"], constraint_name="unique_item_warehouse")
@@ -7,6 +7,8 @@ from frappe.model.mapper import get_mapped_doc
 from frappe.utils.pdf import get_pdf
 from frappe.www.printview import get_rendered_template
 
+from rongguan_erp.utils.item_attribute_classification import classify_item, classify_items
+
 
 class RGProductionOrders(Document):
 	pass
@@ -477,18 +479,7 @@ def _get_item_color_from_item_code(item_code):
     """
     if not item_code:
         return ""
-    try:
-        item_doc = frappe.get_doc("Item", item_code)
-        for attr in item_doc.get("attributes", []):
-            try:
-                attr_doc = frappe.get_doc("Item Attribute", attr.attribute)
-                if attr_doc.get("_user_tags") and "颜色" in (attr_doc.get("_user_tags") or ""):
-                    return (attr.attribute_value or "").strip()
-            except Exception:
-                continue
-    except Exception:
-        pass
-    return ""
+    return classify_item(item_code)[0]
 
 
 @frappe.whitelist()
@@ -565,42 +556,23 @@ def get_production_order_details(docname):
         else:
             doc_dict["sales_order_status"] = None
         
+        # 一次性解析 items 与 table_mbev 中所有物料的颜色/尺码（按 Item Attribute 的 _user_tags 判定）
+        item_attributes = {}
+        try:
+            item_attributes = classify_items(
+                [row.get("item_code") for row in (doc_dict.get("items") or []) + (doc_dict.get("table_mbev") or [])]
+            )
+        except Exception as e:
+            frappe.log_error(f"批量获取物料颜色尺码时出错: {str(e)}")
+        
         # 处理 items 子表，添加颜色和尺码信息
         if "items" in doc_dict and doc_dict["items"]:
             for item in doc_dict["items"]:
                 item_code = item.get("item_code")
                 if item_code:
-                    try:
-                        item_doc = frappe.get_doc("Item", item_code)
-                        color = ""
-                        size = ""
-                        
-                        # 获取 Item 的属性
-                        for attr in item_doc.get("attributes", []):
-                            attribute_name = attr.attribute
-                            attribute_value = attr.attribute_value
-                            
-                            # 查询 tabItem Attribute 表，根据 _user_tags 判断属性类型
-                            try:
-                                attr_doc = frappe.get_doc("Item Attribute", attribute_name)
-                                user_tags = attr_doc.get("_user_tags", "")
-                                
-                                # 如果 _user_tags 包含颜色相关关键词，则认为是颜色属性
-                                if any(tag in user_tags.lower() for tag in ["颜色"]):
-                                    color = attribute_value
-                                # 如果 _user_tags 包含尺寸相关关键词，则认为是尺码属性
-                                elif any(tag in user_tags.lower() for tag in ["尺寸"]):
-                                    size = attribute_value
-                                    
-                            except Exception as attr_e:
-                                frappe.log_error(f"获取属性 {attribute_name} 的 _user_tags 时出错: {str(attr_e)}")
-                                # 如果无法获取 _user_tags，不设置任何默认值，保持空值
-                        
-                        item["color"] = color # 添加颜色到返回的 item 字典
-                        item["size"] = size   # 添加尺码到返回的 item 字典
-                    except Exception as e:
-                        frappe.log_error(f"获取物料 {item_code} 的属性时出错: {str(e)}")
-                        # 即使无法获取物料属性，也继续执行
+                    color, size = item_attributes.get(item_code, ("", ""))
+                    item["color"] = color # 添加颜色到返回的 item 字典
+                    item["size"] = size   # 添加尺码到返回的 item 字典
         
         # 根据 items 汇总 rg_size_details
         size_qty_map = {}
@@ -637,12 +609,9 @@ def get_production_order_details(docname):
             # 对 table_mbev 中 item_color 为空的记录，从 Item 主数据的「颜色」属性回填（与 items 子表逻辑一致）
             for row in doc_dict["table_mbev"]:
                 if row.get("item_code") and not (row.get("item_color") or "").strip():
-                    try:
-                        color = _get_item_color_from_item_code(row["item_code"])
-                        if color:
-                            row["item_color"] = color
-                    except Exception as e:
-                        frappe.log_error(f"table_mbev 回填物料颜色时出错 item_code={row.get('item_code')}: {str(e)}")
+                    color = item_attributes.get(row["item_code"], ("", ""))[0]
+                    if color:
+                        row["item_color"] = color
         else:
             doc_dict["rg_bom_detail_listing"] = []
         
@@ -0,0 +1,29 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.api.bom_dependency import analyze_bom_batch, topological_order
+
+
+class TestBomDependency(FrappeTestCase):
+	"""测试批量 BOM 的依赖图分析"""
+
+	def test_children_before_parents(self):
+		order, cyclic = topological_order({"FG": ["SUB", "RM1"], "SUB": ["RM2"]})
+		self.assertEqual(cyclic, [])
+		self.assertLess(order.index("SUB"), order.index("FG"))
+		self.assertLess(order.index("RM2"), order.index("SUB"))
+
+	def test_cycle_detected(self):
+		_, cyclic = topological_order({"A": ["B"], "B": ["C"], "C": ["A"], "D": ["RM"]})
+		self.assertEqual(set(cyclic), {"A", "B", "C"})
+
+	def test_batch_save_order(self):
+		boms = [
+			{"doctype": "BOM", "item": "_Test RG FG", "items": [{"item_code": "_Test RG SUB"}]},
+			{"doctype": "BOM", "item": "_Test RG SUB", "items": [{"item_code": "_Test RG RM"}]},
+		]
+		analysis = analyze_bom_batch(boms)
+		self.assertEqual(analysis["cyclic_items"], [])
+		self.assertEqual(analysis["save_order"], [1, 0])
@@ -0,0 +1,29 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.api.bom import get_bom_info_by_so
+
+
+class TestBomInfoBySo(FrappeTestCase):
+	"""测试按销售订单查询多物料用量"""
+
+	def test_multiple_materials_match_single_calls(self):
+		row = frappe.db.sql("""
+			SELECT soi.parent, bi.parent AS bom_no
+			FROM `tabSales Order Item` soi
+			JOIN `tabBOM Item` bi ON bi.parent = soi.custom_updated_bom_no
+			LIMIT 1
+		""", as_dict=True)
+		if not row:
+			self.skipTest("没有绑定了更新BOM的销售订单")
+
+		sales_order = row[0].parent
+		materials = frappe.get_all("BOM Item", filters={"parent": row[0].bom_no}, pluck="item_code", limit=5)
+		result = get_bom_info_by_so(sales_order=sales_order, material_item_codes=materials)
+		for material in materials:
+			single = get_bom_info_by_so(sales_order=sales_order, material_item_code=material)
+			self.assertEqual(result["data"]["materials"][material]["total_qty"], single["data"]["total_qty"])
+			self.assertEqual(result["data"]["materials"][material]["bom_count"], single["data"]["bom_count"])
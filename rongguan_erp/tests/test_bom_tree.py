@@ -0,0 +1,38 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.bom_tree import load_bom_tree
+
+
+class TestBomTree(FrappeTestCase):
+	"""测试逐层加载的 BOM 树"""
+
+	def setUp(self):
+		self.bom_no = frappe.db.get_value(
+			"BOM Item", {"parenttype": "BOM", "bom_no": ["is", "set"]}, "parent"
+		)
+		if not self.bom_no:
+			self.skipTest("没有包含下级 BOM 的 BOM")
+
+	def test_full_tree_links_every_sub_bom(self):
+		tree = load_bom_tree(self.bom_no)
+		self.assertEqual(tree["truncated"], [])
+		for rows in tree["children"].values():
+			for row in rows:
+				if row.bom_no:
+					self.assertIn(row.bom_no, tree["nodes"])
+
+	def test_depth_limit_marks_expandable(self):
+		tree = load_bom_tree(self.bom_no, depth=1)
+		self.assertIn(self.bom_no, tree["children"])
+		for bom_no, node in tree["nodes"].items():
+			if bom_no != self.bom_no:
+				self.assertEqual(node.depth, 1)
+				self.assertTrue(node.expandable)
+
+	def test_two_queries_per_level(self):
+		with self.assertQueryCount(3):
+			load_bom_tree(self.bom_no, depth=1)
@@ -0,0 +1,38 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from erpnext.manufacturing.doctype.bom.bom import get_bom_items_as_dict
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from rongguan_erp.utils.exploded_bom_cache import (
+	clear_exploded_bom_cache,
+	get_exploded_bom,
+	get_exploded_bom_cache_stats,
+)
+
+
+class TestExplodedBomCache(FrappeTestCase):
+	"""测试 BOM 展开缓存"""
+
+	def setUp(self):
+		self.bom = frappe.db.get_value(
+			"BOM", {"docstatus": 1}, ["name", "company", "modified"], as_dict=True
+		)
+		if not self.bom:
+			self.skipTest("没有已提交的 BOM")
+		clear_exploded_bom_cache(self.bom)
+
+	def test_scaled_qty_matches_erpnext(self):
+		expected = get_bom_items_as_dict(self.bom.name, self.bom.company, qty=7, fetch_exploded=1)
+		for item in get_exploded_bom(self.bom, qty=7):
+			self.assertAlmostEqual(item["qty"], flt(expected[item["item_code"]].qty), places=6)
+
+	def test_hits_are_counted(self):
+		get_exploded_bom(self.bom, qty=1)
+		before = get_exploded_bom_cache_stats()
+		get_exploded_bom(self.bom, qty=3)
+		after = get_exploded_bom_cache_stats()
+		self.assertEqual(after["hits"], before["hits"] + 1)
+		self.assertEqual(after["misses"], before["misses"])
@@ -0,0 +1,68 @@
+# Copyright (c) 2025, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.item_attribute_classification import (
+	clear_attribute_classification,
+	classify_items,
+	get_attribute_classification,
+	get_attribute_value_catalog,
+)
+
+
+def _legacy_color_and_size(item_code):
+	"""逐个加载 Item Attribute 的原有判定方式，用于对照"""
+	color = ""
+	size = ""
+	for attr in frappe.get_doc("Item", item_code).attributes:
+		user_tags = frappe.db.get_value("Item Attribute", attr.attribute, "_user_tags") or ""
+		if "颜色" in user_tags and not color:
+			color = (attr.attribute_value or "").strip()
+		elif "尺寸" in user_tags and not size:
+			size = (attr.attribute_value or "").strip()
+	return color, size
+
+
+class TestItemAttributeClassification(FrappeTestCase):
+	"""测试物料属性分类缓存与批量颜色/尺码解析"""
+
+	def test_classify_items_matches_legacy(self):
+		item_codes = frappe.get_all("Item", filters={"variant_of": ["is", "set"]}, pluck="name", limit=20)
+		result = classify_items(item_codes)
+		for item_code in item_codes:
+			self.assertEqual(result[item_code], _legacy_color_and_size(item_code))
+
+	def test_classify_items_is_one_query(self):
+		item_codes = frappe.get_all("Item", filters={"variant_of": ["is", "set"]}, pluck="name", limit=200)
+		get_attribute_classification()  # 预热缓存
+		with self.assertQueryCount(1):
+			classify_items(item_codes)
+
+	def test_cache_is_cleared(self):
+		get_attribute_classification()
+		clear_attribute_classification()
+		self.assertIsNone(frappe.cache().get_value("rg_item_attribute_classification"))
+
+
+class TestAttributeValueCatalog(FrappeTestCase):
+	"""测试带版本号的属性值目录"""
+
+	def test_catalog_is_cached_and_versioned(self):
+		catalog, etag = get_attribute_value_catalog()
+		with self.assertQueryCount(0):
+			cached, cached_etag = get_attribute_value_catalog()
+		self.assertEqual(cached_etag, etag)
+		self.assertEqual(len(cached), len(catalog))
+
+		clear_attribute_classification()
+		self.assertNotEqual(get_attribute_value_catalog()[1], etag)
+
+	def test_customer_filter(self):
+		customer = frappe.db.get_value("Item Attribute Value", {"customer": ["is", "set"]}, "customer")
+		if not customer:
+			self.skipTest("没有绑定客户的属性值")
+		catalog, _ = get_attribute_value_catalog(customer=customer)
+		for row in catalog:
+			self.assertIn(row.customer or "", ("", customer))
@@ -0,0 +1,59 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from rongguan_erp.utils.api.material_requirements import get_material_requirements, net_requirements
+from rongguan_erp.utils.exploded_bom_cache import get_exploded_bom
+
+
+class TestMaterialRequirements(FrappeTestCase):
+	"""测试多 BOM 物料需求汇总"""
+
+	def test_same_bom_lines_are_merged(self):
+		bom = frappe.db.get_value("BOM", {"docstatus": 1}, ["name", "company", "modified"], as_dict=True)
+		if not bom:
+			self.skipTest("没有已提交的 BOM")
+
+		result = get_material_requirements(boms=[[bom.name, 2], {"bom_no": bom.name, "qty": 3}], company=bom.company)
+		self.assertEqual(result["status"], "success")
+
+		required = {}
+		for row in result["data"]["requirements"]:
+			required[row["item_code"]] = required.get(row["item_code"], 0) + row["required_qty"]
+			self.assertGreaterEqual(row["shortage_qty"], 0)
+		for item in get_exploded_bom(bom, qty=5):
+			self.assertAlmostEqual(required[item["item_code"]], item["qty"], places=6)
+
+	def test_shortages_feed_material_request(self):
+		sales_order = frappe.db.get_value("Sales Order", {"docstatus": 1}, "name")
+		if not sales_order:
+			self.skipTest("没有已提交的销售订单")
+		data = get_material_requirements(sales_order=sales_order)["data"]
+		self.assertEqual(
+			len(data["material_request_items"]) + len(data["unassigned_shortages"]), len(data["shortages"])
+		)
+		for item in data["material_request_items"]:
+			self.assertGreater(item["qty"], 0)
+			self.assertTrue(item["warehouse"])
+
+	def test_unassigned_rows_net_against_remaining_stock(self):
+		bin_row = frappe.db.get_value("Bin", {"actual_qty": [">", 0]}, ["item_code", "warehouse", "actual_qty"], as_dict=True)
+		if not bin_row:
+			self.skipTest("没有有库存的物料")
+		company = frappe.db.get_value("Warehouse", bin_row.warehouse, "company")
+
+		alone = net_requirements({(bin_row.item_code, ""): {"required_qty": 1.0}}, company)
+		both = net_requirements({
+			(bin_row.item_code, bin_row.warehouse): {"required_qty": flt(bin_row.actual_qty)},
+			(bin_row.item_code, ""): {"required_qty": 1.0},
+		}, company)
+
+		warehouse_row = both[(bin_row.item_code, bin_row.warehouse)]
+		allocated = min(warehouse_row["required_qty"], max(warehouse_row["available_qty"], 0))
+		self.assertAlmostEqual(
+			both[(bin_row.item_code, "")]["available_qty"],
+			alone[(bin_row.item_code, "")]["available_qty"] - allocated
+		)
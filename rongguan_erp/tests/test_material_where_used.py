@@ -0,0 +1,53 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.material_where_used import (
+	get_where_used,
+	rebuild_material_where_used,
+	refresh_where_used,
+)
+
+
+class TestMaterialWhereUsed(FrappeTestCase):
+	"""测试物料反查索引"""
+
+	def setUp(self):
+		rebuild_material_where_used()
+		self.row = frappe.db.sql("""
+			SELECT wu.material, wu.bom
+			FROM `tabRG Material Where Used` wu
+			JOIN `tabBOM` bom ON bom.name = wu.bom
+			WHERE bom.is_active = 1
+			LIMIT 1
+		""", as_dict=True)
+		self.row = self.row[0] if self.row else None
+		if not self.row:
+			self.skipTest("没有已提交的启用 BOM")
+
+	def test_index_covers_direct_bom_items(self):
+		bom_no = self.row.bom
+		direct = set(frappe.get_all("BOM Item", filters={"parent": bom_no, "parenttype": "BOM"}, pluck="item_code"))
+		indexed = set(frappe.get_all(
+			"RG Material Where Used", filters={"bom": bom_no, "is_direct": 1}, pluck="material"
+		))
+		self.assertEqual(direct, indexed)
+
+	def test_refresh_repairs_drift(self):
+		frappe.db.sql("DELETE FROM `tabRG Material Where Used` WHERE bom = %s", self.row.bom)
+		refresh_where_used([self.row.bom])
+		boms = [row.bom for row in get_where_used(self.row.material)]
+		self.assertIn(self.row.bom, boms)
+
+	def test_flags_follow_bom_without_reindex(self):
+		is_default = frappe.db.get_value("BOM", self.row.bom, "is_default")
+		# 与 ERPNext 切换默认 BOM 一样直接改库，不触发文档事件
+		frappe.db.set_value("BOM", self.row.bom, "is_default", 0 if is_default else 1, update_modified=False)
+		row = next(row for row in get_where_used(self.row.material) if row.bom == self.row.bom)
+		self.assertEqual(row.is_default, 0 if is_default else 1)
+
+	def test_lookup_is_three_queries(self):
+		with self.assertQueryCount(3):
+			get_where_used(self.row.material)
@@ -0,0 +1,48 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.operation_provisioning import (
+	_get_known_operations,
+	_set_known_operations,
+	clear_known_operations,
+	provision_operations,
+)
+
+
+class TestOperationProvisioning(FrappeTestCase):
+	"""测试工序批量准备"""
+
+	def tearDown(self):
+		clear_known_operations()
+
+	def test_missing_operations_created_once(self):
+		names = [f"_Test RG Operation {i}" for i in range(5)]
+		rows = [{"operation": name} for name in names] + [{"operation": names[0]}]
+		clear_known_operations()
+
+		created = provision_operations(rows)
+		self.assertEqual(created, names)
+		self.assertEqual(frappe.db.count("Operation", {"name": ["in", names]}), len(names))
+
+		# 提交前不写缓存：再次准备时按库中已有的工序处理，缓存中仍没有这些工序
+		self.assertEqual(provision_operations(rows), [])
+		self.assertFalse(_get_known_operations() & set(names))
+
+	def test_known_operations_skip_query(self):
+		name = "_Test RG Operation Known"
+		_set_known_operations({name})
+		with self.assertQueryCount(0):
+			self.assertEqual(provision_operations([{"operation": name}]), [])
+
+	def test_rollback_does_not_cache_unsaved_operations(self):
+		name = "_Test RG Operation Rollback"
+		clear_known_operations()
+		frappe.db.savepoint("rg_operation_provisioning")
+		provision_operations([{"operation": name}])
+		frappe.db.rollback(save_point="rg_operation_provisioning")
+
+		self.assertEqual(provision_operations([{"operation": name}]), [name])
+		self.assertTrue(frappe.db.exists("Operation", name))
@@ -0,0 +1,82 @@
+# Copyright (c) 2025, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.pagination import (
+	InvalidCursorError,
+	cached_count,
+	clear_cached_counts,
+	decode_cursor,
+	encode_cursor,
+	keyset_condition,
+	parse_order_by,
+)
+from rongguan_erp.utils.api.items import get_items_with_attributes_with_pagination
+from rongguan_erp.utils.api.work_order import get_work_order_list
+
+
+class TestKeysetPagination(FrappeTestCase):
+	"""测试游标分页辅助函数"""
+
+	def test_cursor_round_trip(self):
+		row = frappe._dict(name="MFG-WO-2025-00001", creation="2025-06-10 10:00:00.000001")
+		cursor = encode_cursor(row, "creation", "desc")
+		self.assertEqual(decode_cursor(cursor, "creation", "desc"), (row.creation, row.name))
+
+	def test_cursor_rejects_other_sort(self):
+		cursor = encode_cursor(frappe._dict(name="A", creation="2025-01-01"), "creation", "desc")
+		self.assertRaises(InvalidCursorError, decode_cursor, cursor, "modified", "desc")
+		self.assertRaises(InvalidCursorError, decode_cursor, "not-a-cursor", "creation", "desc")
+
+	def test_parse_order_by(self):
+		self.assertEqual(parse_order_by("creation desc"), ("creation", "desc"))
+		self.assertEqual(parse_order_by(None, default="modified desc"), ("modified", "desc"))
+		self.assertIsNone(parse_order_by("creation desc, name asc"))
+
+	def test_keyset_condition(self):
+		cursor = encode_cursor(frappe._dict(name="B", modified="2025-01-01"), "modified", "asc")
+		condition, params = keyset_condition("modified", "asc", cursor)
+		self.assertIn(">", condition)
+		self.assertEqual(params, {"cursor_value": "2025-01-01", "cursor_name": "B"})
+
+	def test_cursor_pages_match_offset_pages(self):
+		"""游标翻页与页码翻页返回相同的记录"""
+		first = get_work_order_list(page=1, page_size=3)
+		second = get_work_order_list(page=2, page_size=3)
+		next_cursor = first["data"]["pagination"]["next_cursor"]
+		if not next_cursor:
+			self.skipTest("工单不足两页")
+
+		by_cursor = get_work_order_list(page_size=3, cursor=next_cursor)
+		self.assertEqual(
+			[wo["name"] for wo in by_cursor["data"]["work_orders"]],
+			[wo["name"] for wo in second["data"]["work_orders"]],
+		)
+		self.assertNotIn("total_count", by_cursor["data"]["pagination"])
+
+	def test_item_cursor_pages_match_offset_pages(self):
+		"""物料分页：游标翻页与页码翻页一致，游标模式默认不计算总数"""
+		first = get_items_with_attributes_with_pagination(page_number=1, page_size=5)
+		second = get_items_with_attributes_with_pagination(page_number=2, page_size=5)
+		next_cursor = first["pagination"]["next_cursor"]
+		if not next_cursor:
+			self.skipTest("物料不足两页")
+
+		by_cursor = get_items_with_attributes_with_pagination(page_size=5, cursor=next_cursor)
+		self.assertEqual(
+			[item["name"] for item in by_cursor["data"]],
+			[item["name"] for item in second["data"]],
+		)
+		self.assertNotIn("total_items", by_cursor["pagination"])
+
+	def test_cached_count_is_cleared(self):
+		filters = {"disabled": 0}
+		count = cached_count("Item", filters)
+		with self.assertQueryCount(0):
+			self.assertEqual(cached_count("Item", filters), count)
+
+		clear_cached_counts("Item")
+		with self.assertQueryCount(1):
+			cached_count("Item", filters)
@@ -0,0 +1,69 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from rongguan_erp.utils.pending_request_qty import (
+	_compute_pending_request_qty,
+	get_pending_request_qty,
+	rebuild_pending_request_qty,
+	refresh_pending_request_qty,
+	update_pending_request_qty,
+)
+
+
+def _live_pending_by_item(item_codes):
+	pending = {}
+	for item_code, _warehouse, qty in _compute_pending_request_qty(item_codes):
+		pending[item_code] = pending.get(item_code, 0) + flt(qty)
+	return pending
+
+
+class TestPendingRequestQty(FrappeTestCase):
+	"""测试待处理请购数量汇总表"""
+
+	def test_rebuild_matches_live_aggregate(self):
+		rebuild_pending_request_qty()
+		item_codes = frappe.get_all("RG Pending Request Qty", pluck="item_code", limit=50)
+		live = _live_pending_by_item(item_codes)
+		maintained = get_pending_request_qty(item_codes)
+		for item_code in item_codes:
+			self.assertAlmostEqual(maintained.get(item_code, 0), live.get(item_code, 0))
+
+	def test_refresh_repairs_drift(self):
+		rebuild_pending_request_qty()
+		item_code = frappe.db.get_value("RG Pending Request Qty", {}, "item_code")
+		if not item_code:
+			self.skipTest("没有待处理的请购")
+		frappe.db.sql("UPDATE `tabRG Pending Request Qty` SET pending_qty = -1 WHERE item_code = %s", item_code)
+		refresh_pending_request_qty([item_code])
+		self.assertAlmostEqual(
+			get_pending_request_qty([item_code]).get(item_code, 0),
+			_live_pending_by_item([item_code]).get(item_code, 0)
+		)
+
+	def test_stock_entry_and_work_order_refresh_material_request_items(self):
+		rebuild_pending_request_qty()
+		item_code = frappe.db.get_value("RG Pending Request Qty", {}, "item_code")
+		if not item_code:
+			self.skipTest("没有待处理的请购")
+		live = _live_pending_by_item([item_code]).get(item_code, 0)
+
+		for doc in (
+			frappe._dict(doctype="Stock Entry", items=[frappe._dict(item_code=item_code, material_request="MAT-MR-TEST")]),
+			frappe._dict(doctype="Work Order", production_item=item_code, material_request="MAT-MR-TEST"),
+		):
+			frappe.db.sql("UPDATE `tabRG Pending Request Qty` SET pending_qty = -1 WHERE item_code = %s", item_code)
+			update_pending_request_qty(doc, "on_submit")
+			self.assertAlmostEqual(get_pending_request_qty([item_code]).get(item_code, 0), live)
+
+		# 不关联请购的工单不刷新
+		with self.assertQueryCount(0):
+			update_pending_request_qty(frappe._dict(doctype="Work Order", production_item=item_code), "on_submit")
+
+	def test_read_is_one_query(self):
+		item_codes = frappe.get_all("Item", pluck="name", limit=100)
+		with self.assertQueryCount(1):
+			get_pending_request_qty(item_codes)
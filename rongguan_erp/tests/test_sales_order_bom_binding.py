@@ -0,0 +1,26 @@
+# Copyright (c) 2026, Rongguan ERP and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import frappe
+from erpnext.stock.get_item_details import get_default_bom
+from frappe.tests.utils import FrappeTestCase
+
+from rongguan_erp.utils.api.sales_order_bom_binding import bind_default_boms, resolve_item_boms
+
+
+class TestSalesOrderBomBinding(FrappeTestCase):
+	"""测试销售订单明细 BOM 批量绑定"""
+
+	def test_resolve_matches_get_default_bom(self):
+		item_codes = frappe.get_all("Sales Order Item", pluck="item_code", distinct=True, limit=50)
+		resolved = resolve_item_boms(item_codes)
+		for item_code in item_codes:
+			self.assertEqual(resolved[item_code]["default_bom"], get_default_bom(item_code))
+
+	def test_bind_writes_only_changed_rows(self):
+		sales_orders = frappe.get_all("Sales Order", pluck="name", limit=5)
+		bind_default_boms(sales_orders)
+		results = bind_default_boms(sales_orders)
+		for result in results.values():
+			self.assertEqual(result["updated_items"], [])
+			self.assertEqual(result["before_update"], result["after_update"])
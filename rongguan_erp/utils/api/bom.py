@@ -1,7 +1,13 @@
+import json
+
 import frappe
 from frappe import _
 from frappe.utils import flt, cint, now_datetime
-import functools
+
+from rongguan_erp.utils.bom_tree import load_bom_tree
+from rongguan_erp.utils.exploded_bom_cache import get_exploded_bom
+from rongguan_erp.utils.item_attribute_classification import classify_items
+from rongguan_erp.utils.material_where_used import get_where_used
 
 
 @frappe.whitelist()
@@ -64,84 +70,51 @@ def get_exploded_bom_items(**args):
                 "message": "数量必须大于0"
             }
         
-        # 检查BOM是否存在
-        if not frappe.db.exists("BOM", bom_no):
+        # 获取BOM基本信息
+        bom = frappe.db.get_value(
+            "BOM", bom_no,
+            ["name", "docstatus", "company", "item", "item_name", "quantity", "currency", "modified"],
+            as_dict=True
+        )
+        if not bom:
             return {
                 "status": "error", 
                 "message": f"BOM {bom_no} 不存在"
             }
-        
-        # 获取BOM基本信息
-        bom_doc = frappe.get_doc("BOM", bom_no)
-        if bom_doc.docstatus != 1:
+        if bom.docstatus != 1:
             return {
                 "status": "error", 
                 "message": f"BOM {bom_no} 尚未提交，无法使用"
             }
         
-        # 从BOM文档中获取公司信息（BOM必须有公司字段）
-        company = bom_doc.company
+        # BOM必须有公司字段
+        company = bom.company
         if not company:
             return {
                 "status": "error", 
                 "message": f"BOM {bom_no} 没有设置公司信息"
             }
         
-        # 获取BOM对应的物料信息
-        item_code = bom_doc.item
-        item_doc = frappe.get_doc("Item", item_code)
-        
-        # 调用ERPNext的BOM展开方法获取物料明细
-        from erpnext.manufacturing.doctype.bom.bom import get_bom_items_as_dict
-        
-        exploded_items_dict = get_bom_items_as_dict(
-            bom=bom_no,
-            company=company, 
-            qty=qty,
-            fetch_exploded=1,  # 获取展开的BOM
-            include_non_stock_items=include_non_stock_items
-        )
-        
-        # 将字典转换为列表并排序
-        exploded_items = list(exploded_items_dict.values())
-        exploded_items.sort(key=functools.cmp_to_key(lambda a, b: (a.item_code > b.item_code) - (a.item_code < b.item_code)))
+        # 展开结果按单位数量缓存，按 qty 缩放（已按物料编码排序）
+        exploded_items = get_exploded_bom(bom, qty, include_non_stock_items)
         
         # 计算总金额
         total_amount = sum(flt(item.get("amount", 0)) for item in exploded_items)
         
         # 格式化返回数据
         result_data = {
-            "item_code": item_code,
-            "item_name": item_doc.item_name,
+            "item_code": bom.item,
+            "item_name": bom.item_name,
             "bom_no": bom_no,
-            "bom_quantity": bom_doc.quantity,
+            "bom_quantity": bom.quantity,
             "requested_qty": qty,
             "company": company,
-            "currency": bom_doc.currency,
+            "currency": bom.currency,
             "total_items": len(exploded_items),
             "total_amount": total_amount,
-            "exploded_items": []
+            "exploded_items": exploded_items
         }
         
-        # 处理每个展开的物料项
-        for item in exploded_items:
-            item_info = {
-                "item_code": item.get("item_code"),
-                "item_name": item.get("item_name"),
-                "qty": flt(item.get("qty", 0)),
-                "stock_uom": item.get("stock_uom"),
-                "rate": flt(item.get("rate", 0)),
-                "amount": flt(item.get("amount", 0)),
-                "source_warehouse": item.get("source_warehouse"),
-                "operation": item.get("operation"),
-                "description": item.get("description"),
-                "item_group": item.get("item_group"),
-                "allow_alternative_item": item.get("allow_alternative_item"),
-                "include_item_in_manufacturing": item.get("include_item_in_manufacturing"),
-                "sourced_by_supplier": item.get("sourced_by_supplier")
-            }
-            result_data["exploded_items"].append(item_info)
-        
         return {
             "status": "success",
             "message": f"成功获取BOM {bom_no} 的物料明细，共 {len(exploded_items)} 项物料",
@@ -168,6 +141,8 @@ def get_bom_structure_summary(**args):
         **args: 关键字参数
             item_code (str): 成品物料编码
             qty (float): 数量
+            include_tree (bool): 是否返回BOM树（扁平邻接表），默认否
+            depth (int): BOM树展开深度（可选，默认展开全部层级）
     
     Note:
         公司信息会自动从BOM文档中获取，无需手动提供
@@ -179,46 +154,51 @@ def get_bom_structure_summary(**args):
         # 从args中获取参数
         item_code = args.get('item_code')
         qty = args.get('qty', 1)
+        include_tree = cint(args.get('include_tree'))
         
         if not item_code:
             return {"status": "error", "message": "物料编码不能为空"}
         
-        # 检查物料是否存在
-        if not frappe.db.exists("Item", item_code):
+        # 获取物料和默认BOM
+        item = frappe.db.get_value("Item", item_code, ["item_name", "default_bom"], as_dict=True)
+        if not item:
             return {"status": "error", "message": f"物料 {item_code} 不存在"}
         
-        # 获取物料和BOM信息
-        item_doc = frappe.get_doc("Item", item_code)
-        default_bom = item_doc.default_bom
-        
+        default_bom = item.default_bom
         if not default_bom:
             return {"status": "error", "message": f"物料 {item_code} 没有设置默认BOM"}
         
-        bom_doc = frappe.get_doc("BOM", default_bom)
-        
-        # 从BOM获取公司信息
-        company = bom_doc.company
+        # 只取根节点时深度为 0，不加载子件
+        tree = load_bom_tree(default_bom, args.get('depth') if include_tree else 0)
+        bom = tree["nodes"].get(default_bom)
+        if not bom:
+            return {"status": "error", "message": f"BOM {default_bom} 不存在"}
         
         # 获取BOM项目统计
-        bom_items_count = frappe.db.count("BOM Item", {"parent": default_bom})
+        bom_items_count = len(tree["children"][default_bom]) if default_bom in tree["children"] \
+            else frappe.db.count("BOM Item", {"parent": default_bom})
         exploded_items_count = frappe.db.count("BOM Explosion Item", {"parent": default_bom})
         
+        data = {
+            "item_code": item_code,
+            "item_name": item.item_name,
+            "bom_no": default_bom,
+            "bom_quantity": bom.quantity,
+            "requested_qty": flt(qty),
+            "company": bom.company,
+            "currency": bom.currency,
+            "bom_items_count": bom_items_count,
+            "exploded_items_count": exploded_items_count,
+            "total_cost": bom.total_cost,
+            "raw_material_cost": bom.raw_material_cost,
+            "operating_cost": bom.operating_cost
+        }
+        if include_tree:
+            data["tree"] = tree
+        
         return {
             "status": "success",
-            "data": {
-                "item_code": item_code,
-                "item_name": item_doc.item_name,
-                "bom_no": default_bom,
-                "bom_quantity": bom_doc.quantity,
-                "requested_qty": flt(qty),
-                "company": company,
-                "currency": bom_doc.currency,
-                "bom_items_count": bom_items_count,
-                "exploded_items_count": exploded_items_count,
-                "total_cost": bom_doc.total_cost,
-                "raw_material_cost": bom_doc.raw_material_cost,
-                "operating_cost": bom_doc.operating_cost
-            }
+            "data": data
         }
         
     except Exception as e:
@@ -232,6 +212,75 @@ def get_bom_structure_summary(**args):
         }
 
 
+@frappe.whitelist()
+def get_bom_tree(bom_no, depth=None):
+    """
+    获取BOM树的扁平邻接表，用于前端逐层渲染
+    
+    Args:
+        bom_no (str): 根BOM编号（也可以是上次结果中 expandable 的节点，用于继续展开）
+        depth (int): 展开深度（可选，默认展开全部层级）
+    
+    Returns:
+        dict: {"status": "success", "data": {"root", "nodes", "children", "truncated", "cyclic_boms"}}
+    """
+    try:
+        if not bom_no:
+            return {"status": "error", "message": "BOM编号(bom_no)不能为空"}
+        
+        tree = load_bom_tree(bom_no, depth)
+        if bom_no not in tree["nodes"]:
+            return {"status": "error", "message": f"BOM {bom_no} 不存在"}
+        
+        return {"status": "success", "data": tree}
+        
+    except Exception as e:
+        frappe.log_error(
+            message=f"获取BOM树时发生错误: {str(e)}\nBOM: {bom_no}",
+            title="BOM Tree Error"
+        )
+        return {
+            "status": "error",
+            "message": f"获取BOM树失败: {str(e)}"
+        }
+
+
+@frappe.whitelist()
+def get_material_where_used(material, include_inactive=0):
+    """
+    物料反查：查询物料被哪些BOM、成品以及未结束的销售订单和工单使用
+
+    Args:
+        material (str): 物料编码（原材料或半成品）
+        include_inactive (int): 是否包含已停用的BOM，默认 0
+
+    Returns:
+        dict: {"status": "success", "data": {"material", "boms": [{bom, finished_item, qty_per_unit,
+               is_direct, is_active, is_default, sales_orders, work_orders}]}}
+    """
+    try:
+        if not material:
+            return {"status": "error", "message": "物料编码(material)不能为空"}
+
+        return {
+            "status": "success",
+            "data": {
+                "material": material,
+                "boms": get_where_used(material, cint(include_inactive))
+            }
+        }
+
+    except Exception as e:
+        frappe.log_error(
+            message=f"物料反查时发生错误: {str(e)}\n物料: {material}",
+            title="Material Where Used Error"
+        )
+        return {
+            "status": "error",
+            "message": f"物料反查失败: {str(e)}"
+        }
+
+
 @frappe.whitelist()
 def create_new_bom_version(bom_name, **kwargs):
     """
@@ -456,16 +505,75 @@ bench --site site1.local execute rongguan_erp.utils.api.bom.create_new_bom_versi
         }
 
 
+def _collect_material_usage(bom_items, material_item_codes):
+    """
+    一条查询取出所有 BOM 中指定物料的 BOM Item 行，按物料汇总用量
+    
+    Args:
+        bom_items: 销售订单明细（含 updated_bom、item_code、color）
+        material_item_codes: 物料编码列表
+    
+    Returns:
+        dict: {物料编码: {material_item_code, material_item_name, bom_count, total_qty, avg_qty, bom_details}}
+    """
+    bom_nos = list(dict.fromkeys(item.updated_bom for item in bom_items))
+    material_rows = {}
+    for row in frappe.db.sql("""
+        SELECT parent, item_code, item_name, qty
+        FROM `tabBOM Item`
+        WHERE parent IN %(bom_nos)s
+            AND parenttype = 'BOM'
+            AND item_code IN %(material_item_codes)s
+        ORDER BY parent, idx
+    """, {"bom_nos": tuple(bom_nos), "material_item_codes": tuple(material_item_codes)}, as_dict=True):
+        # 与原有逐个查询的 LIMIT 1 一致：同一 BOM 中同一物料只取第一行
+        material_rows.setdefault((row.parent, row.item_code), row)
+    
+    usage = {}
+    for material_item_code in material_item_codes:
+        bom_details = []
+        total_qty = 0
+        material_name = ""
+        for item in bom_items:
+            material = material_rows.get((item.updated_bom, material_item_code))
+            if not material:
+                continue
+            qty = flt(material.qty)
+            total_qty += qty
+            if not material_name:
+                material_name = material.item_name
+            bom_details.append({
+                "bom_no": item.updated_bom,
+                "product_item_code": item.item_code,
+                "product_color": item.color or "",
+                "material_qty": qty
+            })
+        
+        bom_count = len(bom_details)
+        usage[material_item_code] = {
+            "material_item_code": material_item_code,
+            "material_item_name": material_name,
+            "bom_count": bom_count,
+            "total_qty": total_qty,
+            "avg_qty": total_qty / bom_count if bom_count > 0 else 0,
+            "bom_details": bom_details
+        }
+    return usage
+
+
 @frappe.whitelist()
 def get_bom_info_by_so(**args):
     """
-    根据销售订单号、成品颜色、物料编码，查询该物料在符合条件的BOM中的平均用量
+    根据销售订单号、成品颜色、物料编码，查询物料在符合条件的BOM中的平均用量
+    （所有BOM的物料行一次查询取回，可一次查询多个物料）
     
     Args:
         **args: 关键字参数
             sales_order (str): 销售订单号（必填）
             product_color (str): 成品颜色（可选，如：灰色）
-            material_item_code (str): 物料编码（必填）
+            material_item_code (str): 物料编码（与 material_item_codes 二选一）
+            material_item_codes (list): 多个物料编码（列表、JSON 数组或逗号分隔），
+                传入时 data 为 {"materials": {物料编码: 单物料结果}, "missing_materials": [...]}
     
     Returns:
         dict: {
@@ -510,6 +618,16 @@ def get_bom_info_by_so(**args):
         sales_order = args.get('sales_order')
         product_color = args.get('product_color')
         material_item_code = args.get('material_item_code')
+        material_item_codes = args.get('material_item_codes')
+        if isinstance(material_item_codes, str):
+            material_item_codes = json.loads(material_item_codes) if material_item_codes.startswith('[') \
+                else material_item_codes.split(',')
+        material_item_codes = list(dict.fromkeys(
+            code.strip() for code in (material_item_codes or []) if code and code.strip()
+        ))
+        multiple = bool(material_item_codes)
+        if not multiple and material_item_code:
+            material_item_codes = [material_item_code]
         
         # 2. 参数验证
         if not sales_order:
@@ -518,7 +636,7 @@ def get_bom_info_by_so(**args):
                 "message": "销售订单号(sales_order)不能为空"
             }
         
-        if not material_item_code:
+        if not material_item_codes:
             return {
                 "status": "error",
                 "message": "物料编码(material_item_code)不能为空"
@@ -532,42 +650,24 @@ def get_bom_info_by_so(**args):
             }
         
         # 4. 查询销售订单明细的更新后BOM编号、物料号和颜色
-        # 通过Item Attribute的_user_tags字段判断哪个属性是颜色属性
-        sql_params = {"sales_order": sales_order}
-        color_filter = ""
-        
-        if product_color:
-            color_filter = """
-                AND (
-                    SELECT iva.attribute_value
-                    FROM `tabItem Variant Attribute` iva
-                    INNER JOIN `tabItem Attribute` ia ON ia.name = iva.attribute
-                    WHERE iva.parent = soi.item_code
-                        AND ia._user_tags LIKE '%%颜色%%'
-                    LIMIT 1
-                ) = %(product_color)s
-            """
-            sql_params["product_color"] = product_color
-        
-        bom_items = frappe.db.sql(f"""
+        # 颜色由属性分类服务批量解析（Item Attribute 的 _user_tags 含「颜色」）
+        bom_items = frappe.db.sql("""
             SELECT 
                 soi.custom_updated_bom_no as updated_bom,
-                soi.item_code,
-                (
-                    SELECT iva.attribute_value
-                    FROM `tabItem Variant Attribute` iva
-                    INNER JOIN `tabItem Attribute` ia ON ia.name = iva.attribute
-                    WHERE iva.parent = soi.item_code
-                        AND ia._user_tags LIKE '%%颜色%%'
-                    LIMIT 1
-                ) as color
+                soi.item_code
             FROM `tabSales Order Item` soi
             WHERE soi.parent = %(sales_order)s
                 AND soi.custom_updated_bom_no IS NOT NULL
                 AND soi.custom_updated_bom_no != ''
-                {color_filter}
             ORDER BY soi.idx
-        """, sql_params, as_dict=True)
+        """, {"sales_order": sales_order}, as_dict=True)
+        
+        item_attributes = classify_items([item.item_code for item in bom_items])
+        for item in bom_items:
+            item.color = item_attributes.get(item.item_code, ("", ""))[0]
+        
+        if product_color:
+            bom_items = [item for item in bom_items if item.color == product_color]
         
         if not bom_items:
             return {
@@ -575,65 +675,37 @@ def get_bom_info_by_so(**args):
                 "message": f"销售订单 {sales_order} 没有符合条件的BOM"
             }
         
-        # 5. 在这些BOM中查找指定的物料，并收集用量
-        bom_details = []
-        total_qty = 0
-        material_name = ""
+        # 5. 一次查询所有BOM中的指定物料，按物料收集用量
+        usage = _collect_material_usage(bom_items, material_item_codes)
         
-        for item in bom_items:
-            # 查询该BOM中指定物料的用量
-            material_info = frappe.db.sql("""
-                SELECT 
-                    item_code,
-                    item_name,
-                    qty
-                FROM `tabBOM Item`
-                WHERE parent = %(bom_no)s
-                    AND item_code = %(material_item_code)s
-                LIMIT 1
-            """, {
-                "bom_no": item.updated_bom,
-                "material_item_code": material_item_code
-            }, as_dict=True)
+        if not multiple:
+            material = usage[material_item_code]
+            if not material["bom_details"]:
+                return {
+                    "status": "warning",
+                    "message": f"在符合条件的BOM中未找到物料 {material_item_code}"
+                }
             
-            if material_info:
-                material = material_info[0]
-                qty = flt(material.qty)
-                total_qty += qty
-                
-                if not material_name:
-                    material_name = material.item_name
-                
-                bom_details.append({
-                    "bom_no": item.updated_bom,
-                    "product_item_code": item.item_code,
-                    "product_color": item.color or "",
-                    "material_qty": qty
-                })
-        
-        if not bom_details:
+            # 6. 返回结果
             return {
-                "status": "warning",
-                "message": f"在符合条件的BOM中未找到物料 {material_item_code}"
+                "status": "success",
+                "message": f"成功查询到 {material['bom_count']} 个BOM中包含物料 {material_item_code}",
+                "data": {
+                    "sales_order": sales_order,
+                    "product_color": product_color or "",
+                    **material
+                }
             }
         
-        # 6. 计算平均值
-        bom_count = len(bom_details)
-        avg_qty = total_qty / bom_count if bom_count > 0 else 0
-        
-        # 7. 返回结果
+        found = [code for code in material_item_codes if usage[code]["bom_details"]]
         return {
-            "status": "success",
-            "message": f"成功查询到 {bom_count} 个BOM中包含物料 {material_item_code}",
+            "status": "success" if found else "warning",
+            "message": f"{len(found)}/{len(material_item_codes)} 个物料在符合条件的BOM中找到用量",
             "data": {
                 "sales_order": sales_order,
                 "product_color": product_color or "",
-                "material_item_code": material_item_code,
-                "material_item_name": material_name,
-                "bom_count": bom_count,
-                "total_qty": total_qty,
-                "avg_qty": avg_qty,
-                "bom_details": bom_details
+                "materials": usage,
+                "missing_materials": [code for code in material_item_codes if code not in found]
             }
         }
         
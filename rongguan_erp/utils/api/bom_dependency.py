@@ -0,0 +1,156 @@
+"""
+批量保存 BOM 的依赖图分析
+
+把本批 BOM 的 物料 → 子物料 边，与数据库中已有默认 BOM 的边合并成一张图：
+- 已有边用一条递归 CTE 查询读取（从本批引用的子物料出发，沿默认 BOM 向下展开），
+  本批中的物料以本批数据为准，不再读取它们已有的默认 BOM
+- 用 Kahn 算法做一次线性时间的环检测，同时得到子件在前、父件在后的拓扑顺序
+
+另提供按集合查询的存在性校验，在插入任何 BOM 之前一次查出缺失的物料
+（工序由 rongguan_erp.utils.operation_provisioning 批量准备）。
+"""
+from collections import deque
+
+import frappe
+
+
+def _distinct(values):
+    """去重并去掉空值，保持原有顺序"""
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def batch_bom_edges(boms_list):
+    """本批 BOM 的边：{物料: [子物料]}（忽略自引用）"""
+    graph = {}
+    for bom_data in boms_list:
+        if not isinstance(bom_data, dict) or not bom_data.get('item'):
+            continue
+        item_code = bom_data['item']
+        children = graph.setdefault(item_code, [])
+        for row in bom_data.get('items') or []:
+            child = row.get('item_code') if isinstance(row, dict) else None
+            if child and child != item_code and child not in children:
+                children.append(child)
+    return graph
+
+
+def load_default_bom_edges(start_items, exclude_items):
+    """
+    一条递归查询读取从 start_items 出发可达的已有默认 BOM 边
+
+    Args:
+        start_items: 起点物料（本批 BOM 引用的子物料）
+        exclude_items: 不读取其已有 BOM 的物料（本批正在保存的物料）
+
+    Returns:
+        list: [(父物料, 子物料)]
+    """
+    start_items = [item for item in _distinct(start_items) if item not in exclude_items]
+    if not start_items:
+        return []
+
+    # UNION 去重保证已有数据中存在环时递归也会结束
+    return frappe.db.sql("""
+        WITH RECURSIVE bom_edges (parent_item, child_item) AS (
+            SELECT bom.item, bi.item_code
+            FROM `tabBOM` bom
+            JOIN `tabBOM Item` bi ON bi.parent = bom.name AND bi.parenttype = 'BOM'
+            WHERE bom.item IN %(start_items)s
+                AND bom.is_default = 1
+                AND bom.docstatus = 1
+            UNION
+            SELECT bom.item, bi.item_code
+            FROM bom_edges e
+            JOIN `tabBOM` bom ON bom.item = e.child_item AND bom.is_default = 1 AND bom.docstatus = 1
+            JOIN `tabBOM Item` bi ON bi.parent = bom.name AND bi.parenttype = 'BOM'
+            WHERE bom.item NOT IN %(exclude_items)s
+        )
+        SELECT parent_item, child_item FROM bom_edges
+    """, {
+        'start_items': tuple(start_items),
+        'exclude_items': tuple(exclude_items) or ('',)
+    })
+
+
+def topological_order(graph):
+    """
+    Kahn 算法：返回 (子件在前的拓扑顺序, 处于环中或依赖环的物料列表)
+
+    Args:
+        graph: {物料: [子物料]}
+    """
+    pending_children = {}
+    parents = {}
+    for item_code, children in graph.items():
+        pending_children.setdefault(item_code, 0)
+        for child in children:
+            if child == item_code:
+                continue
+            pending_children[item_code] += 1
+            pending_children.setdefault(child, 0)
+            parents.setdefault(child, []).append(item_code)
+
+    queue = deque(item for item, count in pending_children.items() if count == 0)
+    order = []
+    while queue:
+        item_code = queue.popleft()
+        order.append(item_code)
+        for parent in parents.get(item_code, []):
+            pending_children[parent] -= 1
+            if pending_children[parent] == 0:
+                queue.append(parent)
+
+    ordered = set(order)
+    return order, [item for item in pending_children if item not in ordered]
+
+
+def analyze_bom_batch(boms_list):
+    """
+    合并本批与已有默认 BOM 的依赖图，做环检测并给出保存顺序
+
+    Returns:
+        dict: {
+            'cyclic_items': 处于环中（或依赖环）的本批物料，为空表示无环,
+            'save_order': 本批 BOM 的下标列表，子件 BOM 在父件之前，同层保持原顺序
+        }
+    """
+    graph = batch_bom_edges(boms_list)
+    batch_items = set(graph)
+    for parent, child in load_default_bom_edges(
+        [child for children in graph.values() for child in children], batch_items
+    ):
+        graph.setdefault(parent, [])
+        if child not in graph[parent]:
+            graph[parent].append(child)
+
+    order, cyclic = topological_order(graph)
+    rank = {item_code: position for position, item_code in enumerate(order)}
+    indexes = sorted(
+        range(len(boms_list)),
+        key=lambda i: rank.get(boms_list[i].get('item') if isinstance(boms_list[i], dict) else None, -1)
+    )
+
+    return {
+        'cyclic_items': [item for item in cyclic if item in batch_items],
+        'save_order': indexes,
+    }
+
+
+def find_missing_items(boms_list):
+    """
+    一条集合查询找出本批引用但不存在的物料（BOM 物料与子物料）
+
+    Returns:
+        set: 不存在的物料编码
+    """
+    item_codes = _distinct(
+        [bom_data.get('item') for bom_data in boms_list if isinstance(bom_data, dict)]
+        + [
+            row.get('item_code')
+            for bom_data in boms_list if isinstance(bom_data, dict)
+            for row in bom_data.get('items') or [] if isinstance(row, dict)
+        ]
+    )
+    if not item_codes:
+        return set()
+    return set(item_codes) - set(frappe.get_all('Item', filters={'name': ['in', item_codes]}, pluck='name'))
@@ -1,17 +1,34 @@
 import frappe
 import json
 from frappe import _
-from frappe.utils import now_datetime, getdate
+from frappe.utils import now_datetime, getdate, cint
 from typing import Dict, List, Optional, Any
+from rongguan_erp.utils.pagination import (
+    InvalidCursorError,
+    cached_count,
+    keyset_get_all,
+    next_cursor_for,
+    parse_order_by
+)
 
 
+# 默认过滤条件
+DEFAULT_STOCK_ENTRY_FILTERS = [
+    ['stock_entry_type', 'in', [
+        'Material Receipt', 'Manufacture', 'Repack', 
+        'Disassemble', 'Send to Subcontractor'
+    ]]
+]
+
 @frappe.whitelist()
 def get_stock_entries_with_items(
     page: int = 1,
     page_length: int = 10,
     filters: Optional[List] = None,
     fields: Optional[List] = None,
-    order_by: str = "creation desc"
+    order_by: str = "creation desc",
+    cursor: Optional[str] = None,
+    with_count: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     分页查询Stock Entry及其子表items
@@ -22,6 +39,9 @@ def get_stock_entries_with_items(
         filters: 过滤条件
         fields: 查询字段
         order_by: 排序方式
+        cursor: 游标分页，传入上一次返回的 pagination.next_cursor 获取下一页（此时忽略 page）
+        with_count: 是否计算总数；页码模式默认计算（精确计数），游标模式默认不计算，
+            需要总数时可单独调用 get_stock_entries_count
     
     Returns:
         包含分页信息和数据的字典
@@ -46,29 +66,56 @@ def get_stock_entries_with_items(
         
         # 默认过滤条件
         if not filters:
-            filters = [
-                ['stock_entry_type', 'in', [
-                    'Material Receipt', 'Manufacture', 'Repack', 
-                    'Disassemble', 'Send to Subcontractor'
-                ]]
-            ]
+            filters = DEFAULT_STOCK_ENTRY_FILTERS
         
-        # 计算偏移量
-        start = (page - 1) * page_length
+        page = cint(page) or 1
+        page_length = cint(page_length) or 10
+        use_cursor = bool(cursor)
+        with_count = cint(with_count) if with_count not in (None, '') else not use_cursor
         
-        # 查询主表数据
-        stock_entries = frappe.get_list(
-            'Stock Entry',
-            fields=fields,
-            filters=filters,
-            order_by=order_by,
-            limit_start=start,
-            limit_page_length=page_length,
-            ignore_permissions=True
-        )
+        # 排序字段和 name 用于生成游标
+        sort = parse_order_by(order_by)
+        query_fields = list(fields)
+        if sort:
+            for required in (sort[0], 'name'):
+                if required not in query_fields:
+                    query_fields.append(required)
         
-        # 获取总数
-        total_count = frappe.db.count('Stock Entry', filters=filters)
+        if use_cursor:
+            # 游标分页：按 (排序字段, name) 定位，深翻页不再线性变慢
+            page_result = keyset_get_all(
+                'Stock Entry',
+                filters=filters,
+                fields=query_fields,
+                order_by=order_by,
+                page_size=page_length,
+                cursor=cursor,
+                getter=frappe.get_list,
+                ignore_permissions=True
+            )
+            stock_entries = page_result['rows']
+            has_next = page_result['has_next']
+            next_cursor = page_result['next_cursor']
+        else:
+            # 计算偏移量
+            start = (page - 1) * page_length
+            
+            # 查询主表数据（多取一条用于判断是否有下一页）
+            stock_entries = frappe.get_list(
+                'Stock Entry',
+                fields=query_fields,
+                filters=filters,
+                order_by=order_by,
+                limit_start=start,
+                limit_page_length=page_length + 1,
+                ignore_permissions=True
+            )
+            has_next = len(stock_entries) > page_length
+            stock_entries = stock_entries[:page_length]
+            next_cursor = next_cursor_for(stock_entries, order_by, has_next)
+        
+        # 获取总数（可选，精确计数；短期缓存只用于 get_stock_entries_count）
+        total_count = frappe.db.count('Stock Entry', filters=filters) if with_count else None
         
         # 查询每个Stock Entry的items
         for entry in stock_entries:
@@ -113,24 +160,33 @@ def get_stock_entries_with_items(
             entry['custom_sales_order'] = sales_order_value
 
         # 计算分页信息
-        total_pages = (total_count + page_length - 1) // page_length
-        has_prev = page > 1
-        has_next = page < total_pages
-        
-        return {
-            'message': stock_entries,
-            'pagination': {
+        pagination = {
+            'page_length': page_length,
+            'has_next': has_next,
+            'next_cursor': next_cursor
+        }
+        if not use_cursor:
+            has_prev = page > 1
+            pagination.update({
                 'current_page': page,
-                'page_length': page_length,
-                'total_count': total_count,
-                'total_pages': total_pages,
                 'has_prev': has_prev,
-                'has_next': has_next,
                 'prev_page': page - 1 if has_prev else None,
                 'next_page': page + 1 if has_next else None
-            }
+            })
+        if total_count is not None:
+            pagination['total_count'] = total_count
+            pagination['total_pages'] = (total_count + page_length - 1) // page_length
+        
+        return {
+            'message': stock_entries,
+            'pagination': pagination
         }
         
+    except InvalidCursorError as e:
+        return {
+            'error': str(e),
+            'message': _('查询Stock Entry失败')
+        }
     except Exception as e:
         return {
             'error': str(e),
@@ -138,6 +194,37 @@ def get_stock_entries_with_items(
         }
 
 
+@frappe.whitelist()
+def get_stock_entries_count(filters: Optional[List] = None) -> Dict[str, Any]:
+    """
+    获取Stock Entry总数（get_stock_entries_with_items 的伴随调用，结果短期缓存）
+    
+    Args:
+        filters: 过滤条件，与 get_stock_entries_with_items 相同（为空时使用相同的默认过滤条件）
+    
+    Returns:
+        包含 total_count 的字典
+    """
+    try:
+        if isinstance(filters, str):
+            filters = json.loads(filters)
+        
+        if not filters:
+            filters = DEFAULT_STOCK_ENTRY_FILTERS
+        
+        return {
+            'message': {
+                'total_count': cached_count('Stock Entry', filters)
+            }
+        }
+        
+    except Exception as e:
+        return {
+            'error': str(e),
+            'message': _('查询Stock Entry总数失败')
+        }
+
+
 @frappe.whitelist()
 def get_stock_entry_detail(stock_entry_name: str) -> Dict[str, Any]:
     """
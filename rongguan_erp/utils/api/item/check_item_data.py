@@ -5,6 +5,8 @@
 import frappe
 from frappe import _
 
+from rongguan_erp.utils.item_attribute_classification import get_attribute_tags, get_attribute_type
+
 
 @frappe.whitelist(allow_guest=False)
 def check_item_by_sku(sku_code):
@@ -31,6 +33,18 @@ def check_item_by_sku(sku_code):
         "items": []
     }
     
+    # 一次性获取所有物料的属性
+    attributes_by_item = {}
+    if items:
+        for attr in frappe.db.sql("""
+            SELECT iva.parent, iva.attribute, iva.attribute_value
+            FROM `tabItem Variant Attribute` iva
+            WHERE iva.parent IN %(items)s
+            ORDER BY iva.parent, iva.idx
+        """, {"items": tuple(item.name for item in items)}, as_dict=True):
+            attr._user_tags = get_attribute_tags(attr.attribute)
+            attributes_by_item.setdefault(attr.pop("parent"), []).append(attr)
+    
     for item in items:
         item_info = {
             "item_code": item.item_code,
@@ -42,17 +56,12 @@ def check_item_by_sku(sku_code):
         }
         
         # 获取所有属性
-        attributes = frappe.db.sql("""
-            SELECT iva.attribute, iva.attribute_value, ia._user_tags
-            FROM `tabItem Variant Attribute` iva
-            INNER JOIN `tabItem Attribute` ia ON ia.name = iva.attribute
-            WHERE iva.parent = %s
-        """, (item.name,), as_dict=True)
+        attributes = attributes_by_item.get(item.name, [])
         
         item_info["attributes"] = attributes
         
         # 单独提取颜色属性
-        color_attrs = [a for a in attributes if a._user_tags and "颜色" in a._user_tags]
+        color_attrs = [a for a in attributes if get_attribute_type(a.attribute) == "color"]
         item_info["color_attributes"] = color_attrs
         
         result["items"].append(item_info)
@@ -2,21 +2,119 @@
 # Whitelisted for API access
 import frappe
 from frappe import _
+from frappe.utils import cint, flt, nowdate
+import hashlib
 import json
 from erpnext.controllers.item_variant import create_variant
+from rongguan_erp.utils.api.bom_dependency import analyze_bom_batch, find_missing_items
+from rongguan_erp.utils.api.sales_order_bom_binding import (
+    bind_default_boms,
+    get_sales_order_rows,
+    resolve_item_boms,
+    write_row_boms
+)
+from rongguan_erp.utils.item_attribute_classification import (
+    classify_attributes,
+    get_attribute_tags,
+    get_attribute_type,
+    get_attribute_value_catalog,
+    get_color_attributes,
+    get_size_attributes
+)
+from rongguan_erp.utils.operation_provisioning import provision_operations
+from rongguan_erp.utils.pagination import cached_count, keyset_get_all, next_cursor_for
+from rongguan_erp.utils.pending_request_qty import get_pending_request_qty
+from werkzeug.wrappers import Response
+
+
+
+# 变体属性按父物料分批查询，单条 IN (...) 的最大数量
+ITEM_ATTRIBUTE_QUERY_CHUNK = 1000
+
+
+def _parse_json_arg(value):
+    """API 参数可能是 JSON 字符串"""
+    if isinstance(value, str) and value:
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return value
+    return value
 
 
+def _get_variant_attributes_by_item(item_codes):
+    """
+    按物料批量查询 Item Variant Attribute，返回 {item_code: [属性行]}
+    每 ITEM_ATTRIBUTE_QUERY_CHUNK 个物料一条查询，行按 idx 排序
+    """
+    attributes_by_item = {}
+    item_codes = list(item_codes)
+    for start in range(0, len(item_codes), ITEM_ATTRIBUTE_QUERY_CHUNK):
+        for row in frappe.get_all(
+            "Item Variant Attribute",
+            filters={
+                "parent": ["in", item_codes[start:start + ITEM_ATTRIBUTE_QUERY_CHUNK]],
+                "parenttype": "Item"
+            },
+            fields=["*"],
+            order_by="parent asc, idx asc"
+        ):
+            attributes_by_item.setdefault(row.parent, []).append(row)
+    return attributes_by_item
+
 
 # bench --site site1.local execute rongguan_erp.utils.api.items.get_items_with_attributes --kwargs '{"filters": {"item_group": "成品"}}'
 @frappe.whitelist(allow_guest=False)  # 确保只允许认证用户访问
-def get_items_with_attributes(filters=None, fields=None, or_filters=None, order_by=None, limit_page_length=None, limit_start=0):
-    if not filters:
-        filters = {}
-    
+def get_items_with_attributes(filters=None, fields=None, or_filters=None, order_by=None, limit_page_length=None, limit_start=0, full_doc=None):
+    """
+    获取物料列表及其变体属性、颜色、尺码
+
+    默认只按 fields 投影查询 Item 主表，变体属性由一条（按批）Item Variant Attribute 查询补齐，
+    颜色/尺码由属性分类缓存判定，不再逐个加载文档。
+
+    Args:
+        filters / or_filters / order_by / limit_page_length / limit_start: 同 frappe.get_all
+        fields: 需要的 Item 字段，默认全部字段（"*"）
+        full_doc: 为真时返回完整文档（as_dict，含所有子表），与旧版返回一致，较慢
+    """
+    filters = _parse_json_arg(filters) or {}
+    or_filters = _parse_json_arg(or_filters)
+    fields = _parse_json_arg(fields) or ["*"]
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+
+    if cint(full_doc):
+        return _get_items_with_attributes_as_docs(filters, or_filters, order_by, limit_page_length, limit_start)
+
+    query_fields = list(fields)
+    if "*" not in query_fields and "name" not in query_fields:
+        query_fields.append("name")
+
+    items = frappe.get_all(
+        'Item',
+        filters=filters,
+        fields=query_fields,
+        or_filters=or_filters,
+        order_by=order_by,
+        limit_page_length=limit_page_length,
+        limit_start=limit_start
+    )
+
+    attributes_by_item = _get_variant_attributes_by_item(item.name for item in items)
+    for item in items:
+        attributes = attributes_by_item.get(item.name, [])
+        item["attributes"] = attributes
+        # 为前端「选建议」时提供物料颜色/尺码：从 Item 变体属性中解析（Item Attribute _user_tags 含「颜色」/「尺寸」）
+        item["color"], item["size"] = classify_attributes(attributes)
+
+    return items
+
+
+def _get_items_with_attributes_as_docs(filters, or_filters, order_by, limit_page_length, limit_start):
+    """get_items_with_attributes 的完整文档模式（逐个 get_doc）"""
     items = frappe.get_all(
         'Item',
         filters=filters,
-        fields=fields or ["*"],
         or_filters=or_filters,
         order_by=order_by,
         limit_page_length=limit_page_length,
@@ -29,7 +127,6 @@ def get_items_with_attributes(filters=None, fields=None, or_filters=None, order_
         doc = frappe.get_doc('Item', item)
         data = doc.as_dict()
         data["attributes"] = doc.attributes
-        # 为前端「选建议」时提供物料颜色/尺码：从 Item 变体属性中解析（Item Attribute _user_tags 含「颜色」/「尺寸」）
         color, size = _get_item_color_and_size_from_doc(doc)
         data["color"] = color
         data["size"] = size
@@ -44,19 +141,7 @@ def _get_item_color_and_size_from_doc(item_doc):
     根据 Item Attribute 的 _user_tags 是否含「颜色」「尺寸」判断。
     返回 (color, size)，无则返回 ("", "")。
     """
-    color = ""
-    size = ""
-    for attr in item_doc.get("attributes", []):
-        try:
-            attr_doc = frappe.get_doc("Item Attribute", attr.attribute)
-            val = (attr.attribute_value or "").strip()
-            if "颜色" in (attr_doc.get("_user_tags") or ""):
-                color = val
-            elif "尺寸" in (attr_doc.get("_user_tags") or ""):
-                size = val
-        except Exception:
-            continue
-    return (color, size)
+    return classify_attributes(item_doc.get("attributes", []))
 
 # 要从 API 调用此脚本，使用以下 URL：
 # http://192.168.32.20:8000/api/method/get_items_with_attributes?filters={"item_group": "成品"}&fields=["name","item_code"]
@@ -69,6 +154,9 @@ def get_items_attribute_with_value(filters=None, fields=None):
     获取 Item Attribute Value 及其父表 Item Attribute 的信息（包括 _user_tags、customer）。
     每条记录含 customer 字段：留空表示所有客户可用，有值表示仅该客户可用。
     传入 filters={"customer": "客户名"} 可仅返回该客户可用的属性值。
+
+    目录由一条 JOIN 查询构建并带版本号缓存；HTTP 请求返回 ETag，
+    客户端携带 If-None-Match 且目录未变化时返回 304。
     """
     if isinstance(filters, str):
         try:
@@ -78,56 +166,22 @@ def get_items_attribute_with_value(filters=None, fields=None):
     filters = dict(filters) if filters else {}
     filter_customer = filters.pop('customer', None)
 
-    # 查询 Item Attribute Value（子表），含 custom customer 字段
-    items = frappe.get_all(
-        'Item Attribute Value',
-        filters=filters,
-        fields=['name', 'attribute_value', 'abbr', 'parent', 'idx', 'customer']
-    )
-    
-    result = []
-    # 缓存父表数据，避免重复查询同一个 Item Attribute
-    parent_cache = {}
-    
-    for item in items:
-        # 获取 Item Attribute Value 的完整数据
-        value_doc = frappe.get_doc('Item Attribute Value', item['name'])
-        data = value_doc.as_dict()
-        
-        # 获取父表 Item Attribute 的信息
-        parent_name = item.get('parent')
-        if parent_name:
-            if parent_name not in parent_cache:
-                # 查询父表，包括 _user_tags 字段
-                parent_doc = frappe.get_doc('Item Attribute', parent_name)
-                user_tags = parent_doc.get('_user_tags') or ''
-                
-                # 根据 _user_tags 判断是否为尺寸或颜色
-                is_size = 1 if '尺寸' in user_tags else 0
-                is_color = 1 if '颜色' in user_tags else 0
-                
-                parent_cache[parent_name] = {
-                    'attribute_name': parent_doc.attribute_name,
-                    'numeric_values': parent_doc.numeric_values,
-                    'disabled': parent_doc.disabled,
-                    '_user_tags': user_tags,
-                    'is_size': is_size,
-                    'is_color': is_color,
-                }
-            
-            # 将父表信息添加到返回数据中
-            data['item_attribute'] = parent_cache[parent_name]
-        
-        result.append(data)
+    catalog, etag = get_attribute_value_catalog(filters, filter_customer)
 
-    # 若指定了 customer，仅返回该客户可用的属性值（customer 为空=通用，或 customer 匹配）
-    if filter_customer is not None:
-        result = [
-            r for r in result
-            if (not r.get('customer')) or r.get('customer') == filter_customer
-        ]
+    if not getattr(frappe.local, 'request', None):
+        return catalog
 
-    return result
+    # HTTP 请求：支持 ETag 协商缓存
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    if_none_match = frappe.get_request_header('If-None-Match') or ''
+    if etag in [tag.strip().strip('"').removeprefix('W/"') for tag in if_none_match.split(',')]:
+        return Response(status=304, headers=headers)
+
+    return Response(
+        frappe.as_json({'message': catalog}),
+        mimetype='application/json',
+        headers=headers
+    )
 
 # bench --site site1.local execute rongguan_erp.utils.api.items.get_items_by_item_group --kwargs '{"item_group_name": "成品"}'
 @frappe.whitelist()
@@ -222,10 +276,23 @@ def get_boms_by_item_group(item_group_name):
 # 示例用法:
 # bench --site site1.local execute rongguan_erp.utils.api.items.get_items_with_attributes_with_pagination --kwargs '{"filters": {"item_group": "成品"}, "page_number": 1, "page_size": 10}'
 @frappe.whitelist(allow_guest=False)
-def get_items_with_attributes_with_pagination(filters=None, fields=None, page_number=1, page_size=20):
-    # 输出所有输入的参数
-    print(f"Input parameters: filters={filters}, fields={fields}, page_number={page_number}, page_size={page_size}")
+def get_items_with_attributes_with_pagination(filters=None, fields=None, page_number=1, page_size=20,
+                                              cursor=None, with_count=None, full_doc=None):
+    """
+    分页获取物料及其变体属性（按 creation desc 排序）
+
+    Args:
+        filters: 过滤条件
+        fields: 需要的 Item 字段，默认全部字段（"*"）
+        page_number: 页码（页码模式）
+        page_size: 每页数量
+        cursor: 游标分页，传入上一次返回的 pagination.next_cursor（此时忽略 page_number）
+        with_count: 是否计算总数；页码模式默认计算，游标模式默认不计算（只需 has_next 时可关闭）
+        full_doc: 为真时返回完整文档（as_dict，含所有子表），较慢
 
+    Returns:
+        dict: {"data": [...], "pagination": {...}}，每个属性带 _user_tags 与 attribute_type
+    """
     # 强制将 filters 参数（如果它是字符串的话）通过 json.loads() 转换为正确的 Python 对象
     # 考虑到 Frappe 可能将 URL 参数解析为字符列表，需要先将其拼接回字符串
     if isinstance(filters, list) and all(isinstance(char, str) and len(char) == 1 for char in filters):
@@ -246,79 +313,85 @@ def get_items_with_attributes_with_pagination(filters=None, fields=None, page_nu
     if not filters:
         filters = {}
 
-    page_number = int(page_number)
-    page_size = int(page_size)
+    fields = _parse_json_arg(fields) or ["*"]
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+
+    page_number = int(page_number or 1)
+    page_size = int(page_size or 20)
 
     if page_number < 1:
         page_number = 1
     if page_size < 1:
         page_size = 20
 
-    # 获取总条目数
-    print(f"filters (after json.loads and reconstruction)===========: {filters}")
-    total_items = frappe.db.count('Item', filters=filters)
-    print(f"total_items===========: {total_items}")
-    
-    # 计算总页数
-    total_pages = (total_items + page_size - 1) // page_size
-
-    # 计算偏移量
-    offset = (page_number - 1) * page_size
-
-    items = frappe.get_all(
-        'Item',
-        filters=filters,
-        fields=fields or ["*"],
-        limit_page_length=page_size,
-        limit_start=offset,
-        pluck='name',
-        order_by="creation desc"
-    )
-
-    result_data = []
-    for item in items:
-        doc = frappe.get_doc('Item', item)
-        data = doc.as_dict()
-        
-        # 初始化一个空列表来存放处理后的属性
-        processed_attributes = []
-        for attr_doc in doc.attributes:
-            attr_dict = attr_doc.as_dict()  # 将 ItemVariantAttribute 对象转换为字典
-            try:
-                item_attribute_doc = frappe.get_doc("Item Attribute", attr_dict.get("attribute"))
-                attr_dict["_user_tags"] = item_attribute_doc._user_tags
-            except frappe.DoesNotExistError:
-                attr_dict["_user_tags"] = ""
-            except Exception as e:
-                frappe.log_error(f"Error fetching _user_tags for Item Attribute {attr_dict.get('attribute')}: {e}", "Item Attribute Fetch Error")
-                attr_dict["_user_tags"] = ""
-
-            # 根据 _user_tags 判断 attribute_type
-            if attr_dict.get("_user_tags"):
-                if "颜色" in attr_dict["_user_tags"]:
-                    attr_dict["attribute_type"] = "color"
-                elif "尺寸" in attr_dict["_user_tags"]:
-                    attr_dict["attribute_type"] = "size"
-                else:
-                    attr_dict["attribute_type"] = ""
-            else:
-                attr_dict["attribute_type"] = ""
-
-            processed_attributes.append(attr_dict)
-        
-        data["attributes"] = processed_attributes # 用处理后的列表替换原始属性
+    order_by = "creation desc"
+    use_cursor = bool(cursor)
+    with_count = cint(with_count) if with_count not in (None, "") else not use_cursor
+
+    query_fields = list(fields)
+    if "*" not in query_fields:
+        for required in ("name", "creation"):
+            if required not in query_fields:
+                query_fields.append(required)
+
+    if use_cursor:
+        page_result = keyset_get_all(
+            'Item',
+            filters=filters,
+            fields=query_fields,
+            order_by=order_by,
+            page_size=page_size,
+            cursor=cursor
+        )
+        items = page_result["rows"]
+        has_next = page_result["has_next"]
+        next_cursor = page_result["next_cursor"]
+    else:
+        # 多取一条用于判断是否有下一页
+        items = frappe.get_all(
+            'Item',
+            filters=filters,
+            fields=query_fields,
+            limit_page_length=page_size + 1,
+            limit_start=(page_number - 1) * page_size,
+            order_by=order_by
+        )
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        next_cursor = next_cursor_for(items, order_by, has_next)
+
+    if cint(full_doc):
+        result_data = []
+        for item in items:
+            doc = frappe.get_doc('Item', item.name)
+            data = doc.as_dict()
+            data["attributes"] = [attr.as_dict() for attr in doc.attributes]
+            result_data.append(data)
+    else:
+        result_data = items
+        attributes_by_item = _get_variant_attributes_by_item(item.name for item in items)
+        for item in items:
+            item["attributes"] = attributes_by_item.get(item.name, [])
+
+    for data in result_data:
+        for attr_dict in data["attributes"]:
+            # 根据 Item Attribute 的 _user_tags 判断 attribute_type（走属性分类缓存）
+            attr_dict["_user_tags"] = get_attribute_tags(attr_dict.get("attribute"))
+            attr_dict["attribute_type"] = get_attribute_type(attr_dict.get("attribute"))
 
-        result_data.append(data)
-    print(f"Result data===========: {total_items} {total_pages} {page_number} {page_size}")
     pagination_info = {
-        "page_number": page_number,
         "page_size": page_size,
-        "total_pages": total_pages,
-        "total_items": total_items
+        "has_next": has_next,
+        "next_cursor": next_cursor
     }
-
-    # 打印计算后的分页信息，用于调试
-    print(f"Calculated pagination info: page_number={page_number}, page_size={page_size}, total_pages={total_pages}, total_items={total_items}")
+    if not use_cursor:
+        pagination_info["page_number"] = page_number
+    if with_count:
+        # 总数按过滤条件缓存，物料变更时失效
+        total_items = cached_count('Item', filters)
+        pagination_info["total_items"] = total_items
+        pagination_info["total_pages"] = (total_items + page_size - 1) // page_size
 
     return {
         "data": result_data,
@@ -474,26 +547,48 @@ def create_style_number_number_by_custom_item_code(item_data):
         frappe.throw(_("Failed to create Item: {0}").format(str(e)))
 
 
+def _get_item_attribute_values(item_code, attributes):
+    """
+    获取物料在指定属性（颜色或尺码）上的可选值列表
+    两条查询：物料的变体属性、这些属性的全部属性值
+    """
+    if not attributes:
+        return []
+
+    item_attributes = frappe.get_all(
+        "Item Variant Attribute",
+        filters={"parent": item_code, "parenttype": "Item", "attribute": ["in", attributes]},
+        fields=["attribute"],
+        order_by="idx asc",
+        pluck="attribute"
+    )
+    if not item_attributes:
+        return []
+
+    values_by_attribute = {}
+    for row in frappe.get_all(
+        "Item Attribute Value",
+        filters={"parent": ["in", item_attributes], "parenttype": "Item Attribute"},
+        fields=["parent", "attribute_value"],
+        order_by="idx asc"
+    ):
+        values_by_attribute.setdefault(row.parent, []).append(row.attribute_value)
+
+    return [
+        {"attribute": attribute, "values": values_by_attribute.get(attribute, [])}
+        for attribute in item_attributes
+    ]
+
+
 @frappe.whitelist()
 def get_item_color_values(item_code):
     if not item_code:
         return {"error": "item_code is required"}
 
-    item = frappe.get_doc("Item", item_code)
+    if not frappe.db.exists("Item", item_code):
+        frappe.throw(_("Item {0} not found").format(item_code), frappe.DoesNotExistError)
 
-    color_attributes = []
-
-    for attr in item.attributes:
-        try:
-            attr_doc = frappe.get_doc("Item Attribute", attr.attribute)
-            if attr_doc._user_tags and "颜色" in attr_doc._user_tags:
-                color_values = [v.attribute_value for v in attr_doc.item_attribute_values]
-                color_attributes.append({
-                    "attribute": attr.attribute,
-                    "values": color_values
-                })
-        except frappe.DoesNotExistError:
-            continue
+    color_attributes = _get_item_attribute_values(item_code, get_color_attributes())
 
     if not color_attributes:
         return {"error": "No attribute with tag '颜色' found for this item"}
@@ -506,21 +601,10 @@ def get_item_size_values(item_code):
     if not item_code:
         return {"error": "item_code is required"}
 
-    item = frappe.get_doc("Item", item_code)
-
-    size_attributes = []
+    if not frappe.db.exists("Item", item_code):
+        frappe.throw(_("Item {0} not found").format(item_code), frappe.DoesNotExistError)
 
-    for attr in item.attributes:
-        try:
-            attr_doc = frappe.get_doc("Item Attribute", attr.attribute)
-            if attr_doc._user_tags and "尺寸" in attr_doc._user_tags:
-                size_values = [v.attribute_value for v in attr_doc.item_attribute_values]
-                size_attributes.append({
-                    "attribute": attr.attribute,
-                    "values": size_values
-                })
-        except frappe.DoesNotExistError:
-            continue
+    size_attributes = _get_item_attribute_values(item_code, get_size_attributes())
 
     if not size_attributes:
         return {"error": "No attribute with tag '荣冠尺码' found for this item"}
@@ -529,10 +613,145 @@ def get_item_size_values(item_code):
         "size_attributes": size_attributes
     }    
 
+# 库存矩阵缓存（秒）：同一页面短时间内重复查询同一物料时复用
+ITEM_STOCK_CACHE_TTL = 10
+ITEM_STOCK_CACHE_PREFIX = "rg_item_stock:"
+BIN_QTY_FIELDS = ["actual_qty", "projected_qty", "reserved_qty", "ordered_qty", "planned_qty"]
+
+
+def _parse_list_arg(value):
+    """列表参数：支持列表、JSON 数组字符串或逗号分隔字符串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            value = value.split(",")
+        if isinstance(value, str):
+            value = [value]
+    return list(dict.fromkeys(str(v).strip() for v in value if v and str(v).strip()))
+
+
+def _empty_stock_qty():
+    return {field: 0 for field in BIN_QTY_FIELDS}
+
+
+def _build_items_stock(item_codes, warehouses, company):
+    """按物料×仓库构建库存矩阵（物料、Bin、待处理请购汇总各一条查询）"""
+    items = {
+        row.name: row for row in frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes]},
+            fields=["name", "item_name", "stock_uom", "is_stock_item"]
+        )
+    }
+    stock_item_codes = [code for code in item_codes if items.get(code) and items[code].is_stock_item]
+
+    conditions = ["b.item_code IN %(item_codes)s"]
+    values = {"item_codes": tuple(stock_item_codes)}
+    if warehouses:
+        conditions.append("b.warehouse IN %(warehouses)s")
+        values["warehouses"] = tuple(warehouses)
+    if company:
+        conditions.append("w.company = %(company)s")
+        values["company"] = company
+
+    bins = frappe.db.sql(f"""
+        SELECT
+            b.item_code, b.warehouse,
+            {', '.join(f'SUM(b.{field}) AS {field}' for field in BIN_QTY_FIELDS)}
+        FROM `tabBin` b
+        LEFT JOIN `tabWarehouse` w ON b.warehouse = w.name
+        WHERE {' AND '.join(conditions)}
+        GROUP BY b.item_code, b.warehouse
+    """, values, as_dict=True) if stock_item_codes else []
+
+    requested_qty = get_pending_request_qty(stock_item_codes)
+
+    result = {}
+    for item_code in item_codes:
+        item = items.get(item_code)
+        if not item:
+            result[item_code] = {"item_code": item_code, "error": f"Item {item_code} does not exist"}
+            continue
+        result[item_code] = {
+            "item_code": item_code,
+            "item_name": item.item_name,
+            "is_stock_item": bool(item.is_stock_item),
+            "stock_uom": item.stock_uom,
+            "warehouses": {warehouse: _empty_stock_qty() for warehouse in warehouses or []},
+            "total": _empty_stock_qty(),
+            "requested_qty": requested_qty.get(item_code) or 0
+        }
+
+    for row in bins:
+        entry = result[row.item_code]
+        qty = {field: row.get(field) or 0 for field in BIN_QTY_FIELDS}
+        entry["warehouses"][row.warehouse] = qty
+        for field in BIN_QTY_FIELDS:
+            entry["total"][field] += qty[field]
+
+    return result
+
+
+@frappe.whitelist()
+def get_items_available_stock(item_codes, warehouses=None, company=None):
+    """
+    批量获取多个物料在多个仓库的可用库存
+
+    Args:
+        item_codes: 物料编码列表（JSON 数组或逗号分隔）
+        warehouses: 仓库列表（可选，不传则统计所有仓库）
+        company: 公司（可选，只统计该公司的仓库；未传仓库和公司时取默认公司）
+
+    Returns:
+        dict: {item_code: {"item_name", "is_stock_item", "stock_uom",
+                           "warehouses": {仓库: 数量字段}, "total": 汇总数量, "requested_qty"}}
+    """
+    item_codes = _parse_list_arg(item_codes)
+    warehouses = _parse_list_arg(warehouses)
+    if not item_codes:
+        return {}
+
+    if not warehouses and not company:
+        company = frappe.defaults.get_user_default("Company") or frappe.get_all("Company", limit=1)[0].name
+
+    # 按 (仓库, 公司) 范围逐物料缓存，只查询缓存未命中的物料
+    scope = hashlib.md5(json.dumps([sorted(warehouses), company]).encode()).hexdigest()
+    cache = frappe.cache()
+    result = {}
+    missing = []
+    for item_code in item_codes:
+        cached = cache.get_value(f"{ITEM_STOCK_CACHE_PREFIX}{scope}:{item_code}")
+        if cached is None:
+            missing.append(item_code)
+        else:
+            result[item_code] = cached
+
+    if missing:
+        for item_code, entry in _build_items_stock(missing, warehouses, company).items():
+            cache.set_value(
+                f"{ITEM_STOCK_CACHE_PREFIX}{scope}:{item_code}", entry, expires_in_sec=ITEM_STOCK_CACHE_TTL
+            )
+            result[item_code] = entry
+
+    return {item_code: result[item_code] for item_code in item_codes}
+
+
+def _stock_info_from_entry(entry, warehouse=None, company=None):
+    """把库存矩阵中的一个物料转换为 get_item_available_stock 的 stock_info 格式"""
+    stock_info = dict(entry["total"])
+    stock_info["requested_qty"] = entry["requested_qty"]
+    if warehouse:
+        return {"warehouse": warehouse, **stock_info}
+    return {"warehouse": "All Warehouses", **stock_info, "company": company}
+
+
 @frappe.whitelist()
 def get_item_available_stock(item_code, warehouse=None, company=None):
     """
-    获取物料的可用库存信息
+    获取物料的可用库存信息（get_items_available_stock 的单物料包装）
     
     Args:
         item_code (str): 物料编码
@@ -546,131 +765,32 @@ def get_item_available_stock(item_code, warehouse=None, company=None):
         return {"error": "item_code is required"}
     
     try:
-        # 检查物料是否存在
-        if not frappe.db.exists("Item", item_code):
-            return {"error": f"Item {item_code} does not exist"}
+        if not warehouse and not company:
+            company = frappe.defaults.get_user_default("Company") or frappe.get_all("Company", limit=1)[0].name
         
-        # 检查物料是否为库存物料
-        item_doc = frappe.get_doc("Item", item_code)
-        if not item_doc.is_stock_item:
+        entry = get_items_available_stock(
+            [item_code], [warehouse] if warehouse else None, None if warehouse else company
+        )[item_code]
+        if entry.get("error"):
+            return {"error": entry["error"]}
+        
+        if not entry["is_stock_item"]:
             return {
                 "item_code": item_code,
-                "item_name": item_doc.item_name,
+                "item_name": entry["item_name"],
                 "is_stock_item": False,
-                "stock_uom": item_doc.stock_uom,
+                "stock_uom": entry["stock_uom"],
                 "message": "This is not a stock item"
             }
         
-        stock_info = {}
-        
-        if warehouse:
-            # 获取指定仓库的库存信息
-            bin_data = frappe.db.get_value(
-                "Bin",
-                {"item_code": item_code, "warehouse": warehouse},
-                ["actual_qty", "projected_qty", "reserved_qty", "ordered_qty", "planned_qty"],
-                as_dict=True
-            )
-            
-            # 获取Material Request的待处理数量
-            material_request_pending = frappe.db.sql("""
-                SELECT 
-                    SUM(mri.qty - mri.ordered_qty) as pending_qty
-                FROM `tabMaterial Request Item` mri
-                JOIN `tabMaterial Request` mr ON mri.parent = mr.name
-                WHERE mri.item_code = %s
-                AND mr.docstatus = 1
-                AND mr.status != 'Cancelled'
-            """, (item_code,), as_dict=True)
-            
-            requested_qty = material_request_pending[0].pending_qty if material_request_pending and material_request_pending[0] and material_request_pending[0].pending_qty is not None else 0
-            
-            if bin_data:
-                stock_info = {
-                    "warehouse": warehouse,
-                    "actual_qty": bin_data.actual_qty or 0,
-                    "projected_qty": bin_data.projected_qty or 0,
-                    "reserved_qty": bin_data.reserved_qty or 0,
-                    "ordered_qty": bin_data.ordered_qty or 0,
-                    "planned_qty": bin_data.planned_qty or 0,
-                    "requested_qty": requested_qty
-                }
-            else:
-                stock_info = {
-                    "warehouse": warehouse,
-                    "actual_qty": 0,
-                    "projected_qty": 0,
-                    "reserved_qty": 0,
-                    "ordered_qty": 0,
-                    "planned_qty": 0,
-                    "requested_qty": requested_qty
-                }
-        else:
-            # 获取所有仓库的总库存
-            if not company:
-                company = frappe.defaults.get_user_default("Company") or frappe.get_all("Company", limit=1)[0].name
-            
-            # 使用 SQL 查询获取汇总数据
-            bin_data = frappe.db.sql("""
-                SELECT 
-                    SUM(actual_qty) as actual_qty,
-                    SUM(projected_qty) as projected_qty,
-                    SUM(reserved_qty) as reserved_qty,
-                    SUM(ordered_qty) as ordered_qty,
-                    SUM(planned_qty) as planned_qty
-                FROM `tabBin` b
-                LEFT JOIN `tabWarehouse` w ON b.warehouse = w.name
-                WHERE b.item_code = %s
-                AND (w.company = %s OR %s IS NULL)
-            """, (item_code, company, company), as_dict=True)
-            
-            # 获取Material Request的待处理数量
-            material_request_pending = frappe.db.sql("""
-                SELECT 
-                    SUM(mri.qty - mri.ordered_qty) as pending_qty
-                FROM `tabMaterial Request Item` mri
-                JOIN `tabMaterial Request` mr ON mri.parent = mr.name
-                WHERE mri.item_code = %s
-                AND mr.docstatus = 1
-                AND mr.status != 'Cancelled'
-            """, (item_code,), as_dict=True)
-            
-            requested_qty = material_request_pending[0].pending_qty if material_request_pending and material_request_pending[0] and material_request_pending[0].pending_qty is not None else 0
-            
-            if bin_data and bin_data[0]:
-                data = bin_data[0]
-                stock_info = {
-                    "warehouse": "All Warehouses",
-                    "actual_qty": data.actual_qty or 0,
-                    "projected_qty": data.projected_qty or 0,
-                    "reserved_qty": data.reserved_qty or 0,
-                    "ordered_qty": data.ordered_qty or 0,
-                    "planned_qty": data.planned_qty or 0,
-                    "requested_qty": requested_qty,
-                    "company": company
-                }
-            else:
-                stock_info = {
-                    "warehouse": "All Warehouses",
-                    "actual_qty": 0,
-                    "projected_qty": 0,
-                    "reserved_qty": 0,
-                    "ordered_qty": 0,
-                    "planned_qty": 0,
-                    "requested_qty": requested_qty,
-                    "company": company
-                }
-        
-        result = {
+        return {
             "item_code": item_code,
-            "item_name": item_doc.item_name,
+            "item_name": entry["item_name"],
             "is_stock_item": True,
-            "stock_uom": item_doc.stock_uom,
-            "stock_info": stock_info
+            "stock_uom": entry["stock_uom"],
+            "stock_info": _stock_info_from_entry(entry, warehouse, company)
         }
         
-        return result
-        
     except Exception as e:
         frappe.log_error(f"Error in get_item_available_stock for {item_code}: {str(e)}", "Item Stock API Error")
         return {"error": f"Failed to get item stock: {str(e)}"}
@@ -765,6 +885,174 @@ def get_item_rate_info(item_code, company=None, rm_cost_as_per="Valuation Rate",
         return {"error": f"Failed to get item rate: {str(e)}"}
 
 
+def _get_request_price_list_rows(price_list, item_codes):
+    """
+    读取价格清单中物料当前有效的 Item Price 行，按请求缓存（frappe.local）
+
+    与 ERPNext 取价一致：只取不限客户 / 供应商的价格，valid_from / valid_upto 按今天过滤。
+    同一请求内多次调用只查询尚未读取过的物料。
+
+    Returns:
+        dict: {item_code: [Item Price 行]}（按 valid_from、batch_no 倒序）
+    """
+    if not hasattr(frappe.local, "rg_price_list_rows"):
+        frappe.local.rg_price_list_rows = {}
+    memo = frappe.local.rg_price_list_rows.setdefault(price_list, {})
+
+    missing = [code for code in item_codes if code not in memo]
+    if missing:
+        for code in missing:
+            memo[code] = []
+        for row in frappe.db.sql("""
+            SELECT item_code, uom, price_list_rate, valid_from, batch_no
+            FROM `tabItem Price`
+            WHERE price_list = %(price_list)s
+            AND item_code IN %(item_codes)s
+            AND IFNULL(customer, '') = '' AND IFNULL(supplier, '') = ''
+            AND %(today)s BETWEEN IFNULL(valid_from, '2000-01-01') AND IFNULL(valid_upto, '2500-12-31')
+            ORDER BY valid_from DESC, batch_no DESC
+        """, {"price_list": price_list, "item_codes": tuple(missing), "today": nowdate()}, as_dict=True):
+            memo[row.item_code].append(row)
+
+    return {code: memo[code] for code in item_codes}
+
+
+def _get_valuation_rates(items, company):
+    """
+    批量计算估价：与 ERPNext get_valuation_rate 的取值顺序一致（按整个公司估价，
+    与 get_item_rate_info 的 set_rate_based_on_warehouse=0 相同）
+    1) 公司下 Bin 的 SUM(stock_value) / SUM(actual_qty)
+    2) 最近一条估价大于 0 的库存分类账
+    3) 物料主数据上的 valuation_rate
+    """
+    item_codes = list(items)
+    rates = {
+        item_code: flt(rate)
+        for item_code, rate in frappe.db.sql("""
+            SELECT b.item_code, SUM(b.stock_value) / SUM(b.actual_qty)
+            FROM `tabBin` b
+            JOIN `tabWarehouse` w ON b.warehouse = w.name
+            WHERE b.item_code IN %(item_codes)s AND w.company = %(company)s
+            GROUP BY b.item_code
+        """, {"item_codes": tuple(item_codes), "company": company})
+    }
+
+    missing = [code for code in item_codes if not rates.get(code)]
+    if missing:
+        for item_code, rate in frappe.db.sql("""
+            SELECT item_code, valuation_rate
+            FROM (
+                SELECT item_code, valuation_rate,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY item_code ORDER BY posting_date DESC, posting_time DESC, creation DESC
+                    ) AS row_no
+                FROM `tabStock Ledger Entry`
+                WHERE item_code IN %(item_codes)s
+                AND valuation_rate > 0
+                AND is_cancelled = 0
+                AND company = %(company)s
+            ) latest
+            WHERE row_no = 1
+        """, {"item_codes": tuple(missing), "company": company}):
+            rates[item_code] = flt(rate)
+
+    return {code: rates.get(code) or flt(items[code].valuation_rate) for code in item_codes}
+
+
+@frappe.whitelist()
+def get_items_rate_info(item_codes, company=None, rm_cost_as_per="Valuation Rate", buying_price_list=None, qty=1, warehouse=None):
+    """
+    批量获取物料的 rate 信息（get_item_rate_info 的批量版本，用于核价表、BOM 版本等一次取几十上百个物料）
+
+    所有物料共用 rm_cost_as_per、价格清单和仓库，按来源分组查询：
+    - Valuation Rate: Bin 按物料分组汇总，缺失的再取最近库存分类账估价、物料估价
+    - Last Purchase Rate: 物料主数据的 last_purchase_rate
+    - Price List: 当前有效的 Item Price（库存单位）按最新 valid_from 取价，同一请求内按价格清单缓存
+    估价按整个公司计算，与 get_item_rate_info 一致；warehouse 只影响返回的库存信息
+
+    Args:
+        item_codes: 物料编码列表（JSON 数组或逗号分隔）
+        company (str): 公司（可选，默认取默认公司）
+        rm_cost_as_per (str): 原材料成本来源，可选值：'Valuation Rate', 'Last Purchase Rate', 'Price List'
+        buying_price_list (str): 采购价格清单（rm_cost_as_per 为 Price List 时必填）
+        qty (float): 数量（默认为1）
+        warehouse (str): 仓库（可选，用于获取库存信息）
+
+    Returns:
+        dict: {item_code: 与 get_item_rate_info 相同结构的字典}
+    """
+    item_codes = _parse_list_arg(item_codes)
+    if not item_codes:
+        return {}
+
+    if rm_cost_as_per not in ("Valuation Rate", "Last Purchase Rate", "Price List"):
+        return {"error": f"Unsupported rm_cost_as_per: {rm_cost_as_per}"}
+    if rm_cost_as_per == "Price List" and not buying_price_list:
+        return {"error": "Please select Price List"}
+
+    try:
+        if not company:
+            company = frappe.defaults.get_user_default("Company") or frappe.get_all("Company", limit=1)[0].name
+        currency = frappe.get_cached_value("Company", company, "default_currency")
+        qty = flt(qty)
+
+        items = {
+            row.name: row for row in frappe.get_all(
+                "Item",
+                filters={"name": ["in", item_codes]},
+                fields=["name", "item_name", "stock_uom", "valuation_rate", "last_purchase_rate"]
+            )
+        }
+        existing = [code for code in item_codes if code in items]
+
+        if rm_cost_as_per == "Valuation Rate":
+            rates = _get_valuation_rates({code: items[code] for code in existing}, company) if existing else {}
+        elif rm_cost_as_per == "Last Purchase Rate":
+            rates = {code: flt(items[code].last_purchase_rate) for code in existing}
+        else:
+            price_rows = _get_request_price_list_rows(buying_price_list, existing)
+            rates = {
+                code: next(
+                    (flt(row.price_list_rate) for row in price_rows[code] if row.uom == items[code].stock_uom), 0.0
+                )
+                for code in existing
+            }
+
+        stock = get_items_available_stock(existing, [warehouse] if warehouse else None, None if warehouse else company) \
+            if existing else {}
+
+        result = {}
+        for item_code in item_codes:
+            item = items.get(item_code)
+            if not item:
+                result[item_code] = {"error": f"Item {item_code} does not exist"}
+                continue
+
+            entry = stock.get(item_code) or {}
+            rate = flt(rates.get(item_code))
+            result[item_code] = {
+                "item_code": item_code,
+                "item_name": item.item_name,
+                "stock_uom": item.stock_uom,
+                "qty": qty,
+                "rate": rate,
+                "amount": rate * qty,
+                "company": company,
+                "rm_cost_as_per": rm_cost_as_per,
+                "buying_price_list": buying_price_list,
+                "currency": currency,
+                "rate_source": f"Calculated using {rm_cost_as_per}",
+                "stock_info": _stock_info_from_entry(entry, warehouse, company) if entry.get("is_stock_item") else None,
+                "is_stock_item": entry.get("is_stock_item", False)
+            }
+
+        return result
+
+    except Exception as e:
+        frappe.log_error(f"Error in get_items_rate_info: {str(e)}", "Item Rate API Error")
+        return {"error": f"Failed to get item rates: {str(e)}"}
+
+
 @frappe.whitelist()
 def get_item_bom_items(item_code):
     """
@@ -865,23 +1153,14 @@ def update_item_custom_bom_operation(item_code, custom_bom_operation):
         if not frappe.db.exists("Item", item_code):
             return {"error": f"Item {item_code} does not exist"}
         
-        # 首先检查并创建不存在的 Operation
-        created_operations = []
-        for operation_data in custom_bom_operation:
-            operation_name = operation_data.get("operation", "").strip()
-            if operation_name and not frappe.db.exists("Operation", operation_name):
-                try:
-                    # 创建新的 Operation
-                    operation_doc = frappe.get_doc({
-                        "doctype": "Operation",
-                        "operation": operation_name,
-                        "workstation": operation_data.get("workstation_type") or operation_data.get("workstation")
-                    })
-                    operation_doc.insert()
-                    created_operations.append(operation_name)
-                except Exception as e:
-                    frappe.log_error(f"Error creating Operation {operation_name}: {str(e)}", "Create Operation Error")
-                    # 继续处理，不因为创建 Operation 失败而中断整个流程
+        # 首先批量创建不存在的 Operation
+        created_operations = provision_operations(
+            {
+                "operation": operation_data.get("operation"),
+                "workstation": operation_data.get("workstation_type") or operation_data.get("workstation")
+            }
+            for operation_data in custom_bom_operation
+        )
         
         # 获取物料文档
         item_doc = frappe.get_doc("Item", item_code)
@@ -1041,20 +1320,10 @@ def save_item_bom_structure(bom_data):
                 cleaned_operation_data["parentfield"] = "operations"
                 cleaned_operation_data["parenttype"] = "BOM"
                 
-                # 检查并创建不存在的 Operation
-                operation_name = cleaned_operation_data.get("operation", "").strip()
-                if operation_name and not frappe.db.exists("Operation", operation_name):
-                    try:
-                        operation_doc = frappe.get_doc({
-                            "doctype": "Operation",
-                            "operation": operation_name,
-                            "workstation": cleaned_operation_data.get("workstation")
-                        })
-                        operation_doc.insert()
-                    except Exception as e:
-                        frappe.log_error(f"Error creating Operation {operation_name}: {str(e)}", "Create Operation Error")
-                
                 bom_doc.append("operations", cleaned_operation_data)
+            
+            # 批量创建不存在的 Operation
+            provision_operations(bom_doc.operations)
         
         # 清理 Scrap Items 子表数据（如果有）
         if "scrap_items" in cleaned_bom_data and cleaned_bom_data["scrap_items"]:
@@ -1150,49 +1419,6 @@ def bulk_save_item_boms(boms_data):
         dict: 批量保存的结果，包含成功和失败的 BOM 列表及总体状态。
     """
     
-    def check_circular_reference(boms_list):
-        """检查批量BOM数据中的循环引用"""
-        print(f"=== 检查循环引用 ===")
-        
-        # 构建物料依赖关系图
-        dependency_graph = {}
-        for bom_data in boms_list:
-            item_code = bom_data.get('item')
-            if item_code and 'items' in bom_data:
-                dependency_graph[item_code] = []
-                for item in bom_data['items']:
-                    if item.get('item_code') and item.get('item_code') != item_code:
-                        dependency_graph[item_code].append(item.get('item_code'))
-        
-        print(f"依赖关系图: {dependency_graph}")
-        
-        # 检查循环引用
-        def has_cycle(node, visited, rec_stack):
-            visited[node] = True
-            rec_stack[node] = True
-            
-            for neighbor in dependency_graph.get(node, []):
-                if neighbor in dependency_graph:  # 只检查在批量数据中的物料
-                    if not visited.get(neighbor, False):
-                        if has_cycle(neighbor, visited, rec_stack):
-                            return True
-                    elif rec_stack.get(neighbor, False):
-                        return True
-            
-            rec_stack[node] = False
-            return False
-        
-        # 检查每个物料是否有循环引用
-        for item_code in dependency_graph:
-            visited = {}
-            rec_stack = {}
-            if has_cycle(item_code, visited, rec_stack):
-                print(f"发现循环引用，涉及物料: {item_code}")
-                return True
-        
-        print(f"未发现循环引用")
-        return False
-    
     print(f"=== bulk_save_item_boms 开始 ===")
     print(f"接收到的 boms_data 类型: {type(boms_data)}")
     print(f"接收到的 boms_data 内容: {boms_data}")
@@ -1216,22 +1442,37 @@ def bulk_save_item_boms(boms_data):
     print(f"=== 验证数据格式 ===")
     print(f"BOM列表长度: {len(boms_data)}")
     
-    # 检查循环引用
-    if check_circular_reference(boms_data):
+    # 依赖图：合并已有默认 BOM 做一次环检测，并得到子件在前的保存顺序
+    analysis = analyze_bom_batch(boms_data)
+    if analysis["cyclic_items"]:
         return {
             "success": False,
             "message": "检测到BOM循环引用，请检查BOM结构",
             "successful_boms": [],
-            "failed_boms": [{"error": "Circular reference detected in BOM structure"}]
+            "failed_boms": [{
+                "error": "Circular reference detected in BOM structure",
+                "items": analysis["cyclic_items"]
+            }]
         }
     
+    # 插入前用集合查询校验物料是否存在
+    missing_items = find_missing_items(boms_data)
+    
     successful_boms = []
     failed_boms = []
     
     frappe.db.begin() # 开始数据库事务
 
     try:
-        for idx, bom_data in enumerate(boms_data):
+        # 一次准备整批用到的工序
+        provision_operations(
+            operation_data
+            for bom_data in boms_data if isinstance(bom_data, dict)
+            for operation_data in bom_data.get("operations") or [] if isinstance(operation_data, dict)
+        )
+        
+        for idx in analysis["save_order"]:
+            bom_data = boms_data[idx]
             print(f"\n=== 处理第 {idx+1} 个 BOM ===")
             print(f"BOM数据: {bom_data}")
             
@@ -1246,8 +1487,7 @@ def bulk_save_item_boms(boms_data):
                 if not item_code:
                     raise frappe.ValidationError(_("Item code is required for BOM at index {0}").format(idx))
                 
-                print(f"检查物料是否存在: {item_code}")
-                if not frappe.db.exists("Item", item_code):
+                if item_code in missing_items:
                     raise frappe.DoesNotExistError(f"Item {item_code} does not exist for BOM at index {idx}")
 
                 # 清理数据
@@ -1262,7 +1502,7 @@ def bulk_save_item_boms(boms_data):
                         print(f"  检查第 {item_idx+1} 个BOM Item: {item_data.get('item_code')}")
                         if not item_data.get("item_code"):
                             raise frappe.ValidationError(_(f"Item code is required for BOM item at index {item_idx} in BOM {idx}"))
-                        if not frappe.db.exists("Item", item_data["item_code"]):
+                        if item_data["item_code"] in missing_items:
                             raise frappe.DoesNotExistError(f"Item {item_data['item_code']} does not exist for BOM item at index {item_idx} in BOM {idx}")
                 
                 # 检查BOM Operations
@@ -1313,19 +1553,6 @@ def bulk_save_item_boms(boms_data):
                         cleaned_operation_data["idx"] = op_idx
                         cleaned_operation_data["parentfield"] = "operations"
                         cleaned_operation_data["parenttype"] = "BOM"
-                        operation_name = cleaned_operation_data.get("operation", "").strip()
-                        print(f"  添加BOM Operation: {operation_name}")
-                        if operation_name and not frappe.db.exists("Operation", operation_name):
-                            try:
-                                operation_doc = frappe.get_doc({
-                                    "doctype": "Operation",
-                                    "operation": operation_name,
-                                    "workstation": cleaned_operation_data.get("workstation")
-                                })
-                                operation_doc.insert()
-                                print(f"    创建新Operation: {operation_name}")
-                            except Exception as e:
-                                frappe.log_error(f"Error creating Operation {operation_name}: {str(e)}", "Create Operation Error")
                         bom_doc.append("operations", cleaned_operation_data)
                 
                 # 处理Scrap Items
@@ -1408,7 +1635,7 @@ def bulk_save_item_boms(boms_data):
 
 def update_sales_order_item_bom_no(sales_order_no, item_code, bom_no):
     """
-    更新销售订单明细中指定物料的BOM编号
+    更新销售订单明细中指定物料的BOM编号（只更新该明细行的 bom_no，不保存整张订单）
     
     Args:
         sales_order_no (str): 销售订单号
@@ -1418,11 +1645,6 @@ def update_sales_order_item_bom_no(sales_order_no, item_code, bom_no):
     Returns:
         dict: 更新结果
     """
-    print(f"=== update_sales_order_item_bom_no 开始 ===")
-    print(f"销售订单号: {sales_order_no}")
-    print(f"物料编码: {item_code}")
-    print(f"BOM编号: {bom_no}")
-    
     if not sales_order_no:
         return {"error": "销售订单号不能为空"}
     
@@ -1434,43 +1656,23 @@ def update_sales_order_item_bom_no(sales_order_no, item_code, bom_no):
     
     try:
         # 检查销售订单是否存在
-        print(f"检查销售订单是否存在...")
         if not frappe.db.exists("Sales Order", sales_order_no):
-            print(f"销售订单不存在")
             return {"error": f"销售订单 {sales_order_no} 不存在"}
         
         # 检查BOM是否存在
-        print(f"检查BOM是否存在...")
         if not frappe.db.exists("BOM", bom_no):
-            print(f"BOM不存在")
             return {"error": f"BOM {bom_no} 不存在"}
         
-        # 获取销售订单文档
-        print(f"获取销售订单文档...")
-        sales_order_doc = frappe.get_doc("Sales Order", sales_order_no)
-        print(f"销售订单项数量: {len(sales_order_doc.items)}")
-        
-        # 查找匹配的销售订单项
-        updated_item = None
-        for i, item in enumerate(sales_order_doc.items):
-            print(f"检查第{i+1}项: {item.item_code}")
-            if item.item_code == item_code:
-                print(f"找到匹配项，当前BOM编号: {item.bom_no}")
-                # 更新BOM编号
-                item.bom_no = bom_no
-                print(f"更新BOM编号为: {bom_no}")
-                updated_item = item
-                break
-        
+        # 查找第一条匹配的销售订单项
+        updated_item = next(
+            (row for row in get_sales_order_rows([sales_order_no]) if row.item_code == item_code), None
+        )
         if not updated_item:
-            print(f"未找到匹配的物料项")
             return {"error": f"在销售订单 {sales_order_no} 中未找到物料 {item_code}"}
         
-        # 保存销售订单
-        print(f"保存销售订单...")
-        sales_order_doc.save()
+        write_row_boms({updated_item.name: bom_no})
+        frappe.clear_document_cache("Sales Order", sales_order_no)
         frappe.db.commit()
-        print(f"保存成功")
         
         return {
             "success": True,
@@ -1483,7 +1685,6 @@ def update_sales_order_item_bom_no(sales_order_no, item_code, bom_no):
         
     except Exception as e:
         frappe.db.rollback()
-        print(f"更新过程中出错: {str(e)}")
         frappe.log_error(f"更新销售订单 {sales_order_no} 中物料 {item_code} 的BOM编号时出错: {str(e)}", "Update Sales Order Item BOM Error")
         return {"error": f"更新失败: {str(e)}"}
 
@@ -1493,121 +1694,51 @@ def update_sales_order_bom(**args):
     """
     更新销售订单的 BOM 编号
     
-    使用 ERPNext 标准的 get_default_bom 方法自动填充销售订单明细的 BOM 编号
-    系统会根据物料的默认 BOM 设置自动填充空的 bom_no 字段
+    按 ERPNext 标准 get_default_bom 的规则批量解析明细物料的默认 BOM，
+    只写入有变化的明细行 bom_no，不重新保存整张销售订单
     
-    :param args: 包含 sales_order_name 的参数字典
+    :param args: 参数字典
         - sales_order_name: 销售订单编号
+        - sales_order_names: 多个销售订单编号（列表或 JSON 数组，可选）
     """
     try:
         sales_order_name = args.get("sales_order_name")
+        sales_order_names = _parse_list_arg(args.get("sales_order_names"))
         
-        if not sales_order_name:
+        if not sales_order_name and not sales_order_names:
             return {"status": "error", "message": "sales_order_name 参数不能为空"}
         
-        # 检查销售订单是否存在
-        if not frappe.db.exists("Sales Order", sales_order_name):
-            return {"status": "error", "message": f"销售订单 {sales_order_name} 不存在"}
-        
-        # 获取销售订单文档
-        so = frappe.get_doc("Sales Order", sales_order_name)
-        
-        # 记录更新前的状态
-        before_update = {item.name: item.bom_no for item in so.items}
-        
-        # 遍历销售订单明细，为每个物料设置默认 BOM
-        updated_items = []
-        for idx, item in enumerate(so.items):
-            if item.item_code:
-                # 使用 ERPNext 标准的 get_default_bom 方法获取默认 BOM
-                from erpnext.stock.get_item_details import get_default_bom
-                default_bom = get_default_bom(item.item_code)
-                
-                # 检查是否需要更新 BOM
-                if default_bom and (not item.bom_no or item.bom_no != default_bom):
-                    item.bom_no = default_bom
-                    updated_items.append({
-                        "item_code": item.item_code,
-                        "item_name": item.item_name,
-                        "bom_no": default_bom,
-                        "row_name": item.name,
-                        "previous_bom": item.bom_no  # 记录之前的 BOM
-                    })
-        
-        # 调用 validate 方法确保所有验证逻辑被执行
-        try:
-            so.validate()
-        except Exception as e:
-            frappe.log_error(frappe.get_traceback(), "validate failed")
-            raise
-
-        try:
-            # 检查文档状态
-            if so.docstatus == 1:  # 已提交状态
-                print(f"\n=== 开始更新销售订单 {so.name} 的 BOM ===")
-                
-                for item in so.items:
-                    if item.item_code:
-                        from erpnext.stock.get_item_details import get_default_bom
-                        
-                        # 记录初始状态
-                        initial_bom = item.bom_no
-                        print(f"物料: {item.item_code}")
-                        print(f"  初始 BOM: {initial_bom}")
-                        
-                        # 获取默认 BOM
-                        default_bom = get_default_bom(item.item_code)
-                        print(f"  默认 BOM: {default_bom}")
-                        
-                        if default_bom:
-                            print(f"  准备更新 BOM")
-                            
-                            # 直接使用 frappe.db.set_value 方法
-                            frappe.db.set_value(
-                                "Sales Order Item", 
-                                item.name, 
-                                "bom_no", 
-                                default_bom, 
-                                update_modified=True
-                            )
-                            
-                            # 验证更新结果
-                            updated_bom = frappe.db.get_value("Sales Order Item", item.name, "bom_no")
-                            print(f"  更新后 BOM: {updated_bom}")
-                            
-                            # 对比更新前后的变化
-                            if initial_bom != updated_bom:
-                                print(f"  BOM 已成功从 {initial_bom} 更新到 {updated_bom}")
-                            else:
-                                print(f"  ❌ BOM 更新失败，仍为 {updated_bom}")
-                
-                frappe.db.commit()
-                print("=== BOM 更新完成 ===")
-            else:
-                # 草稿状态使用正常保存
-                so.save(ignore_version=True)
-                frappe.db.commit()
-        except Exception as e:
-            frappe.log_error(frappe.get_traceback(), "save failed")
-            raise
+        names = sales_order_names or [sales_order_name]
+        existing = set(frappe.get_all("Sales Order", filters={"name": ["in", names]}, pluck="name"))
+        missing = [name for name in names if name not in existing]
+        if missing:
+            return {"status": "error", "message": f"销售订单 {', '.join(missing)} 不存在"}
         
-        # 保存后打印每个物料的 BOM 信息用于跟踪
-        after_update = {item.name: item.bom_no for item in so.items}
+        results = bind_default_boms(names)
+        frappe.db.commit()
         
-        return {
-            "status": "success", 
-            "message": f"Successfully updated BOM for Sales Order {sales_order_name}",
-            "sales_order": sales_order_name,
-            "updated_items_count": len(updated_items),
-            "updated_items": updated_items,
-            "total_items_count": len(so.items),
-            "debug_info": {
-                "before_update": before_update,
-                "after_update": after_update
+        responses = {
+            name: {
+                "status": "success",
+                "message": f"Successfully updated BOM for Sales Order {name}",
+                "sales_order": name,
+                "updated_items_count": len(result["updated_items"]),
+                "updated_items": result["updated_items"],
+                "total_items_count": len(result["rows"]),
+                "debug_info": {
+                    "before_update": result["before_update"],
+                    "after_update": result["after_update"]
+                }
             }
+            for name, result in results.items()
         }
         
+        if not sales_order_names:
+            return responses[sales_order_name]
+        return {"status": "success", "results": responses}
+        
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(frappe.get_traceback(), "update_sales_order_bom failed")
         return {"status": "error", "message": str(e)}
 
@@ -1629,25 +1760,21 @@ def check_sales_order_bom(**args):
         if not frappe.db.exists("Sales Order", sales_order):
             return {"status": "error", "message": f"销售订单 {sales_order} 不存在"}
         
-        # 获取销售订单文档
-        so = frappe.get_doc("Sales Order", sales_order)
+        rows = get_sales_order_rows([sales_order])
+        boms = resolve_item_boms(row.item_code for row in rows)
         
         items_info = []
-        for idx, item in enumerate(so.items):
-            # 获取物料的默认 BOM
-            from erpnext.stock.get_item_details import get_default_bom
-            default_bom = get_default_bom(item.item_code)
-            
-            # 获取物料主数据中的默认 BOM
-            item_default_bom = frappe.get_value("Item", item.item_code, "default_bom")
-            
+        for idx, item in enumerate(rows):
+            item_boms = boms.get(item.item_code) or {}
+            default_bom = item_boms.get("default_bom")
             items_info.append({
                 "idx": idx + 1,
                 "item_code": item.item_code,
                 "item_name": item.item_name,
                 "current_bom": item.bom_no,
-                "default_bom_from_item": item_default_bom,
+                "default_bom_from_item": item_boms.get("item_default_bom"),
                 "default_bom_from_function": default_bom,
+                "active_boms": item_boms.get("active_boms", []),
                 "has_bom": bool(item.bom_no),
                 "has_default_bom": bool(default_bom)
             })
@@ -1655,7 +1782,7 @@ def check_sales_order_bom(**args):
         return {
             "status": "success",
             "sales_order": sales_order,
-            "total_items": len(so.items),
+            "total_items": len(rows),
             "items_info": items_info
         }
         
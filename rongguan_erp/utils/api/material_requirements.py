@@ -0,0 +1,273 @@
+"""
+多 BOM 物料需求汇总（MRP 净需求）
+
+输入一个销售订单（或 (bom_no, qty) 列表）：
+1. 相同 BOM 的数量先合并，每个 BOM 只展开一次（共用 exploded_bom_cache 的单位展开缓存）
+2. 展开结果按 (物料, 仓库) 合并需求数量
+3. 一次取回所有物料的 Bin 数量（get_items_available_stock）和按仓库的待处理请购数量，计算净需求
+
+可用量 = 实际库存 - 预留数量 + 已订购数量 + 待处理请购数量
+缺口 = max(需求数量 - 可用量, 0)
+缺口行直接给出 purchase_order.create_material_request 所需的 items 格式。
+
+需求行的仓库依次取 BOM 行源仓库、warehouse 参数、物料在该公司的默认仓库、库存设置默认仓库。
+仍无法确定仓库的行按公司全部仓库合计，只用同一物料各仓库需求行用剩的可用量冲减，
+这类缺口行不进入请购明细（请购必须指定仓库），单独列在 unassigned_shortages 中。
+"""
+import json
+
+import frappe
+from frappe.utils import add_days, flt, nowdate
+
+from rongguan_erp.utils.api.items import get_items_available_stock
+from rongguan_erp.utils.api.sales_order_bom_binding import resolve_item_boms
+from rongguan_erp.utils.exploded_bom_cache import get_unit_explosion
+from rongguan_erp.utils.pending_request_qty import get_pending_request_qty_by_warehouse
+
+
+# 未指定仓库的需求行按公司下全部仓库合计
+ALL_WAREHOUSES = ""
+
+
+def _parse_flag(value):
+    """接口布尔参数："0" / "false" / 空 视为否"""
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no")
+    return bool(value)
+
+
+def _parse_bom_lines(boms):
+    """(bom_no, qty) 列表：支持 [[bom_no, qty]]、[{bom_no, qty}] 或 JSON 字符串"""
+    if isinstance(boms, str):
+        boms = json.loads(boms) if boms else []
+    lines = []
+    for line in boms or []:
+        if isinstance(line, dict):
+            lines.append({"bom_no": line.get("bom_no"), "qty": flt(line.get("qty") or 1)})
+        else:
+            lines.append({"bom_no": line[0], "qty": flt(line[1]) if len(line) > 1 else 1})
+    return lines
+
+
+def _sales_order_bom_lines(sales_order):
+    """
+    销售订单明细转换为 BOM 行：优先 custom_updated_bom_no，其次 bom_no，最后取物料默认 BOM
+
+    Returns:
+        tuple: (BOM 行列表, 没有 BOM 的明细行列表)
+    """
+    rows = frappe.get_all(
+        "Sales Order Item",
+        filters={"parent": sales_order, "parenttype": "Sales Order"},
+        fields=["name", "idx", "item_code", "stock_qty", "bom_no", "custom_updated_bom_no"],
+        order_by="idx asc"
+    )
+    default_boms = resolve_item_boms(
+        row.item_code for row in rows if not (row.custom_updated_bom_no or row.bom_no)
+    )
+
+    lines = []
+    skipped = []
+    for row in rows:
+        bom_no = row.custom_updated_bom_no or row.bom_no \
+            or (default_boms.get(row.item_code) or {}).get("default_bom")
+        if bom_no:
+            lines.append({"bom_no": bom_no, "qty": flt(row.stock_qty), "sales_order_item": row.name})
+        else:
+            skipped.append({"idx": row.idx, "item_code": row.item_code, "reason": "没有可用的BOM"})
+    return lines, skipped
+
+
+def _get_item_default_warehouses(item_codes, company):
+    """物料在公司下的默认仓库，未设置时取库存设置的默认仓库"""
+    fallback = frappe.db.get_single_value("Stock Settings", "default_warehouse")
+    warehouses = dict.fromkeys(item_codes, fallback)
+    if item_codes and company:
+        for item_code, warehouse in frappe.get_all(
+            "Item Default",
+            filters={"parent": ["in", list(item_codes)], "parenttype": "Item", "company": company},
+            fields=["parent", "default_warehouse"],
+            as_list=True
+        ):
+            warehouses[item_code] = warehouse or fallback
+    return warehouses
+
+
+def explode_requirements(lines, include_non_stock_items=True, default_warehouse=None, company=None):
+    """
+    展开 BOM 行并按 (物料, 仓库) 合并需求数量；BOM 行未指定源仓库时依次取 default_warehouse、
+    物料在 company 下的默认仓库、库存设置默认仓库
+
+    Returns:
+        tuple: ({(item_code, warehouse): 需求行}, 无效 BOM 列表)
+    """
+    qty_by_bom = {}
+    for line in lines:
+        qty_by_bom[line["bom_no"]] = qty_by_bom.get(line["bom_no"], 0) + flt(line["qty"])
+
+    boms = {
+        bom.name: bom for bom in frappe.get_all(
+            "BOM",
+            filters={"name": ["in", list(qty_by_bom)], "docstatus": 1},
+            fields=["name", "company", "modified"]
+        )
+    } if qty_by_bom else {}
+
+    exploded = []
+    invalid_boms = [bom_no for bom_no in qty_by_bom if bom_no not in boms]
+    for bom_no, bom in boms.items():
+        explosion = get_unit_explosion(bom, include_non_stock_items)
+        fields = explosion["fields"]
+        exploded.extend((bom_no, dict(zip(fields, row))) for row in explosion["rows"])
+
+    item_warehouses = {} if default_warehouse else _get_item_default_warehouses(
+        {item["item_code"] for _, item in exploded if not item.get("source_warehouse")}, company
+    )
+
+    requirements = {}
+    for bom_no, item in exploded:
+        warehouse = item.get("source_warehouse") or default_warehouse \
+            or item_warehouses.get(item["item_code"]) or ALL_WAREHOUSES
+        key = (item["item_code"], warehouse)
+        requirement = requirements.setdefault(key, {
+            "item_code": item["item_code"],
+            "item_name": item.get("item_name"),
+            "stock_uom": item.get("stock_uom"),
+            "warehouse": warehouse or None,
+            "required_qty": 0.0,
+            "boms": []
+        })
+        requirement["required_qty"] += flt(item.get("qty")) * qty_by_bom[bom_no]
+        if bom_no not in requirement["boms"]:
+            requirement["boms"].append(bom_no)
+    return requirements, invalid_boms
+
+
+def net_requirements(requirements, company):
+    """
+    按 Bin 数量与待处理请购计算每个需求行的可用量与缺口
+
+    先计算指定仓库的需求行；未指定仓库的行按公司合计的可用量，扣除同一物料各仓库需求行已占用的部分后冲减，
+    避免同一份库存被重复计算。
+    """
+    item_codes = list(dict.fromkeys(item_code for item_code, _ in requirements))
+    stock = get_items_available_stock(item_codes, None, company) if item_codes else {}
+    pending = get_pending_request_qty_by_warehouse(item_codes)
+
+    # 各物料已被指定仓库需求行占用的可用量
+    allocated = dict.fromkeys(item_codes, 0.0)
+    for (item_code, warehouse), requirement in sorted(requirements.items(), key=lambda kv: not kv[0][1]):
+        entry = stock.get(item_code) or {}
+        if warehouse:
+            qty = (entry.get("warehouses") or {}).get(warehouse) or {}
+            pending_qty = pending[item_code].get(warehouse, 0)
+        else:
+            qty = entry.get("total") or {}
+            pending_qty = sum(pending[item_code].values())
+
+        requirement.update({
+            "is_stock_item": entry.get("is_stock_item", False),
+            "actual_qty": flt(qty.get("actual_qty")),
+            "projected_qty": flt(qty.get("projected_qty")),
+            "reserved_qty": flt(qty.get("reserved_qty")),
+            "ordered_qty": flt(qty.get("ordered_qty")),
+            "pending_requested_qty": flt(pending_qty),
+        })
+        available_qty = (
+            requirement["actual_qty"] - requirement["reserved_qty"]
+            + requirement["ordered_qty"] + requirement["pending_requested_qty"]
+        )
+        if warehouse:
+            allocated[item_code] += min(requirement["required_qty"], max(available_qty, 0))
+        else:
+            available_qty -= allocated[item_code]
+        requirement["available_qty"] = available_qty
+        requirement["shortage_qty"] = max(requirement["required_qty"] - available_qty, 0)
+    return requirements
+
+
+@frappe.whitelist()
+def get_material_requirements(sales_order=None, boms=None, company=None, warehouse=None,
+                              include_non_stock_items=1, schedule_days=7):
+    """
+    汇总多个 BOM 的物料需求并按库存、在途与待处理请购计算缺口
+
+    Args:
+        sales_order: 销售订单号（与 boms 二选一）
+        boms: (bom_no, qty) 列表，如 [["BOM-001", 80], {"bom_no": "BOM-002", "qty": 20}]
+        company: 公司（默认取销售订单公司或默认公司）
+        warehouse: BOM 行未指定源仓库时使用的仓库（不传则取物料默认仓库或库存设置默认仓库）
+        include_non_stock_items: 是否包含非库存物料
+        schedule_days: 缺口请购的需求日期（今天起的天数）
+
+    Returns:
+        dict: {
+            "status": "success",
+            "data": {
+                "requirements": 每个 (物料, 仓库) 的需求、库存与缺口,
+                "shortages": 有缺口的需求行,
+                "material_request_items": 可直接传给 create_material_request 的 items,
+                "unassigned_shortages": 无法确定仓库、未生成请购明细的缺口行,
+                "skipped_rows": 没有 BOM 的销售订单明细,
+                "invalid_boms": 不存在或未提交的 BOM
+            }
+        }
+    """
+    try:
+        skipped = []
+        if sales_order:
+            if not frappe.db.exists("Sales Order", sales_order):
+                return {"status": "error", "message": f"销售订单 {sales_order} 不存在"}
+            company = company or frappe.db.get_value("Sales Order", sales_order, "company")
+            lines, skipped = _sales_order_bom_lines(sales_order)
+        elif boms:
+            lines = _parse_bom_lines(boms)
+        else:
+            return {"status": "error", "message": "sales_order 或 boms 参数不能为空"}
+
+        company = company or frappe.defaults.get_user_default("Company") \
+            or frappe.get_all("Company", limit=1)[0].name
+
+        requirements, invalid_boms = explode_requirements(
+            [line for line in lines if line["bom_no"] and line["qty"] > 0],
+            include_non_stock_items=_parse_flag(include_non_stock_items),
+            default_warehouse=warehouse,
+            company=company
+        )
+        net_requirements(requirements, company)
+
+        rows = sorted(requirements.values(), key=lambda row: (row["item_code"], row["warehouse"] or ""))
+        shortages = [row for row in rows if row["shortage_qty"] > 0]
+        schedule_date = add_days(nowdate(), int(schedule_days or 0))
+
+        return {
+            "status": "success",
+            "data": {
+                "company": company,
+                "sales_order": sales_order,
+                "requirements": rows,
+                "shortages": shortages,
+                "material_request_items": [
+                    {
+                        "item_code": row["item_code"],
+                        "qty": row["shortage_qty"],
+                        "uom": row["stock_uom"],
+                        "stock_uom": row["stock_uom"],
+                        "conversion_factor": 1,
+                        "warehouse": row["warehouse"],
+                        "schedule_date": schedule_date
+                    }
+                    for row in shortages if row["warehouse"]
+                ],
+                "unassigned_shortages": [row for row in shortages if not row["warehouse"]],
+                "skipped_rows": skipped,
+                "invalid_boms": invalid_boms
+            }
+        }
+
+    except Exception as e:
+        frappe.log_error(
+            message=f"计算物料需求时发生错误: {str(e)}",
+            title="Material Requirements Error"
+        )
+        return {"status": "error", "message": f"计算物料需求失败: {str(e)}"}
@@ -7,6 +7,7 @@ import time
 import frappe.utils # Import frappe.utils for date/time functions
 from rongguan_erp.rongguan_erp.doctype.rg_production_orders.rg_production_orders import saveRGProductionOrder
 from rongguan_erp.rongguan_erp.doctype.rg_production_orders.rg_production_orders_model import get_default_production_order_data
+from rongguan_erp.utils.item_attribute_classification import classify_items, get_attribute_tags, get_attribute_type
 
 
 def map_sales_order_to_production_order(so, items_data):
@@ -551,18 +552,9 @@ def get_sales_order_detail(sales_order_number):
             enriched_attributes = []
             for attr_item in attributes:
                 attr_name = attr_item.get("attribute")
-                item_attribute_doc = frappe.get_doc("Item Attribute", attr_name)
-                user_tags = (item_attribute_doc.get("_user_tags") or "") if item_attribute_doc else ""
-
-                # 仅通过 Item Attribute 的 _user_tags 判定：含「颜色」为颜色，含「尺寸」为尺码
-                if "颜色" in user_tags:
-                    attr_item["attribute_type"] = "color"
-                elif "尺寸" in user_tags:
-                    attr_item["attribute_type"] = "size"
-                else:
-                    attr_item["attribute_type"] = ""
-
-                attr_item["_user_tags"] = user_tags
+                # 仅通过 Item Attribute 的 _user_tags 判定：含「颜色」为颜色，含「尺寸」为尺码（走属性分类缓存）
+                attr_item["attribute_type"] = get_attribute_type(attr_name)
+                attr_item["_user_tags"] = get_attribute_tags(attr_name)
                 enriched_attributes.append(attr_item)
 
             item_dict["attributes"] = enriched_attributes
@@ -633,24 +625,12 @@ def get_style_and_items_by_sales_order(sales_order_name):
         filters={"parent": sales_order_name},
         fields=["item_code", "uom", "qty", "bom_no"]
     )
+    # 一次性获取所有物料的属性（颜色、尺码）
+    item_attributes = classify_items([oi["item_code"] for oi in order_items])
     items = []
     for oi in order_items:
         item_doc = frappe.get_doc("Item", oi["item_code"])
-        # 获取属性（如颜色、尺码）
-        attributes = frappe.get_all(
-            "Item Variant Attribute",
-            filters={"parent": oi["item_code"]},
-            fields=["attribute", "attribute_value"]
-        )
-        color = ""
-        size = ""
-        for attr in attributes:
-            # 查 tabItem Attribute 的 _user_tags
-            user_tags = frappe.db.get_value("Item Attribute", attr["attribute"], "_user_tags") or ""
-            if "颜色" in user_tags:
-                color = attr["attribute_value"]
-            if "尺寸" in user_tags:
-                size = attr["attribute_value"]
+        color, size = item_attributes.get(oi["item_code"], ("", ""))
         # 获取价格
         price = frappe.db.get_value("Item Price", {"item_code": oi["item_code"]}, "price_list_rate") or 0
         # 获取库存
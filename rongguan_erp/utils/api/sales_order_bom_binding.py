@@ -0,0 +1,134 @@
+"""
+销售订单明细的 BOM 绑定
+
+一个或多个销售订单的所有明细行一次读出，行上物料（及其模板物料）的启用 BOM 用一条查询取回，
+按 ERPNext get_default_bom 的规则确定默认 BOM：物料自身的默认 BOM 优先，没有时取模板物料的默认 BOM。
+需要变更的行按目标 BOM 分组，每组一条 UPDATE 只写 bom_no / custom_updated_bom_no，
+不加载、不保存整张销售订单。
+"""
+import frappe
+
+
+BINDABLE_BOM_FIELDS = ("bom_no", "custom_updated_bom_no")
+
+
+def _distinct(values):
+    """去重并去掉空值，保持原有顺序"""
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def get_sales_order_rows(sales_order_names):
+    """一条查询读取销售订单明细行（按订单、行号排序）"""
+    if not sales_order_names:
+        return []
+    return frappe.get_all(
+        "Sales Order Item",
+        filters={"parent": ["in", list(sales_order_names)], "parenttype": "Sales Order"},
+        fields=["name", "parent", "idx", "item_code", "item_name", "bom_no", "custom_updated_bom_no"],
+        order_by="parent asc, idx asc",
+        limit_page_length=0
+    )
+
+
+def resolve_item_boms(item_codes):
+    """
+    批量解析物料的默认 BOM 与启用 BOM
+
+    Returns:
+        dict: {item_code: {
+            "default_bom": 按 get_default_bom 规则得到的默认 BOM,
+            "item_default_bom": 物料主数据上的 default_bom,
+            "active_boms": 物料自身已提交且启用的 BOM 列表
+        }}
+    """
+    item_codes = _distinct(item_codes)
+    if not item_codes:
+        return {}
+
+    items = {
+        row.name: row for row in frappe.get_all(
+            "Item", filters={"name": ["in", item_codes]}, fields=["name", "variant_of", "default_bom"]
+        )
+    }
+    bom_items = _distinct(item_codes + [row.variant_of for row in items.values()])
+
+    default_boms = {}
+    active_boms = {}
+    for bom in frappe.get_all(
+        "BOM",
+        filters={"item": ["in", bom_items], "is_active": 1, "docstatus": 1},
+        fields=["name", "item", "is_default"],
+        order_by="modified desc",
+        limit_page_length=0
+    ):
+        active_boms.setdefault(bom.item, []).append(bom.name)
+        if bom.is_default:
+            default_boms.setdefault(bom.item, bom.name)
+
+    result = {}
+    for item_code in item_codes:
+        item = items.get(item_code) or frappe._dict()
+        result[item_code] = {
+            "default_bom": default_boms.get(item_code) or default_boms.get(item.variant_of),
+            "item_default_bom": item.default_bom,
+            "active_boms": active_boms.get(item_code, []),
+        }
+    return result
+
+
+def write_row_boms(changes, field="bom_no"):
+    """
+    按目标 BOM 分组写入明细行的 BOM 字段，每组一条 UPDATE
+
+    Args:
+        changes: {明细行 name: BOM}
+        field: bom_no 或 custom_updated_bom_no
+    """
+    if field not in BINDABLE_BOM_FIELDS:
+        frappe.throw(f"不支持的 BOM 字段: {field}")
+
+    rows_by_bom = {}
+    for row_name, bom_no in changes.items():
+        rows_by_bom.setdefault(bom_no, []).append(row_name)
+    for bom_no, row_names in rows_by_bom.items():
+        frappe.db.set_value("Sales Order Item", {"name": ["in", row_names]}, field, bom_no)
+
+
+def bind_default_boms(sales_order_names, field="bom_no"):
+    """
+    把一个或多个销售订单明细行的 BOM 字段更新为物料的默认 BOM
+
+    Returns:
+        dict: {销售订单: {"rows", "updated_items", "before_update", "after_update"}}
+    """
+    rows = get_sales_order_rows(sales_order_names)
+    boms = resolve_item_boms(row.item_code for row in rows)
+
+    results = {
+        name: {"rows": [], "updated_items": [], "before_update": {}, "after_update": {}}
+        for name in sales_order_names
+    }
+    changes = {}
+    for row in rows:
+        result = results[row.parent]
+        result["rows"].append(row)
+        current = row.get(field)
+        result["before_update"][row.name] = current
+
+        default_bom = (boms.get(row.item_code) or {}).get("default_bom")
+        if default_bom and current != default_bom:
+            changes[row.name] = default_bom
+            result["updated_items"].append({
+                "item_code": row.item_code,
+                "item_name": row.item_name,
+                "bom_no": default_bom,
+                "row_name": row.name,
+                "previous_bom": current
+            })
+        result["after_update"][row.name] = changes.get(row.name, current)
+
+    write_row_boms(changes, field)
+    for name, result in results.items():
+        if result["updated_items"]:
+            frappe.clear_document_cache("Sales Order", name)
+    return results
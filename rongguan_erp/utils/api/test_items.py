@@ -1,7 +1,16 @@
 import frappe
 import json
+import time
 import unittest
-from rongguan_erp.utils.api.items import get_item_color_values
+from rongguan_erp.utils.api.items import (
+    get_item_available_stock,
+    get_item_color_values,
+    get_item_rate_info,
+    get_items_available_stock,
+    get_items_rate_info,
+    get_items_with_attributes
+)
+from rongguan_erp.utils.item_attribute_classification import get_color_attributes, get_size_attributes
 from pathlib import Path
 
 # bench run-tests --module rongguan_erp.utils.api.test_items
@@ -37,5 +46,110 @@ class TestItems(unittest.TestCase):
         self.assertIn("color_attributes", result)
         print("✅ 颜色属性值获取成功:", result)
 
+    def test_get_items_available_stock_matches_single(self):
+        """批量库存矩阵与单物料接口结果一致"""
+        item_codes = frappe.get_all("Item", filters={"is_stock_item": 1}, pluck="name", limit=5)
+        matrix = get_items_available_stock(item_codes)
+        for item_code in item_codes:
+            single = get_item_available_stock(item_code)
+            entry = matrix[item_code]
+            self.assertEqual(single["stock_info"]["actual_qty"], entry["total"]["actual_qty"])
+            self.assertEqual(single["stock_info"]["requested_qty"], entry["requested_qty"])
+
+    def test_get_items_rate_info_matches_single(self):
+        """批量取价与逐个取价结果一致"""
+        item_codes = frappe.get_all("Item", filters={"is_stock_item": 1}, pluck="name", limit=10)
+        warehouse = frappe.db.get_value("Bin", {"item_code": ["in", item_codes]}, "warehouse") if item_codes else None
+        price_list = frappe.db.get_value("Item Price", {"buying": 1}, "price_list")
+        cases = [
+            {"rm_cost_as_per": "Valuation Rate"},
+            {"rm_cost_as_per": "Last Purchase Rate"},
+            {"rm_cost_as_per": "Valuation Rate", "warehouse": warehouse},
+        ]
+        if price_list:
+            price_items = frappe.get_all("Item Price", filters={"price_list": price_list}, pluck="item_code", limit=10)
+            cases.append({"rm_cost_as_per": "Price List", "buying_price_list": price_list, "item_codes": price_items})
+
+        for case in cases:
+            codes = case.pop("item_codes", item_codes)
+            rates = get_items_rate_info(codes, **case)
+            for item_code in codes:
+                single = get_item_rate_info(item_code, **case)
+                self.assertAlmostEqual(rates[item_code]["rate"], single["rate"], msg=f"{case} {item_code}")
+
+
+BENCHMARK_ITEM_PREFIX = "RGBENCH-"
+
+
+def _insert_benchmark_items(count):
+    """批量插入 count 个带颜色/尺码变体属性的物料（直接写表，调用方负责回滚）"""
+    color_attribute = (get_color_attributes() or [None])[0]
+    size_attribute = (get_size_attributes() or [None])[0]
+    item_group = frappe.db.get_value("Item Group", {"is_group": 0}, "name")
+    now = frappe.utils.now()
+    user = frappe.session.user
+
+    items = []
+    attributes = []
+    for i in range(count):
+        item_code = f"{BENCHMARK_ITEM_PREFIX}{i:06d}"
+        items.append((item_code, item_code, item_code, item_group, "Nos", 1, now, now, user, user))
+        for idx, (attribute, value) in enumerate(
+            ((color_attribute, f"C{i % 12}"), (size_attribute, f"S{i % 6}")), start=1
+        ):
+            if attribute:
+                attributes.append((
+                    frappe.generate_hash(length=10), item_code, "attributes", "Item", idx,
+                    attribute, value, now, now, user, user
+                ))
+
+    frappe.db.bulk_insert(
+        "Item",
+        ["name", "item_code", "item_name", "item_group", "stock_uom", "is_stock_item",
+         "creation", "modified", "owner", "modified_by"],
+        items
+    )
+    frappe.db.bulk_insert(
+        "Item Variant Attribute",
+        ["name", "parent", "parentfield", "parenttype", "idx", "attribute", "attribute_value",
+         "creation", "modified", "owner", "modified_by"],
+        attributes
+    )
+
+
+# bench --site site1.local execute rongguan_erp.utils.api.test_items.benchmark_get_items_with_attributes --kwargs '{"count": 20000}'
+def benchmark_get_items_with_attributes(count=20000, full_doc_sample=500):
+    """
+    get_items_with_attributes 基准：插入 count 个物料后分别测投影模式与完整文档模式，结束后回滚
+    完整文档模式逐个 get_doc，只取 full_doc_sample 个物料计时并按比例折算
+    """
+    count = int(count)
+    full_doc_sample = int(full_doc_sample)
+    filters = {"name": ["like", f"{BENCHMARK_ITEM_PREFIX}%"]}
+
+    frappe.db.savepoint("benchmark_items")
+    try:
+        _insert_benchmark_items(count)
+
+        start = time.perf_counter()
+        items = get_items_with_attributes(filters=filters)
+        projection_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        get_items_with_attributes(filters=filters, limit_page_length=full_doc_sample, full_doc=1)
+        full_doc_seconds = time.perf_counter() - start
+    finally:
+        frappe.db.rollback(save_point="benchmark_items")
+
+    stats = {
+        "items": len(items),
+        "projection_seconds": round(projection_seconds, 3),
+        "full_doc_sample": full_doc_sample,
+        "full_doc_sample_seconds": round(full_doc_seconds, 3),
+        "full_doc_estimated_seconds": round(full_doc_seconds * count / max(full_doc_sample, 1), 1),
+    }
+    return stats
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,32 @@
+import time
+from unittest.mock import patch
+
 import frappe
-from rongguan_erp.utils.api.work_order import batch_assign_work_orders
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, now_datetime
+from rongguan_erp.utils.api.work_order import (
+    BATCH_JOB_TIMEOUT,
+    _complete_work_order_chunk,
+    _complete_work_orders,
+    _create_work_orders_without_transaction,
+    _get_complete_job_cache_key,
+    _get_batch_job_progress,
+    _is_batch_job_resumable,
+    _set_batch_job_progress,
+    batch_assign_work_orders,
+    convert_employee_inputs_to_user_ids,
+    get_complete_work_orders_status,
+    get_work_order_job_cards,
+    get_work_order_list,
+    get_work_orders_job_card_summary
+)
+from rongguan_erp.utils.api.work_order_assignment import bulk_assign_documents
+from rongguan_erp.utils.api.work_order_export import _iter_ndjson, build_export_query
+from rongguan_erp.utils.api.work_order_pipeline import (
+    BomExplosionCache,
+    apply_bom_explosion,
+    prevalidate_work_orders
+)
 
 
 @frappe.whitelist()
@@ -29,3 +56,367 @@ def test_batch_assign_specific_work_order():
         },
         'result': result
     }
+
+
+# bench --site site1.local run-tests --module rongguan_erp.utils.api.test_work_order
+class TestWorkOrderListQueryBudget(FrappeTestCase):
+    """get_work_order_list 的查询数应为常量，与页大小无关"""
+
+    # 列表 + 总数 + 工单主表 + 工单子表 + 分配 + 纸样单(主表+子表) + Job Card + Job Card 子表
+    QUERY_BUDGET = 20
+
+    def setUp(self):
+        # 预热 meta 缓存，避免首次加载 DocType 元数据的查询计入预算
+        get_work_order_list(page=1, page_size=1, expand='all')
+
+    def test_query_count_is_constant_per_page(self):
+        for page_size in (5, 50):
+            with self.assertQueryCount(self.QUERY_BUDGET):
+                result = get_work_order_list(page=1, page_size=page_size, expand='all')
+            self.assertEqual(result.get('status'), 'success')
+
+    def test_rows_are_fully_hydrated(self):
+        result = get_work_order_list(page=1, page_size=5, expand='all')
+        for work_order in result['data']['work_orders']:
+            self.assertIn('sub_tables', work_order)
+            self.assertIn('assignments', work_order['sub_tables'])
+            self.assertIn('job_cards', work_order['sub_tables'])
+            self.assertIn('_assign', work_order)
+
+
+class TestWorkOrderListExpand(FrappeTestCase):
+    """get_work_order_list 默认只返回主表字段，关联数据按 expand 按需加载"""
+
+    def test_default_list_shape_has_no_sub_tables(self):
+        with self.assertQueryCount(2):
+            result = get_work_order_list(page=1, page_size=20)
+        for work_order in result['data']['work_orders']:
+            self.assertNotIn('sub_tables', work_order)
+
+    def test_expand_only_loads_requested_keys(self):
+        result = get_work_order_list(
+            page=1, page_size=5,
+            expand='required_items,job_cards.time_logs',
+            child_fields={'required_items': ['item_code', 'required_qty']}
+        )
+        for work_order in result['data']['work_orders']:
+            self.assertEqual(set(work_order['sub_tables']), {'required_items', 'job_cards'})
+            for item in work_order['sub_tables']['required_items']:
+                self.assertEqual(set(item), {'item_code', 'required_qty'})
+            for job_card in work_order['sub_tables']['job_cards']:
+                self.assertTrue(set(job_card['sub_tables']) <= {'time_logs'})
+
+
+class TestEmployeeDirectory(FrappeTestCase):
+    """员工ID批量转换用户ID的查询数应与批量大小无关"""
+
+    def test_batch_resolution_is_constant_queries(self):
+        employees = frappe.get_all('Employee', filters={'user_id': ['is', 'set']}, pluck='name', limit=50)
+        users = frappe.get_all('User', filters={'name': ['like', '%@%']}, pluck='name', limit=1)
+        convert_employee_inputs_to_user_ids([employees[:1]])  # 预热缓存
+        with self.assertQueryCount(2):
+            results = convert_employee_inputs_to_user_ids([[emp] for emp in employees] + [users])
+        self.assertEqual(len(results), len(employees) + 1)
+        self.assertEqual(results[-1], users)
+
+
+def _make_benchmark_rows(count, bom_count):
+    """按 BOM 轮流生成工单数据（只用已提交、启用的默认 BOM）"""
+    boms = frappe.get_all(
+        'BOM',
+        filters={'docstatus': 1, 'is_active': 1, 'is_default': 1},
+        fields=['name', 'item', 'company'],
+        order_by='modified desc',
+        limit=bom_count
+    )
+    if not boms:
+        return boms, []
+    settings = frappe.get_cached_doc('Manufacturing Settings')
+    rows = []
+    for i in range(count):
+        bom = boms[i % len(boms)]
+        rows.append({
+            'production_item': bom.item,
+            'bom_no': bom.name,
+            'company': bom.company,
+            'qty': 1 + i % 5,
+            'fg_warehouse': settings.default_fg_warehouse,
+            'wip_warehouse': settings.default_wip_warehouse,
+            'description': f'批量创建基准测试 {i + 1}'
+        })
+    return boms, rows
+
+
+def benchmark_batch_create_work_orders(count=1000, bom_count=20):
+    """
+    批量创建工单的吞吐基准：count 个工单轮流使用 bom_count 个 BOM，结束后回滚
+
+    bench --site site1.local execute rongguan_erp.utils.api.test_work_order.benchmark_batch_create_work_orders
+    """
+    count = int(count)
+    boms, rows = _make_benchmark_rows(count, int(bom_count))
+    if not boms:
+        return {'status': 'error', 'message': '没有可用的已提交默认BOM'}
+
+    save_point = 'benchmark_batch_create_work_orders'
+    frappe.db.savepoint(save_point)
+    try:
+        start = time.perf_counter()
+        validation_errors = prevalidate_work_orders(rows)
+        prevalidate_seconds = time.perf_counter() - start
+
+        result = _create_work_orders_without_transaction(rows)
+        total_seconds = time.perf_counter() - start
+    finally:
+        frappe.db.rollback(save_point=save_point)
+
+    stats = {
+        'status': result.get('status'),
+        'work_orders': count,
+        'boms': len(boms),
+        'validation_errors': validation_errors[:10],
+        'prevalidate_seconds': round(prevalidate_seconds, 3),
+        'total_seconds': round(total_seconds, 3),
+        'work_orders_per_second': round(count / total_seconds, 1) if total_seconds else None
+    }
+    return stats
+
+
+class TestWorkOrderPrevalidation(FrappeTestCase):
+    """批量创建工单前的集合预校验"""
+
+    def test_invalid_links_are_reported_per_row(self):
+        boms, rows = _make_benchmark_rows(2, 1)
+        if not boms:
+            self.skipTest('没有可用的已提交默认BOM')
+        rows[1].update({
+            'bom_no': 'BOM-NOT-EXISTS',
+            'fg_warehouse': 'Warehouse Not Exists',
+            'operations': [{'operation': 'Operation Not Exists'}]
+        })
+        errors = prevalidate_work_orders(rows)
+        self.assertFalse([e for e in errors if e.startswith('第1个工单')])
+        self.assertTrue(any('BOM不存在' in e for e in errors))
+        self.assertTrue(any('成品仓库不存在' in e for e in errors))
+        self.assertTrue(any('工序不存在' in e for e in errors))
+
+    def test_query_count_is_constant(self):
+        boms, rows = _make_benchmark_rows(200, 20)
+        if not boms:
+            self.skipTest('没有可用的已提交默认BOM')
+        # 物料、BOM、公司、仓库（无工序与销售订单时不查询）
+        with self.assertQueryCount(4):
+            prevalidate_work_orders(rows)
+
+
+class TestBomExplosionCache(FrappeTestCase):
+    """批次内 BOM 展开结果显式传入每个工单，不替换 ERPNext 模块函数"""
+
+    def test_required_items_match_bom_explosion(self):
+        from erpnext.manufacturing.doctype.bom.bom import get_bom_items_as_dict
+
+        boms, rows = _make_benchmark_rows(2, 1)
+        if not boms:
+            self.skipTest('没有可用的已提交默认BOM')
+
+        explosion_cache = BomExplosionCache()
+        for row in rows:
+            work_order = frappe.new_doc('Work Order')
+            work_order.update(row)
+            apply_bom_explosion(work_order, explosion_cache)
+
+            expected = get_bom_items_as_dict(row['bom_no'], row['company'], qty=row['qty'], fetch_exploded=1)
+            self.assertEqual(
+                {d.item_code: d.required_qty for d in work_order.required_items},
+                {item_code: item.qty for item_code, item in expected.items()}
+            )
+
+
+class TestBulkAssignment(FrappeTestCase):
+    """批量分配：ToDo 批量插入，_assign 每批一条 UPDATE"""
+
+    def test_bulk_assign_writes_todos_and_assign_column(self):
+        names = frappe.get_all('Work Order', filters={'docstatus': 0}, pluck='name', limit=30)
+        users = frappe.get_all('User', filters={'name': ['like', '%@%'], 'enabled': 1}, pluck='name', limit=1)
+        if not names or not users:
+            self.skipTest('没有草稿工单或可分配的用户')
+
+        assignments = [
+            {'name': name, 'users': users, 'description': f'工单 {name} 已分配给您', 'priority': 'Medium'}
+            for name in names
+        ]
+        results = bulk_assign_documents('Work Order', assignments)
+
+        for name in names:
+            self.assertEqual(results[name]['status'], 'success')
+            self.assertIn(users[0], frappe.parse_json(frappe.db.get_value('Work Order', name, '_assign')))
+            self.assertEqual(frappe.db.count('ToDo', {
+                'reference_type': 'Work Order', 'reference_name': name,
+                'allocated_to': users[0], 'status': 'Open'
+            }), 1)
+
+        # 重复分配不会产生重复的 ToDo
+        bulk_assign_documents('Work Order', assignments)
+        self.assertEqual(frappe.db.count('ToDo', {
+            'reference_type': 'Work Order', 'reference_name': names[0],
+            'allocated_to': users[0], 'status': 'Open'
+        }), 1)
+
+
+class TestJobCardSummary(FrappeTestCase):
+    """Job Card 汇总模式与明细模式结果一致，且只发一条聚合查询"""
+
+    def test_summary_matches_detail(self):
+        work_orders = frappe.get_all('Job Card', fields=['work_order'], distinct=True, pluck='work_order', limit=5)
+        if not work_orders:
+            self.skipTest('没有 Job Card')
+        for work_order in work_orders:
+            detail = get_work_order_job_cards(work_order)['summary']
+            summary = get_work_order_job_cards(work_order, summary_only=1)['summary']
+            self.assertEqual(summary['status_counts'], detail['status_counts'])
+            self.assertAlmostEqual(summary['total_completed_qty'], detail['total_completed_qty'])
+            self.assertAlmostEqual(summary['total_time_in_mins'], detail['total_time_in_mins'])
+
+    def test_many_work_orders_in_one_query(self):
+        work_orders = frappe.get_all('Work Order', pluck='name', limit=200)
+        if not work_orders:
+            self.skipTest('没有工单')
+        with self.assertQueryCount(1):
+            result = get_work_orders_job_card_summary(work_orders)
+        self.assertEqual(set(result['data']), set(work_orders))
+
+
+class TestWorkOrderExport(FrappeTestCase):
+    """流式导出：每个工单一行 NDJSON，Job Card 数与明细一致"""
+
+    def test_ndjson_groups_job_cards_per_work_order(self):
+        query, work_order_fields, job_card_fields = build_export_query(filters={'docstatus': 1})
+        rows = frappe.db.sql(query, as_dict=True)
+        lines = [frappe.parse_json(line) for line in _iter_ndjson(iter(rows), work_order_fields, job_card_fields)]
+
+        names = [line['name'] for line in lines]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(len(names), frappe.db.count('Work Order', {'docstatus': 1}))
+        for line in lines[:20]:
+            self.assertEqual(len(line['job_cards']), frappe.db.count('Job Card', {'work_order': line['name']}))
+
+
+class TestBatchSaveJobResume(FrappeTestCase):
+    """后台批量保存：进度随事务写库，失败或超时的任务可重新入队"""
+
+    def test_progress_is_read_from_database(self):
+        state = {
+            'processed_count': 20,
+            'created_work_orders': [{'index': 1, 'work_order_name': 'MFG-WO-TEST-00001'}],
+            'failed_rows': []
+        }
+        _set_batch_job_progress('_test_resume', state)
+        self.assertEqual(_get_batch_job_progress('_test_resume'), state)
+
+    def test_failed_or_stale_jobs_are_resumable(self):
+        fresh = str(now_datetime())
+        stale = str(add_to_date(now_datetime(), seconds=-(BATCH_JOB_TIMEOUT + 60)))
+        self.assertTrue(_is_batch_job_resumable({'status': 'failed', 'updated_at': fresh}))
+        self.assertTrue(_is_batch_job_resumable({'status': 'running', 'updated_at': stale}))
+        self.assertFalse(_is_batch_job_resumable({'status': 'running', 'updated_at': fresh}))
+        self.assertFalse(_is_batch_job_resumable({'status': 'completed', 'updated_at': stale}))
+
+
+def _fake_manufacture_entry(failing=()):
+    """替代 _make_manufacture_entry：不生成库存单据，failing 中的工单抛出异常"""
+    calls = []
+
+    def make(work_order_id, qty):
+        calls.append(work_order_id)
+        if work_order_id in failing:
+            raise Exception(f'{work_order_id} 完工失败')
+        return f'STE-{work_order_id}'
+
+    return make, calls
+
+
+class TestCompleteWorkOrders(FrappeTestCase):
+    """批量完工：逐行校验、保持输入顺序、整块失败时逐行重试"""
+
+    def setUp(self):
+        # 不生成真实库存单据，也不提交测试事务或触发库存重估
+        for target in ('frappe.db.commit', 'frappe.enqueue'):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _open_work_orders(self, limit):
+        return frappe.get_all(
+            'Work Order',
+            filters={'docstatus': 1, 'status': ['!=', 'Completed']},
+            pluck='name',
+            limit=limit
+        )
+
+    def test_rows_are_validated(self):
+        open_work_orders = self._open_work_orders(1)
+        if not open_work_orders:
+            self.skipTest('没有已提交且未完成的工单')
+        draft = frappe.db.get_value('Work Order', {'docstatus': 0}, 'name')
+        completed = frappe.db.get_value('Work Order', {'docstatus': 1, 'status': 'Completed'}, 'name')
+
+        items = [('WO-NOT-EXISTS', 1), (open_work_orders[0], 0), (None, 1)]
+        if draft:
+            items.append((draft, 1))
+        if completed:
+            items.append((completed, 1))
+
+        make, calls = _fake_manufacture_entry()
+        with patch('rongguan_erp.utils.api.work_order._make_manufacture_entry', make):
+            results = _complete_work_orders(items)
+
+        self.assertEqual(calls, [])
+        self.assertTrue(all(r['status'] == 'error' for r in results))
+        messages = [r['message'] for r in results]
+        self.assertIn('不存在', messages[0])
+        self.assertIn('必须大于0', messages[1])
+        self.assertIn('不能为空', messages[2])
+        if draft:
+            self.assertIn('未提交', messages[3])
+        if completed:
+            self.assertIn('已完成', messages[-1])
+
+    def test_results_keep_input_order_across_groups(self):
+        open_work_orders = self._open_work_orders(6)
+        if len(open_work_orders) < 2:
+            self.skipTest('已提交且未完成的工单不足')
+        items = [(name, 1) for name in reversed(open_work_orders)]
+        items.insert(1, ('WO-NOT-EXISTS', 1))
+
+        make, _calls = _fake_manufacture_entry()
+        with patch('rongguan_erp.utils.api.work_order._make_manufacture_entry', make):
+            results = _complete_work_orders(items, chunk_size=2)
+
+        self.assertEqual([r['index'] for r in results], list(range(1, len(items) + 1)))
+        self.assertEqual([r['work_order_id'] for r in results], [wo for wo, _qty in items])
+        self.assertEqual(results[1]['status'], 'error')
+
+    def test_failing_row_falls_back_to_row_savepoints(self):
+        chunk = [(1, 'WO-A', 1), (2, 'WO-BAD', 1), (3, 'WO-C', 1)]
+        make, calls = _fake_manufacture_entry(failing={'WO-BAD'})
+        with patch('rongguan_erp.utils.api.work_order._make_manufacture_entry', make):
+            results = _complete_work_order_chunk(chunk)
+
+        # 整块在 WO-BAD 处失败回滚，随后逐行重试
+        self.assertEqual(calls, ['WO-A', 'WO-BAD', 'WO-A', 'WO-BAD', 'WO-C'])
+        self.assertEqual([r['status'] for r in results], ['success', 'error', 'success'])
+        self.assertEqual(results[0]['stock_entry'], 'STE-WO-A')
+        self.assertIn('WO-BAD 完工失败', results[1]['message'])
+
+    def test_status_is_visible_to_owner_only(self):
+        job_key = frappe.generate_hash(length=16)
+        frappe.cache().set_value(_get_complete_job_cache_key(job_key), {
+            'status': 'running', 'job_key': job_key, 'owner': 'Administrator'
+        })
+        self.addCleanup(frappe.cache().delete_value, _get_complete_job_cache_key(job_key))
+
+        self.assertEqual(get_complete_work_orders_status(job_key)['status'], 'running')
+
+        frappe.set_user('Guest')
+        self.addCleanup(frappe.set_user, 'Administrator')
+        self.assertRaises(frappe.PermissionError, get_complete_work_orders_status, job_key)
@@ -1,8 +1,45 @@
 import frappe
 from frappe import _
-from frappe.utils import nowdate, get_datetime, flt
+from frappe.utils import nowdate, get_datetime, flt, cint, now_datetime, time_diff_in_seconds
 import json
+import hashlib
 from erpnext.manufacturing.doctype.work_order.work_order import make_stock_entry
+from rongguan_erp.utils.employee_directory import resolve_user_id_lists
+from rongguan_erp.utils.api.work_order_pipeline import BomExplosionCache, apply_bom_explosion, prevalidate_work_orders
+from rongguan_erp.utils.api.work_order_assignment import bulk_assign_documents, submit_documents_grouped
+from rongguan_erp.utils.pagination import (
+    InvalidCursorError,
+    cached_count,
+    keyset_get_all,
+    next_cursor_for,
+    parse_order_by
+)
+from rongguan_erp.utils.api.work_order_hydration import (
+    STANDARD_FIELDS,
+    expand_work_orders,
+    parse_child_fields,
+    parse_expand,
+    summarize_job_cards
+)
+
+
+# 超过该数量的批量保存自动转为后台任务
+ASYNC_BATCH_THRESHOLD = 50
+# 后台任务每次提交的工单数
+BATCH_JOB_CHUNK_SIZE = 20
+BATCH_JOB_TIMEOUT = 3600
+# 任务状态在缓存中的保留时间（秒）
+BATCH_JOB_TTL = 24 * 60 * 60
+BATCH_JOB_CACHE_PREFIX = 'rg_batch_save_work_orders:'
+BATCH_JOB_PROGRESS_EVENT = 'rg_batch_save_work_orders_progress'
+# 与每块工单同事务提交的任务进度
+BATCH_JOB_PROGRESS_DOCTYPE = 'RG Batch Job Progress'
+# 批量完工每次提交的工单数
+COMPLETE_CHUNK_SIZE = 10
+COMPLETE_JOB_CACHE_PREFIX = 'rg_complete_work_orders:'
+COMPLETE_JOB_PROGRESS_EVENT = 'rg_complete_work_orders_progress'
+# 批量 Job Card 汇总一次最多查询的工单数
+JOB_CARD_SUMMARY_MAX_WORK_ORDERS = 1000
 
 
 def convert_employee_to_user_id(employee_input):
@@ -15,45 +52,26 @@ def convert_employee_to_user_id(employee_input):
     Returns:
         list: 用户ID列表
     """
-    if not employee_input:
-        return []
-    
-    # 处理输入格式
-    if isinstance(employee_input, str):
-        try:
-            # 尝试解析JSON字符串
-            employee_list = json.loads(employee_input)
-            if not isinstance(employee_list, list):
-                employee_list = [employee_input]
-        except (json.JSONDecodeError, TypeError):
-            # 如果不是JSON，则作为单个员工ID处理
-            employee_list = [employee_input]
-    elif isinstance(employee_input, list):
-        employee_list = employee_input
-    else:
-        employee_list = [str(employee_input)]
-    
-    user_ids = []
+    return convert_employee_inputs_to_user_ids([employee_input])[0]
+
+
+def convert_employee_inputs_to_user_ids(employee_inputs):
+    """
+    批量将多组员工ID/用户ID转换为用户ID，整批只需常数次查询
     
-    for emp_id in employee_list:
-        emp_id = str(emp_id).strip()
-        if not emp_id:
-            continue
-            
-        # 首先检查是否已经是用户ID（邮箱格式）
-        if '@' in emp_id and frappe.db.exists('User', emp_id):
-            user_ids.append(emp_id)
-            continue
+    Args:
+        employee_inputs: 输入列表，每个元素格式同 convert_employee_to_user_id 的参数
         
-        # 检查是否是员工ID，获取对应的用户ID
-        user_id = frappe.db.get_value('Employee', emp_id, 'user_id')
-        if user_id:
-            user_ids.append(user_id)
-        else:
+    Returns:
+        list: 与输入一一对应的用户ID列表
+    """
+    results = []
+    for user_ids, unresolved in resolve_user_id_lists(employee_inputs):
+        for emp_id in unresolved:
             # 如果找不到对应的用户ID，记录错误但继续处理其他员工
             frappe.log_error(f"员工 {emp_id} 没有关联的用户ID", "Employee to User ID Conversion")
-    
-    return user_ids
+        results.append(user_ids)
+    return results
 
 
 def _create_work_orders_without_transaction(work_orders_data):
@@ -85,6 +103,15 @@ def _create_work_orders_without_transaction(work_orders_data):
     required_fields = ['production_item', 'qty', 'company', 'bom_no']
     validation_errors = []
     
+    # 一次性转换整批工单的分配对象（员工ID -> 用户ID），目录服务只返回存在的用户
+    try:
+        assigned_user_ids = convert_employee_inputs_to_user_ids(
+            [work_order_data.get('assign_to') for work_order_data in work_orders_data]
+        )
+    except Exception as e:
+        assigned_user_ids = [[] for _ in work_orders_data]
+        validation_errors.append(f'分配对象转换失败: {str(e)}')
+    
     for i, work_order_data in enumerate(work_orders_data):
         for field in required_fields:
             if not work_order_data.get(field):
@@ -92,19 +119,8 @@ def _create_work_orders_without_transaction(work_orders_data):
         
         # 验证分配员工/用户是否存在（如果有分配）
         assign_to = work_order_data.get('assign_to')
-        if assign_to:
-            try:
-                # 转换员工ID为用户ID
-                user_ids = convert_employee_to_user_id(assign_to)
-                if not user_ids:
-                    validation_errors.append(f'第{i+1}个工单的分配对象无效或找不到对应用户: {assign_to}')
-                else:
-                    # 验证用户是否存在
-                    for user_id in user_ids:
-                        if not frappe.db.exists('User', user_id):
-                            validation_errors.append(f'第{i+1}个工单的用户 {user_id} 不存在')
-            except Exception as e:
-                validation_errors.append(f'第{i+1}个工单分配对象转换失败: {str(e)}')
+        if assign_to and not assigned_user_ids[i]:
+            validation_errors.append(f'第{i+1}个工单的分配对象无效或找不到对应用户: {assign_to}')
     
     if validation_errors:
         return {
@@ -113,41 +129,52 @@ def _create_work_orders_without_transaction(work_orders_data):
             'errors': validation_errors
         }
     
+    # 集合查询预校验 BOM、物料、公司、仓库、工序等链接，全部通过后才开始插入
+    validation_errors = prevalidate_work_orders(work_orders_data)
+    if validation_errors:
+        return {
+            'status': 'error',
+            'message': '数据验证失败',
+            'errors': validation_errors
+        }
+    
     # 批量创建工单（不管理事务）
     created_work_orders = []
     assignment_results = []
     
+    # 同一批内共用 BOM 的工单复用 BOM 展开结果
+    explosion_cache = BomExplosionCache()
     for i, work_order_data in enumerate(work_orders_data):
         # 创建工单文档
         work_order = frappe.new_doc('Work Order')
-        
+    
         # 设置基本字段
         work_order.production_item = work_order_data.get('production_item')
         work_order.qty = work_order_data.get('qty')
         work_order.company = work_order_data.get('company')
         work_order.bom_no = work_order_data.get('bom_no')
         work_order.stock_uom = work_order_data.get('stock_uom', 'Nos')
-        
+    
         # 设置可选字段
         optional_fields = [
             'naming_series', 'description', 'item_name', 'expected_delivery_date',
             'planned_start_date', 'fg_warehouse', 'wip_warehouse', 'transfer_material_against',
             'use_multi_level_bom', 'update_consumed_material_cost_in_project', 'sales_order'
         ]
-        
+    
         for field in optional_fields:
             if work_order_data.get(field):
                 setattr(work_order, field, work_order_data.get(field))
-        
+    
         # 设置自定义字段
         custom_fields = [
             'custom_work_oder_type', 'custom_style_name', 'custom_style_code'
         ]
-        
+    
         for field in custom_fields:
             if work_order_data.get(field):
                 setattr(work_order, field, work_order_data.get(field))
-        
+    
         # 设置所需物料
         if work_order_data.get('required_items'):
             for item in work_order_data.get('required_items'):
@@ -163,7 +190,7 @@ def _create_work_orders_without_transaction(work_orders_data):
                     'allow_alternative_item': item.get('allow_alternative_item', 0),
                     'include_item_in_manufacturing': item.get('include_item_in_manufacturing', 1)
                 })
-        
+    
         # 设置操作工序
         if work_order_data.get('operations'):
             try:
@@ -190,32 +217,33 @@ def _create_work_orders_without_transaction(work_orders_data):
             except Exception as operations_error:
                 # 如果operations处理出错，记录错误但不影响工单创建
                 frappe.log_error(f"工单 {work_order.name} 处理operations时出错: {str(operations_error)}", "Work Order Operations Error")
-        
+    
         # 保存工单
+        apply_bom_explosion(work_order, explosion_cache)
         work_order.insert()
-        
+    
         created_work_order = {
             'index': i + 1,
             'work_order_name': work_order.name,
             'production_item': work_order.production_item,
             'qty': work_order.qty
         }
-        
+    
         # 处理工单分配（如果有）
         assign_to = work_order_data.get('assign_to')
         if assign_to:
             try:
-                # 转换员工ID为用户ID
-                user_ids = convert_employee_to_user_id(assign_to)
-                
+                # 使用校验阶段已批量转换的用户ID
+                user_ids = assigned_user_ids[i]
+            
                 if user_ids:
                     # 设置分配描述
                     assignment_description = work_order_data.get('assignment_description', 
                                                                f'工单 {work_order.name} 已分配给您')
-                    
+                
                     # 使用Frappe的标准分配功能
                     from frappe.desk.form import assign_to as frappe_assign_to
-                    
+                
                     assignment_args = {
                         'assign_to': user_ids,
                         'doctype': 'Work Order',
@@ -223,20 +251,20 @@ def _create_work_orders_without_transaction(work_orders_data):
                         'description': assignment_description,
                         'priority': work_order_data.get('assignment_priority', 'Medium')
                     }
-                    
+                
                     if work_order_data.get('assignment_date'):
                         assignment_args['date'] = work_order_data.get('assignment_date')
-                    
+                
                     # 执行分配
                     assignment_result = frappe_assign_to.add(assignment_args)
-                    
+                
                     assignment_results.append({
                         'work_order_name': work_order.name,
                         'original_assign_to': assign_to,
                         'converted_user_ids': user_ids,
                         'assignment_status': 'success'
                     })
-                    
+                
                     created_work_order['original_assign_to'] = assign_to
                     created_work_order['assigned_user_ids'] = user_ids
                     created_work_order['assignment_status'] = 'success'
@@ -248,11 +276,11 @@ def _create_work_orders_without_transaction(work_orders_data):
                         'assignment_status': 'failed',
                         'assignment_error': '无法转换员工ID为用户ID'
                     })
-                    
+                
                     created_work_order['original_assign_to'] = assign_to
                     created_work_order['assignment_status'] = 'failed'
                     created_work_order['assignment_error'] = '无法转换员工ID为用户ID'
-                
+            
             except Exception as assignment_error:
                 # 分配失败但不影响工单创建
                 assignment_results.append({
@@ -261,13 +289,13 @@ def _create_work_orders_without_transaction(work_orders_data):
                     'assignment_status': 'failed',
                     'assignment_error': str(assignment_error)
                 })
-                
+            
                 created_work_order['original_assign_to'] = assign_to
                 created_work_order['assignment_status'] = 'failed'
                 created_work_order['assignment_error'] = str(assignment_error)
-        
-        created_work_orders.append(created_work_order)
     
+        created_work_orders.append(created_work_order)
+
     # 统计分配结果
     successful_assignments = [r for r in assignment_results if r.get('assignment_status') == 'success']
     failed_assignments = [r for r in assignment_results if r.get('assignment_status') == 'failed']
@@ -296,7 +324,7 @@ def _create_work_orders_without_transaction(work_orders_data):
 
 
 @frappe.whitelist()
-def batch_save_work_orders(work_orders_data):
+def batch_save_work_orders(work_orders_data, idempotency_key=None, run_async=None):
     """
     批量保存生产工单的白名单API方法（事务处理）
     支持在保存工单的同时分配给员工，并支持操作工序
@@ -328,10 +356,28 @@ def batch_save_work_orders(work_orders_data):
             - process_loss_qty: 工艺损耗数量
             - actual_operation_time: 实际操作时间
             - actual_operating_cost: 实际操作成本
+        idempotency_key: 幂等键（可选），转为后台任务时用于防止客户端重试导致重复创建
+        run_async: 是否强制使用后台任务；不传时超过 ASYNC_BATCH_THRESHOLD 条自动转为后台任务
         
     Returns:
-        dict: 包含操作结果的字典
+        dict: 包含操作结果的字典；转为后台任务时返回 status='queued' 及 idempotency_key，
+        可通过 get_batch_save_work_orders_status 查询进度
     """
+    if isinstance(work_orders_data, str):
+        try:
+            work_orders_data = json.loads(work_orders_data)
+        except (json.JSONDecodeError, TypeError):
+            pass
+    
+    # 大批量自动切换为后台任务，避免请求超时后客户端重试造成重复工单
+    if isinstance(work_orders_data, list):
+        if run_async in (None, ''):
+            use_async = len(work_orders_data) > ASYNC_BATCH_THRESHOLD
+        else:
+            use_async = bool(cint(run_async))
+        if use_async:
+            return batch_save_work_orders_async(work_orders_data, idempotency_key=idempotency_key)
+    
     try:
         # 开始数据库事务
         frappe.db.begin()
@@ -359,6 +405,314 @@ def batch_save_work_orders(work_orders_data):
         }
 
 
+def _get_batch_job_cache_key(idempotency_key):
+    return f'{BATCH_JOB_CACHE_PREFIX}{idempotency_key}'
+
+
+def _get_batch_job_state(idempotency_key):
+    return frappe.cache().get_value(_get_batch_job_cache_key(idempotency_key))
+
+
+def _set_batch_job_state(idempotency_key, state):
+    state['updated_at'] = str(now_datetime())
+    frappe.cache().set_value(
+        _get_batch_job_cache_key(idempotency_key), state, expires_in_sec=BATCH_JOB_TTL
+    )
+
+
+def _get_batch_job_progress(idempotency_key):
+    """读取与工单一起提交的任务进度（RG Batch Job Progress）"""
+    progress = frappe.db.get_value(
+        BATCH_JOB_PROGRESS_DOCTYPE, idempotency_key,
+        ['processed_count', 'created_work_orders', 'failed_rows'], as_dict=True
+    )
+    if not progress:
+        return None
+    return {
+        'processed_count': cint(progress.processed_count),
+        'created_work_orders': json.loads(progress.created_work_orders or '[]'),
+        'failed_rows': json.loads(progress.failed_rows or '[]')
+    }
+
+
+def _set_batch_job_progress(idempotency_key, state):
+    """进度与本块工单写在同一事务中，提交后才可见"""
+    now = now_datetime()
+    frappe.db.sql(f"""
+        INSERT INTO `tab{BATCH_JOB_PROGRESS_DOCTYPE}`
+            (name, owner, creation, modified, modified_by, docstatus,
+             processed_count, created_work_orders, failed_rows)
+        VALUES (%(name)s, %(user)s, %(now)s, %(now)s, %(user)s, 0,
+             %(processed_count)s, %(created_work_orders)s, %(failed_rows)s)
+        ON DUPLICATE KEY UPDATE
+            modified = VALUES(modified),
+            processed_count = VALUES(processed_count),
+            created_work_orders = VALUES(created_work_orders),
+            failed_rows = VALUES(failed_rows)
+    """, {
+        'name': idempotency_key,
+        'user': frappe.session.user,
+        'now': now,
+        'processed_count': state['processed_count'],
+        'created_work_orders': json.dumps(state['created_work_orders'], default=str),
+        'failed_rows': json.dumps(state['failed_rows'], default=str)
+    })
+
+
+def _summarize_batch_job_state(state):
+    """返回给客户端的任务状态"""
+    return {
+        'status': state.get('status'),
+        'idempotency_key': state.get('idempotency_key'),
+        'job_id': state.get('job_id'),
+        'total_count': state.get('total_count'),
+        'processed_count': state.get('processed_count'),
+        'created_count': len(state.get('created_work_orders', [])),
+        'failed_count': len(state.get('failed_rows', [])),
+        'created_work_orders': state.get('created_work_orders', []),
+        'failed_rows': state.get('failed_rows', []),
+        'message': state.get('message')
+    }
+
+
+@frappe.whitelist()
+def batch_save_work_orders_async(work_orders_data, idempotency_key=None, chunk_size=None):
+    """
+    以后台任务方式批量保存生产工单（long 队列），按块提交并推送进度
+    
+    同一 idempotency_key 只会入队一次：客户端超时重试时直接返回已有任务的状态；
+    已失败或超过 BATCH_JOB_TIMEOUT 未更新的任务在重试时重新入队，从已提交的进度继续。
+    
+    Args:
+        work_orders_data: 工单数据列表，字段同 batch_save_work_orders
+        idempotency_key: 幂等键（可选），不传时按请求内容生成
+        chunk_size: 每次提交的工单数，默认 BATCH_JOB_CHUNK_SIZE
+        
+    Returns:
+        dict: 任务状态（status 为 queued/running/completed 等）
+    """
+    if isinstance(work_orders_data, str):
+        work_orders_data = json.loads(work_orders_data)
+    
+    if not isinstance(work_orders_data, list) or not work_orders_data:
+        return {
+            'status': 'error',
+            'message': '工单数据列表不能为空'
+        }
+    
+    if not idempotency_key:
+        payload = json.dumps(work_orders_data, sort_keys=True, default=str)
+        idempotency_key = hashlib.sha256(f'{frappe.session.user}:{payload}'.encode()).hexdigest()
+    
+    # 原子抢占幂等键，防止并发重试重复入队
+    cache = frappe.cache()
+    lock_key = cache.make_key(_get_batch_job_cache_key(idempotency_key) + ':lock')
+    if not cache.set(lock_key, 1, nx=True, ex=BATCH_JOB_TTL):
+        state = _get_batch_job_state(idempotency_key)
+        if state and _is_batch_job_resumable(state):
+            state['status'] = 'queued'
+            state['message'] = f"已重新加入后台队列，从第 {state.get('processed_count', 0) + 1} 个工单继续"
+            _enqueue_batch_save_job(state, work_orders_data, chunk_size)
+            return _summarize_batch_job_state(state)
+        if state:
+            return _summarize_batch_job_state(state)
+        return {
+            'status': 'queued',
+            'idempotency_key': idempotency_key,
+            'message': '相同的批量保存任务已在处理中'
+        }
+    
+    state = {
+        'status': 'queued',
+        'idempotency_key': idempotency_key,
+        'owner': frappe.session.user,
+        'total_count': len(work_orders_data),
+        'processed_count': 0,
+        'created_work_orders': [],
+        'failed_rows': [],
+        'message': f'已加入后台队列，共 {len(work_orders_data)} 个工单'
+    }
+    _enqueue_batch_save_job(state, work_orders_data, chunk_size)
+    return _summarize_batch_job_state(state)
+
+
+def _is_batch_job_resumable(state):
+    """任务失败，或排队 / 运行状态超过 BATCH_JOB_TIMEOUT 未更新（进程已被终止）时可以重新入队"""
+    if state.get('status') == 'failed':
+        return True
+    if state.get('status') in ('queued', 'running') and state.get('updated_at'):
+        return time_diff_in_seconds(now_datetime(), get_datetime(state['updated_at'])) > BATCH_JOB_TIMEOUT
+    return False
+
+
+def _enqueue_batch_save_job(state, work_orders_data, chunk_size=None):
+    """写入任务状态并入队；重新入队时任务从数据库中已提交的进度继续"""
+    state['job_id'] = f"batch_save_work_orders::{state['idempotency_key']}"
+    _set_batch_job_state(state['idempotency_key'], state)
+    frappe.enqueue(
+        'rongguan_erp.utils.api.work_order._run_batch_save_work_orders_job',
+        queue='long',
+        timeout=BATCH_JOB_TIMEOUT,
+        job_id=state['job_id'],
+        enqueue_after_commit=True,
+        idempotency_key=state['idempotency_key'],
+        work_orders_data=work_orders_data,
+        chunk_size=cint(chunk_size) or BATCH_JOB_CHUNK_SIZE
+    )
+
+
+@frappe.whitelist()
+def get_batch_save_work_orders_status(idempotency_key):
+    """
+    查询后台批量保存工单任务的状态
+    
+    Args:
+        idempotency_key: batch_save_work_orders_async 返回的幂等键
+        
+    Returns:
+        dict: 任务状态，包含已创建和失败的工单行
+    """
+    if not idempotency_key:
+        return {
+            'status': 'error',
+            'message': 'idempotency_key 不能为空'
+        }
+    
+    state = _get_batch_job_state(idempotency_key)
+    if not state:
+        return {
+            'status': 'not_found',
+            'idempotency_key': idempotency_key,
+            'message': f'任务 {idempotency_key} 不存在或已过期'
+        }
+    
+    if state.get('owner') != frappe.session.user and 'System Manager' not in frappe.get_roles():
+        frappe.throw(_('无权查看该任务'), frappe.PermissionError)
+    
+    return _summarize_batch_job_state(state)
+
+
+def _save_work_order_chunk(chunk, start_index):
+    """
+    在保存点内创建一块工单；整块失败时逐行重试，以便定位失败行
+    
+    Returns:
+        tuple: (已创建工单列表, 失败行列表)，index 为整批中的序号（从1开始）
+    """
+    save_point = 'batch_save_work_orders_chunk'
+    frappe.db.savepoint(save_point)
+    try:
+        result = _create_work_orders_without_transaction(chunk)
+        if result.get('status') == 'success':
+            frappe.db.release_savepoint(save_point)
+            created = result.get('created_work_orders', [])
+            for row in created:
+                row['index'] = start_index + row['index'] - 1
+            return created, []
+    except Exception:
+        pass
+    frappe.db.rollback(save_point=save_point)
+    
+    # 逐行重试
+    created = []
+    failed = []
+    for offset, work_order_data in enumerate(chunk):
+        index = start_index + offset
+        row_save_point = 'batch_save_work_orders_row'
+        frappe.db.savepoint(row_save_point)
+        try:
+            result = _create_work_orders_without_transaction([work_order_data])
+            if result.get('status') != 'success':
+                raise Exception('; '.join(result.get('errors') or [result.get('message', '')]))
+            frappe.db.release_savepoint(row_save_point)
+            for row in result.get('created_work_orders', []):
+                row['index'] = index
+                created.append(row)
+        except Exception as e:
+            frappe.db.rollback(save_point=row_save_point)
+            failed.append({
+                'index': index,
+                'production_item': work_order_data.get('production_item') if isinstance(work_order_data, dict) else None,
+                'error': str(e)
+            })
+    return created, failed
+
+
+def _run_batch_save_work_orders_job(idempotency_key, work_orders_data, chunk_size=BATCH_JOB_CHUNK_SIZE):
+    """
+    后台任务：按块创建工单，每块提交一次并通过 publish_realtime 推送进度
+    
+    每块的进度（RG Batch Job Progress 中的一行）与该块工单在同一事务中提交，
+    任务中断后重新执行时，从已提交的进度继续，不会重复创建已提交的工单。
+    """
+    state = _get_batch_job_state(idempotency_key) or {
+        'idempotency_key': idempotency_key,
+        'owner': frappe.session.user,
+        'total_count': len(work_orders_data),
+        'processed_count': 0,
+        'created_work_orders': [],
+        'failed_rows': []
+    }
+    if state.get('status') == 'completed':
+        return _summarize_batch_job_state(state)
+    
+    # 以数据库中已提交的进度为准，缓存中的进度可能落后于最后一次提交
+    state.update(_get_batch_job_progress(idempotency_key) or {})
+    state['status'] = 'running'
+    _set_batch_job_state(idempotency_key, state)
+    
+    try:
+        for start in range(state.get('processed_count', 0), len(work_orders_data), chunk_size):
+            chunk = work_orders_data[start:start + chunk_size]
+            created, failed = _save_work_order_chunk(chunk, start + 1)
+            
+            state['created_work_orders'].extend(created)
+            state['failed_rows'].extend(failed)
+            state['processed_count'] = start + len(chunk)
+            state['message'] = f"已处理 {state['processed_count']}/{state['total_count']} 个工单"
+            _set_batch_job_progress(idempotency_key, state)
+            frappe.db.commit()
+            _set_batch_job_state(idempotency_key, state)
+            
+            frappe.publish_realtime(
+                BATCH_JOB_PROGRESS_EVENT,
+                {
+                    'idempotency_key': idempotency_key,
+                    'processed_count': state['processed_count'],
+                    'total_count': state['total_count'],
+                    'created_count': len(state['created_work_orders']),
+                    'failed_count': len(state['failed_rows']),
+                    'chunk_created': created,
+                    'chunk_failed': failed
+                },
+                user=state.get('owner')
+            )
+        
+        state['status'] = 'completed'
+        state['message'] = (
+            f"批量保存完成: 成功 {len(state['created_work_orders'])} 个，"
+            f"失败 {len(state['failed_rows'])} 个"
+        )
+        _set_batch_job_state(idempotency_key, state)
+        frappe.db.sql(
+            f"DELETE FROM `tab{BATCH_JOB_PROGRESS_DOCTYPE}` WHERE name = %s", idempotency_key
+        )
+        frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        state['status'] = 'failed'
+        state['message'] = f'批量保存工单时出错: {str(e)}'
+        frappe.log_error(f"后台批量保存工单时出错: {str(e)}", "Batch Work Order Save Job Error")
+    
+    _set_batch_job_state(idempotency_key, state)
+    frappe.publish_realtime(
+        BATCH_JOB_PROGRESS_EVENT,
+        _summarize_batch_job_state(state),
+        user=state.get('owner')
+    )
+    return _summarize_batch_job_state(state)
+
+
 @frappe.whitelist()
 def test_batch_save_work_orders():
     """
@@ -839,25 +1193,35 @@ def get_work_order(work_order_name):
 
 
 @frappe.whitelist()
-def get_work_order_list(page=1, page_size=20, filters=None, order_by=None, fields=None):
+def get_work_order_list(page=1, page_size=20, filters=None, order_by=None, fields=None,
+                        expand=None, child_fields=None, cursor=None, with_count=None):
     """
-    获取工单列表的白名单API方法（支持分页、子表信息和Job Card明细）
+    获取工单列表的白名单API方法（支持分页、按需展开子表信息和Job Card明细）
     
     Args:
         page: 页码，默认为1
         page_size: 每页数量，默认为20
         filters: 过滤条件，可以是字符串或字典
         order_by: 排序字段，默认为creation desc
-        fields: 要获取的字段列表，如果为None则获取所有字段
+        fields: 要获取的字段列表，如果为None则使用默认字段
+        expand: 需要展开的关联数据（逗号分隔字符串或列表），不传则只返回主表字段：
+            - required_items / operations: 工单子表
+            - assignments: 分配信息
+            - pattern_maker: 纸样单的纸样师信息；paper_pattern: 完整纸样单
+            - job_cards: Job Card 主表；job_cards.<子表>: 同时展开 Job Card 子表，
+              如 job_cards.time_logs、job_cards.items
+            - all: 展开全部（完整文档，与旧版返回一致）
+        child_fields: 子表字段投影，字典，例如
+            {"required_items": ["item_code", "required_qty"],
+             "job_cards": ["name", "operation", "status"],
+             "job_cards.time_logs": ["employee", "completed_qty"]}
+        cursor: 游标分页，传入上一次返回的 pagination.next_cursor 获取下一页（此时忽略 page）
+        with_count: 是否计算总数；页码模式默认计算（精确计数），游标模式默认不计算，
+            需要总数时可单独调用 get_work_order_count
         
     Returns:
-        dict: 包含工单列表和分页信息的字典，每个工单包含以下子表信息：
-        - required_items: 所需物料
-        - operations: 操作
-        - material_consumption: 物料消耗
-        - material_transfer: 物料转移
-        - assignments: 分配信息
-        - job_cards: Job Card明细（包含所有子表信息）
+        dict: 包含工单列表和分页信息的字典；请求了 expand 时，每个工单带 sub_tables，
+        其中只包含 expand 中请求的键
     """
     try:
         # 参数处理
@@ -880,13 +1244,18 @@ def get_work_order_list(page=1, page_size=20, filters=None, order_by=None, field
             except (json.JSONDecodeError, TypeError):
                 fields = None
         
+        # 处理expand和child_fields参数
+        expand_spec = parse_expand(expand)
+        child_fields = parse_child_fields(child_fields)
+        
         # 获取Work Order文档的所有字段
         work_order_meta = frappe.get_meta('Work Order')
         available_fields = [field.fieldname for field in work_order_meta.fields]
 
-        # 添加系统字段（这些字段存在于数据库中但不在元数据中）
+        # 添加系统字段和标准字段（这些字段存在于数据库中但不在元数据中）
         system_fields = ['_assign', '_user_tags', '_comments', '_liked_by', '_seen']
         available_fields.extend(system_fields)
+        available_fields.extend(STANDARD_FIELDS)
         
         # 默认字段列表（只包含确定存在的基础字段）
         default_fields = [
@@ -925,188 +1294,110 @@ def get_work_order_list(page=1, page_size=20, filters=None, order_by=None, field
             else:
                 fields = valid_fields
         
+        # 展开关联数据需要工单名称
+        if expand_spec and 'name' not in fields:
+            fields = ['name'] + fields
+        
         # 默认排序
         if not order_by:
             order_by = 'creation desc'
         
-        # 计算偏移量
-        offset = (page - 1) * page_size
-        
-        # 获取工单列表
-        work_orders = frappe.get_all(
-            'Work Order',
-            filters=filters,
-            fields=fields,
-            order_by=order_by,
-            limit=page_size,
-            limit_start=offset
-        )
+        # 游标模式默认不计算总数，页码模式默认计算
+        use_cursor = bool(cursor)
+        with_count = cint(with_count) if with_count not in (None, '') else not use_cursor
+        
+        # 排序字段和 name 用于生成游标
+        sort = parse_order_by(order_by)
+        query_fields = list(fields)
+        if sort:
+            for required in (sort[0], 'name'):
+                if required not in query_fields:
+                    query_fields.append(required)
+        
+        if use_cursor:
+            # 游标分页：按 (排序字段, name) 定位，深翻页不再线性变慢
+            page_result = keyset_get_all(
+                'Work Order',
+                filters=filters,
+                fields=query_fields,
+                order_by=order_by,
+                page_size=page_size,
+                cursor=cursor
+            )
+            work_orders = page_result['rows']
+            has_next = page_result['has_next']
+            next_cursor = page_result['next_cursor']
+        else:
+            # 计算偏移量
+            offset = (page - 1) * page_size
+            
+            # 获取工单列表（多取一条用于判断是否有下一页）
+            work_orders = frappe.get_all(
+                'Work Order',
+                filters=filters,
+                fields=query_fields,
+                order_by=order_by,
+                limit=page_size + 1,
+                limit_start=offset
+            )
+            has_next = len(work_orders) > page_size
+            work_orders = work_orders[:page_size]
+            next_cursor = next_cursor_for(work_orders, order_by, has_next)
         
-        # 获取总数
-        total_count = frappe.db.count('Work Order', filters=filters)
+        # 获取总数（可选，精确计数；短期缓存只用于 get_work_order_count）
+        total_count = frappe.db.count('Work Order', filters=filters) if with_count else None
         
-        # 获取每个工单的详细信息（包括子表）
-        detailed_work_orders = []
-        for work_order in work_orders:
-            try:
-                # 获取完整的工单文档（包含子表）
-                work_order_doc = frappe.get_doc('Work Order', work_order.name)
-                work_order_dict = work_order_doc.as_dict()
-
-                # 确保 _assign 字段被正确包含
-                assign_value = frappe.db.get_value('Work Order', work_order.name, '_assign')
-                work_order_dict['_assign'] = assign_value if assign_value else None
-                
-                # 获取子表信息
-                sub_tables = {}
-                
-                # 获取所需物料子表
-                if hasattr(work_order_doc, 'required_items') and work_order_doc.required_items:
-                    sub_tables['required_items'] = []
-                    for item in work_order_doc.required_items:
-                        sub_tables['required_items'].append(item.as_dict())
-                
-                # 获取操作子表
-                if hasattr(work_order_doc, 'operations') and work_order_doc.operations:
-                    sub_tables['operations'] = []
-                    for operation in work_order_doc.operations:
-                        sub_tables['operations'].append(operation.as_dict())
-                
-                # 获取物料消耗子表
-                if hasattr(work_order_doc, 'material_consumption') and work_order_doc.material_consumption:
-                    sub_tables['material_consumption'] = []
-                    for consumption in work_order_doc.material_consumption:
-                        sub_tables['material_consumption'].append(consumption.as_dict())
-                
-                # 获取物料转移子表
-                if hasattr(work_order_doc, 'material_transfer') and work_order_doc.material_transfer:
-                    sub_tables['material_transfer'] = []
-                    for transfer in work_order_doc.material_transfer:
-                        sub_tables['material_transfer'].append(transfer.as_dict())
-                
-                # 获取分配信息
-                try:
-                    from frappe.desk.form import assign_to as frappe_assign_to
-                    assignments = frappe_assign_to.get({
-                        'doctype': 'Work Order',
-                        'name': work_order.name
-                    })
-                    sub_tables['assignments'] = assignments
-                except Exception as assignment_error:
-                    sub_tables['assignments'] = []
-                    frappe.log_error(f"获取工单 {work_order.name} 分配信息失败: {str(assignment_error)}")
-                
-                # 通过work order 的custom_sales_order字段获取对应的纸样单，然后获取纸样单的的纸样师的信息
-                try:
-                    paper_pattern_doc = frappe.get_doc("RG Paper Pattern", work_order.custom_sales_order)
-                    sub_tables['paper_pattern'] = paper_pattern_doc.as_dict()
-                except Exception as paper_pattern_error:
-                    sub_tables['paper_pattern'] = []
-                    frappe.log_error(f"获取工单 {work_order.name} 纸样单信息失败: {str(paper_pattern_error)}")
-                    
-                # 获取Job Card明细
-                try:
-                    job_cards = frappe.get_all(
-                        'Job Card',
-                        filters={'work_order': work_order.name},
-                        fields=['name', 'operation', 'workstation', 'status', 'for_quantity', 
-                               'total_completed_qty', 'actual_start_date', 'actual_end_date',
-                               'expected_start_date', 'expected_end_date', 'time_required',
-                               'total_time_in_mins', 'posting_date', 'remarks', 'docstatus',
-                               'creation', 'modified', 'owner', 'modified_by']
-                    )
-                    
-                    # 获取每个Job Card的详细信息（包括子表）
-                    detailed_job_cards = []
-                    for job_card in job_cards:
-                        try:
-                            job_card_doc = frappe.get_doc('Job Card', job_card.name)
-                            job_card_dict = job_card_doc.as_dict()
-                            
-                            # 获取Job Card的子表信息
-                            job_card_sub_tables = {}
-                            
-                            # 获取Job Card Items子表
-                            if hasattr(job_card_doc, 'items') and job_card_doc.items:
-                                job_card_sub_tables['items'] = []
-                                for item in job_card_doc.items:
-                                    job_card_sub_tables['items'].append(item.as_dict())
-                            
-                            # 获取Job Card Operations子表
-                            if hasattr(job_card_doc, 'sub_operations') and job_card_doc.sub_operations:
-                                job_card_sub_tables['sub_operations'] = []
-                                for operation in job_card_doc.sub_operations:
-                                    job_card_sub_tables['sub_operations'].append(operation.as_dict())
-                            
-                            # 获取Job Card Time Logs子表
-                            if hasattr(job_card_doc, 'time_logs') and job_card_doc.time_logs:
-                                job_card_sub_tables['time_logs'] = []
-                                for time_log in job_card_doc.time_logs:
-                                    job_card_sub_tables['time_logs'].append(time_log.as_dict())
-                            
-                            # 获取Job Card Scheduled Time Logs子表
-                            if hasattr(job_card_doc, 'scheduled_time_logs') and job_card_doc.scheduled_time_logs:
-                                job_card_sub_tables['scheduled_time_logs'] = []
-                                for scheduled_log in job_card_doc.scheduled_time_logs:
-                                    job_card_sub_tables['scheduled_time_logs'].append(scheduled_log.as_dict())
-                            
-                            # 获取Job Card Scrap Items子表
-                            if hasattr(job_card_doc, 'scrap_items') and job_card_doc.scrap_items:
-                                job_card_sub_tables['scrap_items'] = []
-                                for scrap_item in job_card_doc.scrap_items:
-                                    job_card_sub_tables['scrap_items'].append(scrap_item.as_dict())
-                            
-                            # 合并Job Card主表和子表信息
-                            job_card_dict['sub_tables'] = job_card_sub_tables
-                            detailed_job_cards.append(job_card_dict)
-                            
-                        except Exception as job_card_detail_error:
-                            # 如果获取Job Card详细信息失败，至少返回基本信息
-                            frappe.log_error(f"获取Job Card {job_card.name} 详细信息失败: {str(job_card_detail_error)}")
-                            job_card['sub_tables'] = {}
-                            detailed_job_cards.append(job_card)
-                    
-                    sub_tables['job_cards'] = detailed_job_cards
-                    
-                except Exception as job_card_error:
-                    sub_tables['job_cards'] = []
-                    frappe.log_error(f"获取工单 {work_order.name} Job Card信息失败: {str(job_card_error)}")
-                
-                # 合并主表和子表信息
-                work_order_dict['sub_tables'] = sub_tables
-                detailed_work_orders.append(work_order_dict)
-                
-            except Exception as detail_error:
-                # 如果获取详细信息失败，至少返回基本信息
-                frappe.log_error(f"获取工单 {work_order.name} 详细信息失败: {str(detail_error)}")
+        # 按需批量装配工单的关联数据（子表、分配、纸样单和Job Card），查询数与页大小无关
+        try:
+            detailed_work_orders = expand_work_orders(work_orders, expand_spec, child_fields)
+        except Exception as detail_error:
+            # 如果获取详细信息失败，至少返回基本信息
+            frappe.log_error(f"批量获取工单详细信息失败: {str(detail_error)}")
+            detailed_work_orders = []
+            for work_order in work_orders:
                 work_order['sub_tables'] = {}
                 detailed_work_orders.append(work_order)
         
         # 计算分页信息
-        total_pages = (total_count + page_size - 1) // page_size
-        has_next = page < total_pages
-        has_prev = page > 1
+        pagination = {
+            'page_size': page_size,
+            'has_next': has_next,
+            'next_cursor': next_cursor
+        }
+        if not use_cursor:
+            pagination['current_page'] = page
+            pagination['has_prev'] = page > 1
+        if total_count is not None:
+            pagination['total_count'] = total_count
+            pagination['total_pages'] = (total_count + page_size - 1) // page_size
         
         return {
             'status': 'success',
-            'message': f'成功获取工单列表，共 {total_count} 条记录',
+            'message': (
+                f'成功获取工单列表，共 {total_count} 条记录' if total_count is not None
+                else f'成功获取工单列表，本页 {len(detailed_work_orders)} 条记录'
+            ),
             'data': {
                 'work_orders': detailed_work_orders,
-                'pagination': {
-                    'current_page': page,
-                    'page_size': page_size,
-                    'total_count': total_count,
-                    'total_pages': total_pages,
-                    'has_next': has_next,
-                    'has_prev': has_prev
-                },
+                'pagination': pagination,
                 'filters_applied': filters,
                 'order_by': order_by,
                 'fields_used': fields,
+                'expand_applied': expand_spec and (
+                    ['all'] if expand_spec['all'] else sorted(
+                        expand_spec['keys'] | {f'job_cards.{t}' for t in expand_spec['job_card_tables']}
+                    )
+                ),
+                'child_fields_applied': child_fields,
                 'available_fields': available_fields
             }
         }
         
+    except InvalidCursorError as e:
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
     except Exception as e:
         frappe.log_error("获取工单列表时出错", "Work Order List Get Error")
         return {
@@ -1115,6 +1406,37 @@ def get_work_order_list(page=1, page_size=20, filters=None, order_by=None, field
         }
 
 
+@frappe.whitelist()
+def get_work_order_count(filters=None):
+    """
+    获取工单总数（get_work_order_list 的伴随调用，结果短期缓存）
+    
+    Args:
+        filters: 过滤条件，与 get_work_order_list 相同
+        
+    Returns:
+        dict: 包含 total_count 的字典
+    """
+    try:
+        if isinstance(filters, str):
+            try:
+                filters = json.loads(filters)
+            except (json.JSONDecodeError, TypeError):
+                filters = {}
+        
+        return {
+            'status': 'success',
+            'total_count': cached_count('Work Order', filters or {})
+        }
+        
+    except Exception as e:
+        frappe.log_error(f"获取工单总数时出错: {str(e)}", "Work Order Count Error")
+        return {
+            'status': 'error',
+            'message': f'获取工单总数时出错: {str(e)}'
+        }
+
+
 @frappe.whitelist()
 def test_get_work_order_list():
     """
@@ -1132,6 +1454,13 @@ def test_get_work_order_list():
         fields = ['name', 'production_item', 'qty', 'status', 'custom_work_oder_type']
         result3 = get_work_order_list(page=1, page_size=2, fields=fields)
         
+        # 测试按需展开和子表字段投影
+        result5 = get_work_order_list(
+            page=1, page_size=3,
+            expand='required_items,operations,assignments,pattern_maker,job_cards.time_logs',
+            child_fields={'required_items': ['item_code', 'required_qty', 'transferred_qty']}
+        )
+        
         # 测试包含Job Card信息的工单
         # 查找有Job Card的工单
         job_card_work_orders = frappe.get_all(
@@ -1143,7 +1472,7 @@ def test_get_work_order_list():
         if job_card_work_orders:
             work_order_names = [jc.work_order for jc in job_card_work_orders]
             filters_with_job_cards = {'name': ['in', work_order_names]}
-            result4 = get_work_order_list(page=1, page_size=len(work_order_names), filters=filters_with_job_cards)
+            result4 = get_work_order_list(page=1, page_size=len(work_order_names), filters=filters_with_job_cards, expand='all')
         else:
             result4 = {'message': '没有找到包含Job Card的工单'}
         
@@ -1154,7 +1483,8 @@ def test_get_work_order_list():
                 'basic_pagination': result1,
                 'with_filters': result2,
                 'with_custom_fields': result3,
-                'with_job_cards': result4
+                'with_job_cards': result4,
+                'with_expand': result5
             },
             'job_card_info': {
                 'total_job_cards': frappe.db.count('Job Card'),
@@ -1431,12 +1761,13 @@ def get_work_order_assignments(work_order_name):
 
 
 @frappe.whitelist()
-def get_work_order_job_cards(work_order_name):
+def get_work_order_job_cards(work_order_name, summary_only=None):
     """
     获取工单对应的Job Card明细信息的白名单API方法
     
     Args:
         work_order_name: 工单名称
+        summary_only: 为真时只返回 SQL 聚合的进度汇总（按工序），不加载 Job Card 明细
         
     Returns:
         dict: Job Card信息
@@ -1455,6 +1786,15 @@ def get_work_order_job_cards(work_order_name):
                 'message': f'工单 {work_order_name} 不存在'
             }
         
+        if cint(summary_only):
+            summary = summarize_job_cards([work_order_name]).get(work_order_name) or _empty_job_card_summary()
+            return {
+                'status': 'success',
+                'work_order_name': work_order_name,
+                'total_job_cards': summary['total_job_cards'],
+                'summary': summary
+            }
+        
         # 获取Job Card列表
         job_cards = frappe.get_all(
             'Job Card',
@@ -1545,6 +1885,67 @@ def get_work_order_job_cards(work_order_name):
         }
 
 
+def _empty_job_card_summary():
+    return {
+        'total_job_cards': 0,
+        'total_quantity': 0,
+        'total_completed_qty': 0,
+        'total_time_in_mins': 0,
+        'status_counts': {},
+        'operations': []
+    }
+
+
+@frappe.whitelist()
+def get_work_orders_job_card_summary(work_order_names):
+    """
+    批量获取多个工单的 Job Card 进度汇总（生产看板用），整批只发一条聚合查询
+    
+    Args:
+        work_order_names: 工单名称列表（JSON 数组或逗号分隔字符串）
+        
+    Returns:
+        dict: {'status': 'success', 'data': {工单名: 汇总}}，没有 Job Card 的工单返回空汇总
+    """
+    try:
+        if isinstance(work_order_names, str):
+            try:
+                work_order_names = json.loads(work_order_names)
+            except (json.JSONDecodeError, TypeError):
+                work_order_names = work_order_names.split(',')
+        
+        work_order_names = list(dict.fromkeys(
+            str(name).strip() for name in (work_order_names or []) if str(name).strip()
+        ))
+        if not work_order_names:
+            return {
+                'status': 'error',
+                'message': '工单名称列表不能为空'
+            }
+        
+        if len(work_order_names) > JOB_CARD_SUMMARY_MAX_WORK_ORDERS:
+            return {
+                'status': 'error',
+                'message': f'一次最多查询 {JOB_CARD_SUMMARY_MAX_WORK_ORDERS} 个工单'
+            }
+        
+        summaries = summarize_job_cards(work_order_names)
+        return {
+            'status': 'success',
+            'data': {
+                name: summaries.get(name) or _empty_job_card_summary()
+                for name in work_order_names
+            }
+        }
+        
+    except Exception as e:
+        frappe.log_error(f"批量获取工单Job Card汇总时出错: {str(e)}", "Work Order Job Card Get Error")
+        return {
+            'status': 'error',
+            'message': f'批量获取工单Job Card汇总时出错: {str(e)}'
+        }
+
+
 @frappe.whitelist()
 def batch_assign_work_orders(**args):
     """
@@ -1586,6 +1987,17 @@ def batch_assign_work_orders(**args):
     try:
         successful_assignments = []
         failed_assignments = []
+        pending_assignments = []
+        
+        # 一次性将整批员工ID转换为用户邮箱
+        try:
+            converted_user_emails = convert_employee_inputs_to_user_ids(
+                [assignment_data.get('assign_to') for assignment_data in assignments_data]
+            )
+            conversion_error = None
+        except Exception as e:
+            converted_user_emails = None
+            conversion_error = e
         
         for i, assignment_data in enumerate(assignments_data):
             work_order_name = assignment_data.get('work_order_name')
@@ -1601,7 +2013,9 @@ def batch_assign_work_orders(**args):
             
             # 将员工ID转换为用户邮箱
             try:
-                user_emails = convert_employee_to_user_id(assign_to)
+                if conversion_error:
+                    raise conversion_error
+                user_emails = converted_user_emails[i]
                 if not user_emails:
                     failed_assignments.append({
                         'index': i + 1,
@@ -1617,44 +2031,40 @@ def batch_assign_work_orders(**args):
                 })
                 continue
             
-            # 调用单个分配方法，使用转换后的邮箱
-            result = assign_work_order(
-                work_order_name=work_order_name,
-                assign_to=user_emails,
-                description=assignment_data.get('description'),
-                priority=assignment_data.get('priority', 'Medium'),
-                date=assignment_data.get('date')
-            )
-            
-            if result.get('status') == 'success':
-                # 分配成功后，尝试提交工单
-                submit_result = None
-                try:
-                    work_order_doc = frappe.get_doc('Work Order', work_order_name)
-                    if work_order_doc.docstatus == 0:  # 只有草稿状态才提交
-                        work_order_doc.submit()
-                        submit_result = 'success'
-                    else:
-                        submit_result = f'工单状态为 {work_order_doc.docstatus}，无需提交'
-                except Exception as submit_error:
-                    submit_result = f'submit失败: {str(submit_error)}'
-                    frappe.log_error(f"工单 {work_order_name} 提交失败: {str(submit_error)}", "Work Order Submit Error")
-                
-                successful_assignments.append({
-                    'index': i + 1,
-                    'work_order_name': work_order_name,
-                    'original_employee_id': assign_to,
-                    'converted_user_emails': user_emails,
-                    'assigned_to': user_emails,
-                    'submit_result': submit_result
-                })
-            else:
+            pending_assignments.append({
+                'index': i + 1,
+                'name': work_order_name,
+                'users': user_emails,
+                'original_employee_id': assign_to,
+                'description': assignment_data.get('description') or f'工单 {work_order_name} 已分配给您',
+                'priority': assignment_data.get('priority', 'Medium'),
+                'date': assignment_data.get('date')
+            })
+        
+        # 整批一次写入 ToDo 与 _assign，通知在后台发送
+        assign_results = bulk_assign_documents('Work Order', pending_assignments)
+        assigned = [a for a in pending_assignments if assign_results[a['name']]['status'] == 'success']
+        for assignment in pending_assignments:
+            if assign_results[assignment['name']]['status'] != 'success':
                 failed_assignments.append({
-                    'index': i + 1,
-                    'work_order_name': work_order_name,
-                    'error': result.get('message')
+                    'index': assignment['index'],
+                    'work_order_name': assignment['name'],
+                    'error': assign_results[assignment['name']].get('error')
                 })
         
+        # 分配成功后按 BOM 分组提交工单
+        submit_results = submit_documents_grouped('Work Order', [a['name'] for a in assigned])
+        for assignment in assigned:
+            successful_assignments.append({
+                'index': assignment['index'],
+                'work_order_name': assignment['name'],
+                'original_employee_id': assignment['original_employee_id'],
+                'converted_user_emails': assignment['users'],
+                'assigned_to': assignment['users'],
+                'submit_result': submit_results.get(assignment['name'])
+            })
+        failed_assignments.sort(key=lambda item: item['index'])
+        
         # 统计提交结果
         submit_success_count = sum(1 for item in successful_assignments if item.get('submit_result') == 'success')
         submit_failed_count = len(successful_assignments) - submit_success_count
@@ -1837,6 +2247,329 @@ def complete_work_order(work_order_id: str, qty: float):
         }
 
 
+def _parse_completion_items(items):
+    """
+    统一批量完工的输入：支持 [{'work_order_id', 'qty'}] 或 [[work_order_id, qty]]
+    """
+    if isinstance(items, str):
+        items = json.loads(items)
+    
+    parsed = []
+    for item in items or []:
+        if isinstance(item, dict):
+            parsed.append((item.get('work_order_id') or item.get('work_order'), flt(item.get('qty'))))
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            parsed.append((item[0], flt(item[1])))
+        else:
+            parsed.append((None, 0))
+    return parsed
+
+
+def _make_manufacture_entry(work_order_id, qty):
+    """生成、保存并提交一张 Manufacture 库存单据，返回单据名"""
+    se_dict = make_stock_entry(work_order_id, "Manufacture", qty)
+    if not se_dict:
+        raise Exception(f'无法为工单 {work_order_id} 生成库存单据，make_stock_entry 返回 None')
+    
+    se_doc = frappe.get_doc(se_dict)
+    se_doc.insert(ignore_permissions=True)
+    se_doc.submit()
+    return se_doc.name
+
+
+def _complete_work_order_chunk(chunk):
+    """
+    在保存点内为一块工单提交完工单据；整块失败时逐行重试，定位失败的工单
+    
+    Args:
+        chunk: [(index, work_order_id, qty)]
+        
+    Returns:
+        list: 每个工单的完工结果
+    """
+    save_point = 'complete_work_orders_chunk'
+    frappe.db.savepoint(save_point)
+    try:
+        results = []
+        for index, work_order_id, qty in chunk:
+            stock_entry = _make_manufacture_entry(work_order_id, qty)
+            results.append({
+                'index': index,
+                'work_order_id': work_order_id,
+                'qty': qty,
+                'status': 'success',
+                'stock_entry': stock_entry
+            })
+        frappe.db.release_savepoint(save_point)
+        return results
+    except Exception:
+        frappe.db.rollback(save_point=save_point)
+    
+    # 逐行重试
+    results = []
+    for index, work_order_id, qty in chunk:
+        row_save_point = 'complete_work_orders_row'
+        frappe.db.savepoint(row_save_point)
+        try:
+            stock_entry = _make_manufacture_entry(work_order_id, qty)
+            frappe.db.release_savepoint(row_save_point)
+            results.append({
+                'index': index,
+                'work_order_id': work_order_id,
+                'qty': qty,
+                'status': 'success',
+                'stock_entry': stock_entry
+            })
+        except Exception as e:
+            frappe.db.rollback(save_point=row_save_point)
+            frappe.log_error(f"完工工单 {work_order_id} 时出错: {str(e)}", "Work Order Complete Error")
+            results.append({
+                'index': index,
+                'work_order_id': work_order_id,
+                'qty': qty,
+                'status': 'error',
+                'message': f'完工工单时出错: {str(e)}'
+            })
+    return results
+
+
+def _complete_work_orders(items, chunk_size=COMPLETE_CHUNK_SIZE, on_chunk_done=None):
+    """
+    批量完工的核心流程
+    
+    1. 一条查询预取全部工单并逐行校验（存在、已提交、未完成、数量大于0）
+    2. 按 (公司, 成品仓, 在制品仓) 分组，组内分块在保存点内提交完工单据，每块提交一次事务
+    3. 整批结束后才触发一次库存重估（Repost Item Valuation）处理，避免每张单据后各自重估
+    
+    Args:
+        items: [(work_order_id, qty)]
+        chunk_size: 每块工单数
+        on_chunk_done: 每块提交后的回调，参数为该块结果列表
+        
+    Returns:
+        list: 按输入顺序排列的每个工单的结果
+    """
+    work_order_ids = list(dict.fromkeys(wo for wo, qty in items if wo))
+    work_orders = {
+        wo.name: wo for wo in frappe.get_all(
+            'Work Order',
+            filters={'name': ['in', work_order_ids]},
+            fields=['name', 'docstatus', 'status', 'company', 'fg_warehouse', 'wip_warehouse']
+        )
+    } if work_order_ids else {}
+    
+    results = []
+    groups = {}
+    for i, (work_order_id, qty) in enumerate(items):
+        index = i + 1
+        work_order = work_orders.get(work_order_id)
+        error = None
+        if not work_order_id:
+            error = '工单ID不能为空'
+        elif not work_order:
+            error = f'工单 {work_order_id} 不存在'
+        elif work_order.docstatus != 1:
+            error = f'工单 {work_order_id} 未提交，无法完工'
+        elif work_order.status == 'Completed':
+            error = f'工单 {work_order_id} 已完成'
+        elif qty <= 0:
+            error = f'工单 {work_order_id} 的完工数量必须大于0'
+        
+        if error:
+            results.append({
+                'index': index,
+                'work_order_id': work_order_id,
+                'qty': qty,
+                'status': 'error',
+                'message': error
+            })
+            continue
+        
+        group_key = (work_order.company, work_order.fg_warehouse or '', work_order.wip_warehouse or '')
+        groups.setdefault(group_key, []).append((index, work_order_id, qty))
+    
+    completed_any = False
+    for group_key in sorted(groups):
+        rows = groups[group_key]
+        for start in range(0, len(rows), chunk_size):
+            chunk_results = _complete_work_order_chunk(rows[start:start + chunk_size])
+            frappe.db.commit()
+            
+            results.extend(chunk_results)
+            completed_any = completed_any or any(r['status'] == 'success' for r in chunk_results)
+            if on_chunk_done:
+                on_chunk_done(chunk_results)
+    
+    if completed_any:
+        # 整批完成后统一处理排队中的库存重估
+        frappe.enqueue(
+            'erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.repost_entries',
+            queue='long',
+            enqueue_after_commit=True
+        )
+    
+    results.sort(key=lambda r: r['index'])
+    return results
+
+
+def _summarize_completion_results(results):
+    success_count = sum(1 for r in results if r['status'] == 'success')
+    return {
+        'status': 'success' if success_count else 'error',
+        'message': f'批量完工完成: 成功 {success_count} 个，失败 {len(results) - success_count} 个',
+        'total_count': len(results),
+        'success_count': success_count,
+        'failed_count': len(results) - success_count,
+        'results': results
+    }
+
+
+@frappe.whitelist()
+def complete_work_orders(items, chunk_size=None):
+    """
+    批量一键完工
+    
+    Args:
+        items: 工单与完工数量列表，如 [{"work_order_id": "MFG-WO-2025-00130", "qty": 10}]
+               或 [["MFG-WO-2025-00130", 10]]
+        chunk_size: 每次提交的工单数，默认 COMPLETE_CHUNK_SIZE
+        
+    Returns:
+        dict: 汇总结果，results 中为每个工单的完工结果（含库存单据号或错误信息）
+    """
+    try:
+        items = _parse_completion_items(items)
+        if not items:
+            return {
+                'status': 'error',
+                'message': '完工数据列表不能为空'
+            }
+        
+        results = _complete_work_orders(items, cint(chunk_size) or COMPLETE_CHUNK_SIZE)
+        return _summarize_completion_results(results)
+        
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"批量完工工单时出错: {str(e)}", "Work Order Complete Error")
+        return {
+            'status': 'error',
+            'message': f'批量完工工单时出错: {str(e)}'
+        }
+
+
+def _get_complete_job_cache_key(job_key):
+    return f'{COMPLETE_JOB_CACHE_PREFIX}{job_key}'
+
+
+@frappe.whitelist()
+def complete_work_orders_async(items, chunk_size=None):
+    """
+    以后台任务方式批量完工（long 队列），按块提交并通过 publish_realtime 推送进度
+    
+    Args:
+        items: 同 complete_work_orders
+        chunk_size: 每次提交的工单数
+        
+    Returns:
+        dict: 任务状态，job_key 用于 get_complete_work_orders_status 查询
+    """
+    items = _parse_completion_items(items)
+    if not items:
+        return {
+            'status': 'error',
+            'message': '完工数据列表不能为空'
+        }
+    
+    job_key = frappe.generate_hash(length=16)
+    state = {
+        'status': 'queued',
+        'job_key': job_key,
+        'owner': frappe.session.user,
+        'total_count': len(items),
+        'processed_count': 0,
+        'results': [],
+        'message': f'已加入后台队列，共 {len(items)} 个工单'
+    }
+    frappe.cache().set_value(_get_complete_job_cache_key(job_key), state, expires_in_sec=BATCH_JOB_TTL)
+    
+    frappe.enqueue(
+        'rongguan_erp.utils.api.work_order._run_complete_work_orders_job',
+        queue='long',
+        timeout=BATCH_JOB_TIMEOUT,
+        job_id=f'complete_work_orders::{job_key}',
+        enqueue_after_commit=True,
+        job_key=job_key,
+        items=items,
+        chunk_size=cint(chunk_size) or COMPLETE_CHUNK_SIZE
+    )
+    return state
+
+
+@frappe.whitelist()
+def get_complete_work_orders_status(job_key):
+    """
+    查询后台批量完工任务的状态
+    
+    Args:
+        job_key: complete_work_orders_async 返回的 job_key
+    """
+    state = frappe.cache().get_value(_get_complete_job_cache_key(job_key)) if job_key else None
+    if not state:
+        return {
+            'status': 'not_found',
+            'job_key': job_key,
+            'message': f'任务 {job_key} 不存在或已过期'
+        }
+    
+    if state.get('owner') != frappe.session.user and 'System Manager' not in frappe.get_roles():
+        frappe.throw(_('无权查看该任务'), frappe.PermissionError)
+    return state
+
+
+def _run_complete_work_orders_job(job_key, items, chunk_size=COMPLETE_CHUNK_SIZE):
+    """后台任务：批量完工，每块提交后更新任务状态并推送进度"""
+    cache_key = _get_complete_job_cache_key(job_key)
+    state = frappe.cache().get_value(cache_key) or {
+        'job_key': job_key,
+        'owner': frappe.session.user,
+        'total_count': len(items),
+        'processed_count': 0,
+        'results': []
+    }
+    state['status'] = 'running'
+    frappe.cache().set_value(cache_key, state, expires_in_sec=BATCH_JOB_TTL)
+    
+    def on_chunk_done(chunk_results):
+        state['processed_count'] += len(chunk_results)
+        state['message'] = f"已处理 {state['processed_count']}/{state['total_count']} 个工单"
+        frappe.cache().set_value(cache_key, state, expires_in_sec=BATCH_JOB_TTL)
+        frappe.publish_realtime(
+            COMPLETE_JOB_PROGRESS_EVENT,
+            {
+                'job_key': job_key,
+                'processed_count': state['processed_count'],
+                'total_count': state['total_count'],
+                'chunk_results': chunk_results
+            },
+            user=state.get('owner')
+        )
+    
+    try:
+        results = _complete_work_orders([tuple(item) for item in items], chunk_size, on_chunk_done)
+        state.update(_summarize_completion_results(results))
+        state['status'] = 'completed'
+        state['processed_count'] = len(results)
+    except Exception as e:
+        frappe.db.rollback()
+        state['status'] = 'failed'
+        state['message'] = f'批量完工工单时出错: {str(e)}'
+        frappe.log_error(f"后台批量完工工单时出错: {str(e)}", "Work Order Complete Job Error")
+    
+    frappe.cache().set_value(cache_key, state, expires_in_sec=BATCH_JOB_TTL)
+    frappe.publish_realtime(COMPLETE_JOB_PROGRESS_EVENT, state, user=state.get('owner'))
+    return state
+
+
 @frappe.whitelist()
 def test_operations_functionality():
     """
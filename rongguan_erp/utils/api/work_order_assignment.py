@@ -0,0 +1,235 @@
+"""
+批量分配与批量提交
+
+bulk_assign_documents: 一次构建整批 ToDo 行批量插入，每批一条 UPDATE 写回 _assign，
+通知、评论与邮件在事务提交后交给后台任务发送，请求内只做必要的数据库写入。
+
+submit_documents_grouped: 按 BOM / 物料分组提交工单，组内共用 BOM 校验与展开结果。
+"""
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import get_fullname, now_datetime
+
+from rongguan_erp.utils.api.work_order_pipeline import BomExplosionCache, apply_bom_explosion
+
+
+ASSIGNMENT_NOTIFY_TIMEOUT = 1500
+
+
+def _fallback_assign(doctype, assignment):
+    """走 Frappe 标准分配流程（用于需要共享文档等特殊情况）"""
+    from frappe.desk.form import assign_to as frappe_assign_to
+
+    assignment_args = {
+        'assign_to': assignment['users'],
+        'doctype': doctype,
+        'name': assignment['name'],
+        'description': assignment['description'],
+        'priority': assignment.get('priority') or 'Medium'
+    }
+    if assignment.get('date'):
+        assignment_args['date'] = assignment['date']
+    return frappe_assign_to.add(assignment_args)
+
+
+def bulk_assign_documents(doctype, assignments):
+    """
+    批量创建分配（ToDo）
+
+    与 frappe.desk.form.assign_to.add 的区别：
+    - 已有未关闭 ToDo 的用户跳过，不重复分配
+    - 整批 ToDo 一次批量插入，_assign 每批一条 UPDATE
+    - 通知、分配评论、实时刷新在提交后由后台任务处理
+    - 对该 DocType 没有读权限的用户仍走标准流程（需要共享文档）
+
+    Args:
+        doctype: 文档类型
+        assignments: 列表，元素为 {'name', 'users', 'description', 'priority', 'date'}
+
+    Returns:
+        dict: {文档名: {'status': 'success'|'error', 'assigned_to': [...], 'error': ...}}
+    """
+    results = {}
+    if not assignments:
+        return results
+
+    names = list(dict.fromkeys(a['name'] for a in assignments))
+    existing_names = set(frappe.get_all(doctype, filters={'name': ['in', names]}, pluck='name'))
+
+    open_todos = frappe.get_all(
+        'ToDo',
+        filters={'reference_type': doctype, 'reference_name': ['in', names], 'status': 'Open'},
+        fields=['reference_name', 'allocated_to'],
+        order_by='creation asc'
+    )
+    assigned_users = {}
+    for todo in open_todos:
+        assigned_users.setdefault(todo.reference_name, []).append(todo.allocated_to)
+
+    all_users = list(dict.fromkeys(u for a in assignments for u in a['users']))
+    users_without_permission = {
+        user for user in all_users if not frappe.has_permission(doctype, 'read', user=user)
+    }
+
+    now = now_datetime()
+    assigned_by = frappe.session.user
+    assigned_by_full_name = get_fullname(assigned_by)
+    todo_fields = [
+        'name', 'owner', 'creation', 'modified', 'modified_by', 'docstatus', 'status',
+        'priority', 'date', 'allocated_to', 'description', 'reference_type',
+        'reference_name', 'assigned_by', 'assigned_by_full_name'
+    ]
+    todo_values = []
+    new_todos = []
+    changed_names = []
+
+    for assignment in assignments:
+        name = assignment['name']
+        if name not in existing_names:
+            results[name] = {'status': 'error', 'error': f'{doctype} {name} 不存在'}
+            continue
+
+        if users_without_permission.intersection(assignment['users']):
+            try:
+                _fallback_assign(doctype, assignment)
+                results[name] = {'status': 'success', 'assigned_to': assignment['users']}
+            except Exception as e:
+                results[name] = {'status': 'error', 'error': str(e)}
+            continue
+
+        current = assigned_users.setdefault(name, [])
+        for user in assignment['users']:
+            if user in current:
+                continue
+            current.append(user)
+            todo_name = frappe.generate_hash(length=10)
+            todo_values.append((
+                todo_name, assigned_by, now, now, assigned_by, 0, 'Open',
+                assignment.get('priority') or 'Medium', assignment.get('date'), user,
+                assignment['description'], doctype, name, assigned_by, assigned_by_full_name
+            ))
+            new_todos.append({
+                'reference_name': name,
+                'allocated_to': user,
+                'description': assignment['description']
+            })
+            if name not in changed_names:
+                changed_names.append(name)
+        results[name] = {'status': 'success', 'assigned_to': assignment['users']}
+
+    if todo_values:
+        frappe.db.bulk_insert('ToDo', todo_fields, todo_values)
+        _update_assign_column(doctype, {name: assigned_users[name] for name in changed_names})
+        frappe.enqueue(
+            'rongguan_erp.utils.api.work_order_assignment.notify_bulk_assignments',
+            queue='short',
+            timeout=ASSIGNMENT_NOTIFY_TIMEOUT,
+            enqueue_after_commit=True,
+            doctype=doctype,
+            todos=new_todos,
+            assigned_by=assigned_by
+        )
+
+    return results
+
+
+def _update_assign_column(doctype, assigned_users):
+    """一条 UPDATE ... CASE 写回整批文档的 _assign（不更新 modified，与标准分配一致）"""
+    if not assigned_users:
+        return
+
+    cases = []
+    values = []
+    for name, users in assigned_users.items():
+        cases.append('WHEN %s THEN %s')
+        values.extend([name, json.dumps(users)])
+    names = list(assigned_users)
+    placeholders = ', '.join(['%s'] * len(names))
+
+    frappe.db.sql(f"""
+        UPDATE `tab{doctype}`
+        SET `_assign` = CASE `name` {' '.join(cases)} END
+        WHERE `name` IN ({placeholders})
+    """, values + names)
+
+    for name in names:
+        frappe.clear_document_cache(doctype, name)
+
+
+def notify_bulk_assignments(doctype, todos, assigned_by):
+    """
+    后台任务：发送分配通知（站内通知 / 邮件）、添加分配评论并刷新待办列表
+
+    Args:
+        doctype: 文档类型
+        todos: [{'reference_name', 'allocated_to', 'description'}]
+        assigned_by: 分配人
+    """
+    from frappe.desk.form.assign_to import notify_assignment
+
+    assigned_by_full_name = get_fullname(assigned_by)
+    for todo in todos:
+        try:
+            notify_assignment(
+                assigned_by, todo['allocated_to'], doctype, todo['reference_name'],
+                action='ASSIGN', description=todo.get('description')
+            )
+            frappe.get_doc(doctype, todo['reference_name']).add_comment(
+                'Assigned',
+                _('{0} assigned {1}: {2}').format(
+                    assigned_by_full_name, get_fullname(todo['allocated_to']), todo['reference_name']
+                )
+            )
+        except Exception as e:
+            frappe.log_error(
+                f"{doctype} {todo['reference_name']} 分配通知发送失败: {str(e)}",
+                "Bulk Assignment Notify Error"
+            )
+
+    for user in dict.fromkeys(todo['allocated_to'] for todo in todos):
+        frappe.publish_realtime('refresh_todo', user=user)
+
+
+def submit_documents_grouped(doctype, names):
+    """
+    批量提交草稿文档：按 BOM、物料分组顺序提交，组内复用 BOM 展开结果；
+    每个文档在独立保存点内提交，失败不影响其他文档
+
+    Returns:
+        dict: {文档名: 'success' | 说明文字}
+    """
+    results = {}
+    if not names:
+        return results
+
+    meta = frappe.get_meta(doctype)
+    group_fields = [f for f in ('bom_no', 'production_item') if meta.has_field(f)]
+    rows = frappe.get_all(
+        doctype,
+        filters={'name': ['in', list(names)]},
+        fields=['name', 'docstatus'] + group_fields
+    )
+    rows.sort(key=lambda row: tuple(row.get(f) or '' for f in group_fields))
+
+    explosion_cache = BomExplosionCache()
+    for row in rows:
+        if row.docstatus != 0:
+            results[row.name] = f'工单状态为 {row.docstatus}，无需提交'
+            continue
+
+        save_point = 'submit_documents_grouped'
+        frappe.db.savepoint(save_point)
+        try:
+            doc = frappe.get_doc(doctype, row.name)
+            apply_bom_explosion(doc, explosion_cache)
+            doc.submit()
+            frappe.db.release_savepoint(save_point)
+            results[row.name] = 'success'
+        except Exception as submit_error:
+            frappe.db.rollback(save_point=save_point)
+            results[row.name] = f'submit失败: {str(submit_error)}'
+            frappe.log_error(f"{doctype} {row.name} 提交失败: {str(submit_error)}", "Work Order Submit Error")
+
+    return results
@@ -0,0 +1,171 @@
+"""
+工单 + Job Card 流式导出
+
+一条 LEFT JOIN 查询通过无缓冲游标（unbuffered cursor）逐行读取，边读边写出 NDJSON 或 CSV，
+内存占用与导出行数无关。过滤条件与 get_work_order_list 相同（同一 filters 生成工单子查询）。
+"""
+import csv
+import io
+import json
+
+import frappe
+from frappe.utils import now_datetime
+from werkzeug.wrappers import Response
+
+from rongguan_erp.utils.pagination import parse_order_by
+
+
+# 默认导出的工单字段
+EXPORT_WORK_ORDER_FIELDS = [
+    'name', 'production_item', 'item_name', 'qty', 'produced_qty', 'company',
+    'bom_no', 'status', 'docstatus', 'stock_uom', 'expected_delivery_date',
+    'planned_start_date', 'planned_end_date', 'fg_warehouse', 'wip_warehouse',
+    'sales_order', 'creation', 'modified'
+]
+
+# 导出的 Job Card 字段（CSV 中以 job_card_ 为前缀）
+EXPORT_JOB_CARD_FIELDS = [
+    'name', 'operation', 'workstation', 'status', 'for_quantity', 'total_completed_qty',
+    'total_time_in_mins', 'expected_start_date', 'expected_end_date',
+    'actual_start_date', 'actual_end_date', 'docstatus'
+]
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _valid_fields(doctype, fields, default):
+    """只保留表中存在的字段，避免拼接任意字段名"""
+    meta = frappe.get_meta(doctype)
+    valid = [
+        f for f in (fields or default)
+        if f in ('name', 'creation', 'modified', 'owner', 'docstatus') or meta.has_field(f)
+    ]
+    if 'name' not in valid:
+        valid.insert(0, 'name')
+    return valid
+
+
+def build_export_query(filters=None, order_by=None, fields=None):
+    """
+    生成导出用的 SQL：过滤后的工单 LEFT JOIN Job Card，按工单排序、工单内按 Job Card 创建时间排序
+
+    Returns:
+        tuple: (SQL, 工单字段列表, Job Card 字段列表)
+    """
+    work_order_fields = _valid_fields('Work Order', fields, EXPORT_WORK_ORDER_FIELDS)
+    job_card_fields = _valid_fields('Job Card', None, EXPORT_JOB_CARD_FIELDS)
+
+    sort_field, direction = parse_order_by(order_by) or ('creation', 'desc')
+    if sort_field not in ('name', 'creation', 'modified') and not frappe.get_meta('Work Order').has_field(sort_field):
+        sort_field, direction = 'creation', 'desc'
+
+    # 与 get_work_order_list 相同的 filters，由 frappe.get_all 生成工单名称子查询
+    names_query = frappe.get_all(
+        'Work Order',
+        filters=filters,
+        fields=['name'],
+        limit_page_length=0,
+        run=0
+    )
+
+    select_fields = [f'wo.`{f}` AS `{f}`' for f in work_order_fields]
+    select_fields += [f'jc.`{f}` AS `job_card_{f}`' for f in job_card_fields]
+    query = f"""
+        SELECT {', '.join(select_fields)}
+        FROM `tabWork Order` wo
+        LEFT JOIN `tabJob Card` jc ON jc.work_order = wo.name
+        WHERE wo.name IN ({names_query})
+        ORDER BY wo.`{sort_field}` {direction}, wo.`name` {direction}, jc.creation ASC
+    """
+    return query, work_order_fields, job_card_fields
+
+
+def _iter_export_rows(site, sites_path, user, query):
+    """
+    在独立的数据库连接上用无缓冲游标逐行读取
+
+    响应体在请求结束（frappe.destroy）之后才被迭代，因此生成器里重新建立站点上下文。
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user(user)
+    try:
+        with frappe.db.unbuffered_cursor():
+            for row in frappe.db.sql(query, as_dict=True, as_iterator=True):
+                yield row
+    finally:
+        frappe.destroy()
+
+
+def _to_json_line(value):
+    return json.dumps(value, default=str, ensure_ascii=False) + '\n'
+
+
+def _iter_ndjson(rows, work_order_fields, job_card_fields):
+    """每个工单一行，job_cards 为数组；同一工单的行是连续的，只需缓存当前工单"""
+    current = None
+    for row in rows:
+        if current is None or current['name'] != row['name']:
+            if current is not None:
+                yield _to_json_line(current)
+            current = {f: row[f] for f in work_order_fields}
+            current['job_cards'] = []
+        if row['job_card_name']:
+            current['job_cards'].append({f: row[f'job_card_{f}'] for f in job_card_fields})
+    if current is not None:
+        yield _to_json_line(current)
+
+
+def _iter_csv(rows, work_order_fields, job_card_fields):
+    """每个 Job Card 一行（没有 Job Card 的工单输出一行空 Job Card 列）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = work_order_fields + [f'job_card_{f}' for f in job_card_fields]
+
+    # BOM 便于 Excel 正确识别 UTF-8 中文
+    writer.writerow(columns)
+    yield '\ufeff' + buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerow(['' if row[c] is None else row[c] for c in columns])
+        yield buffer.getvalue()
+
+
+@frappe.whitelist()
+def export_work_orders(filters=None, export_format='ndjson', order_by=None, fields=None):
+    """
+    流式导出工单及其 Job Card（规划表格用）
+
+    Args:
+        filters: 过滤条件，与 get_work_order_list 相同
+        export_format: ndjson（每行一个工单，带 job_cards 数组）或 csv（每行一个 Job Card）
+        order_by: 单字段排序，默认 creation desc
+        fields: 工单字段列表（可选）
+
+    Returns:
+        Response: 流式下载响应
+    """
+    if isinstance(filters, str):
+        filters = json.loads(filters) if filters else None
+    if isinstance(fields, str):
+        fields = json.loads(fields) if fields else None
+
+    export_format = (export_format or 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        frappe.throw(f'不支持的导出格式: {export_format}')
+
+    query, work_order_fields, job_card_fields = build_export_query(filters, order_by, fields)
+    rows = _iter_export_rows(frappe.local.site, frappe.local.sites_path, frappe.session.user, query)
+    body = (_iter_ndjson if export_format == 'ndjson' else _iter_csv)(rows, work_order_fields, job_card_fields)
+
+    filename = f'work_orders_{now_datetime().strftime("%Y%m%d%H%M%S")}.{export_format}'
+    return Response(
+        (chunk.encode('utf-8') for chunk in body),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        direct_passthrough=True
+    )
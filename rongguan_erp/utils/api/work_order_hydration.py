@@ -0,0 +1,508 @@
+"""
+工单列表批量装配（hydration）
+按整页工单一次性加载子表、分配、纸样单与 Job Card（含子表），
+每类数据只发一条 IN (...) 查询，然后在内存中拼装，查询数与页大小无关。
+
+支持按需展开（expand）与子表字段投影（child_fields），
+调用方未请求的数据既不查询也不序列化。
+"""
+import json
+from collections import defaultdict
+
+import frappe
+
+
+# Job Card 子表（与 get_work_order_list 原有返回的 sub_tables 键保持一致）
+JOB_CARD_SUB_TABLES = ['items', 'sub_operations', 'time_logs', 'scheduled_time_logs', 'scrap_items']
+
+# 按需展开时 Job Card 主表的默认字段
+JOB_CARD_LIST_FIELDS = [
+    'name', 'operation', 'workstation', 'status', 'for_quantity',
+    'total_completed_qty', 'actual_start_date', 'actual_end_date',
+    'expected_start_date', 'expected_end_date', 'time_required',
+    'total_time_in_mins', 'posting_date', 'remarks', 'docstatus',
+    'creation', 'modified', 'owner', 'modified_by'
+]
+
+# pattern_maker 展开时只取纸样单的纸样师信息
+PATTERN_MAKER_FIELDS = ['name', 'pattern_maker', 'pattern_maker_name', 'sales_order', 'pattern_number']
+
+# 非子表的可展开项
+EXPAND_ASSIGNMENTS = 'assignments'
+EXPAND_PATTERN_MAKER = 'pattern_maker'
+EXPAND_PAPER_PATTERN = 'paper_pattern'
+EXPAND_JOB_CARDS = 'job_cards'
+EXPAND_ALL = ('all', '*')
+
+# 所有行都带的标准字段（不在 meta.fields 中）
+STANDARD_FIELDS = ['name', 'owner', 'creation', 'modified', 'modified_by', 'docstatus', 'idx', 'parent']
+
+
+def _get_table_fields(doctype, only=None):
+    """返回 doctype 的子表字段 [(fieldname, child_doctype)]，可用 only 限定字段名"""
+    table_fields = []
+    for df in frappe.get_meta(doctype).get_table_fields():
+        if only is not None and df.fieldname not in only:
+            continue
+        table_fields.append((df.fieldname, df.options))
+    return table_fields
+
+
+def _project_fields(doctype, fields, required=None):
+    """
+    校验并投影字段：只保留 doctype 中存在的字段，无效字段记录日志后丢弃，
+    并保证 required 中的字段（用于分组/拼装）一定被查询
+
+    Returns:
+        tuple: (查询字段列表, 需要在结果中去掉的辅助字段集合)
+    """
+    if not fields or fields == ['*']:
+        return ['*'], set()
+
+    meta = frappe.get_meta(doctype)
+    valid_fields = []
+    for field in fields:
+        if field in STANDARD_FIELDS or meta.has_field(field):
+            valid_fields.append(field)
+        else:
+            frappe.log_error(f"字段 {field} 在{doctype}中不存在", "Work Order List Field Error")
+
+    if not valid_fields:
+        return ['*'], set()
+
+    helper_fields = set()
+    for field in required or []:
+        if field not in valid_fields:
+            valid_fields.append(field)
+            helper_fields.add(field)
+    return valid_fields, helper_fields
+
+
+def _strip(rows, helper_fields):
+    """去掉仅用于拼装的辅助字段"""
+    if helper_fields:
+        for row in rows:
+            for field in helper_fields:
+                row.pop(field, None)
+    return rows
+
+
+def load_child_tables(parent_doctype, parent_names, only=None, fields_map=None):
+    """
+    批量加载父表的子表行，每个子表一条查询
+
+    Args:
+        parent_doctype: 父表 doctype
+        parent_names: 父表名称列表
+        only: 只加载这些子表字段（None 表示全部）
+        fields_map: 子表字段投影 {fieldname: [字段]}，未指定的子表取全部字段
+
+    Returns:
+        dict: {fieldname: {parent_name: [row, ...]}}
+    """
+    result = {}
+    if not parent_names:
+        return result
+
+    fields_map = fields_map or {}
+    for fieldname, child_doctype in _get_table_fields(parent_doctype, only):
+        fields, helper_fields = _project_fields(child_doctype, fields_map.get(fieldname), required=['parent'])
+        rows = frappe.get_all(
+            child_doctype,
+            filters={
+                'parent': ['in', list(parent_names)],
+                'parenttype': parent_doctype,
+                'parentfield': fieldname
+            },
+            fields=fields,
+            order_by='idx asc'
+        )
+        grouped = defaultdict(list)
+        for row in rows:
+            parent = row.parent
+            if fields == ['*']:
+                row['doctype'] = child_doctype
+            grouped[parent].append(row)
+        for group in grouped.values():
+            _strip(group, helper_fields)
+        result[fieldname] = grouped
+
+    return result
+
+
+def load_docs(doctype, names, only_tables=None, fields=None):
+    """
+    批量加载文档主表与子表，返回 {name: dict}；
+    不做投影时结构与 doc.as_dict() 一致
+    """
+    names = [name for name in set(names or []) if name]
+    if not names:
+        return {}
+
+    query_fields = _project_fields(doctype, fields, required=['name'])[0]
+    rows = frappe.get_all(doctype, filters={'name': ['in', names]}, fields=query_fields)
+    child_tables = load_child_tables(doctype, names, only=only_tables) if only_tables != [] else {}
+
+    docs = {}
+    for row in rows:
+        if query_fields == ['*']:
+            row['doctype'] = doctype
+        for fieldname, grouped in child_tables.items():
+            row[fieldname] = grouped.get(row.name, [])
+        docs[row.name] = row
+    return docs
+
+
+def load_assignments(doctype, names):
+    """
+    批量获取分配信息，返回 {name: [{'owner': ..., 'name': ...}]}，
+    与 frappe.desk.form.assign_to.get 的返回格式一致
+    """
+    assignments = defaultdict(list)
+    if not names:
+        return assignments
+
+    todos = frappe.get_all(
+        'ToDo',
+        filters={
+            'reference_type': doctype,
+            'reference_name': ['in', list(names)],
+            'status': ['not in', ['Cancelled', 'Closed']],
+            'allocated_to': ['is', 'set']
+        },
+        fields=['allocated_to as owner', 'name', 'reference_name'],
+        order_by='creation asc'
+    )
+    for todo in todos:
+        reference_name = todo.pop('reference_name')
+        assignments[reference_name].append(todo)
+    return assignments
+
+
+def load_job_cards(work_order_names, fields=None, sub_tables=None, sub_table_fields=None):
+    """
+    批量获取工单的 Job Card 及其子表，返回 {work_order: [job_card_dict]}，
+    每个 job_card_dict 额外带 sub_tables（仅包含非空子表）
+
+    Args:
+        work_order_names: 工单名称列表
+        fields: Job Card 主表字段（None 表示全部字段）
+        sub_tables: 要加载的 Job Card 子表（None 表示全部）
+        sub_table_fields: 子表字段投影 {fieldname: [字段]}
+    """
+    job_cards_by_work_order = defaultdict(list)
+    if not work_order_names:
+        return job_cards_by_work_order
+
+    query_fields, helper_fields = _project_fields('Job Card', fields, required=['name', 'work_order'])
+    job_cards = frappe.get_all(
+        'Job Card',
+        filters={'work_order': ['in', list(work_order_names)]},
+        fields=query_fields,
+        order_by='creation asc'
+    )
+    if not job_cards:
+        return job_cards_by_work_order
+
+    if sub_tables is None:
+        sub_tables = JOB_CARD_SUB_TABLES
+    child_tables = {}
+    if sub_tables:
+        child_tables = load_child_tables(
+            'Job Card', [jc.name for jc in job_cards],
+            only=sub_tables, fields_map=sub_table_fields
+        )
+
+    for job_card in job_cards:
+        if query_fields == ['*']:
+            job_card['doctype'] = 'Job Card'
+        job_card_sub_tables = {}
+        for fieldname, grouped in child_tables.items():
+            rows = grouped.get(job_card.name, [])
+            if query_fields == ['*']:
+                job_card[fieldname] = rows
+            if rows:
+                job_card_sub_tables[fieldname] = rows
+        job_card['sub_tables'] = job_card_sub_tables
+        job_cards_by_work_order[job_card.work_order].append(job_card)
+
+    _strip(job_cards, helper_fields)
+    return job_cards_by_work_order
+
+
+def summarize_job_cards(work_order_names):
+    """
+    用一条 GROUP BY 聚合查询汇总工单的 Job Card 进度，不加载 Job Card 文档
+
+    按 (work_order, operation, status) 聚合，再在内存中合并为每个工单、每道工序的
+    计划数量、完成数量、用时与各状态的 Job Card 数。
+
+    Args:
+        work_order_names: 工单名称列表
+
+    Returns:
+        dict: {work_order: {'total_job_cards', 'total_quantity', 'total_completed_qty',
+                            'total_time_in_mins', 'status_counts', 'operations': [...]}}
+    """
+    summaries = {}
+    if not work_order_names:
+        return summaries
+
+    rows = frappe.db.sql("""
+        SELECT
+            work_order, operation, status,
+            COUNT(*) AS job_card_count,
+            SUM(IFNULL(for_quantity, 0)) AS for_quantity,
+            SUM(IFNULL(total_completed_qty, 0)) AS total_completed_qty,
+            SUM(IFNULL(total_time_in_mins, 0)) AS total_time_in_mins,
+            MIN(creation) AS first_creation
+        FROM `tabJob Card`
+        WHERE work_order IN %(work_orders)s
+        GROUP BY work_order, operation, status
+        ORDER BY work_order, first_creation
+    """, {'work_orders': tuple(work_order_names)}, as_dict=True)
+
+    for row in rows:
+        summary = summaries.setdefault(row.work_order, {
+            'total_job_cards': 0,
+            'total_quantity': 0,
+            'total_completed_qty': 0,
+            'total_time_in_mins': 0,
+            'status_counts': {},
+            'operations': {}
+        })
+        operation = summary['operations'].setdefault(row.operation, {
+            'operation': row.operation,
+            'job_card_count': 0,
+            'for_quantity': 0,
+            'completed_qty': 0,
+            'total_time_in_mins': 0,
+            'status_counts': {}
+        })
+        status = row.status or 'Unknown'
+
+        for target in (summary, operation):
+            target['status_counts'][status] = target['status_counts'].get(status, 0) + row.job_card_count
+        summary['total_job_cards'] += row.job_card_count
+        summary['total_quantity'] += row.for_quantity
+        summary['total_completed_qty'] += row.total_completed_qty
+        summary['total_time_in_mins'] += row.total_time_in_mins
+        operation['job_card_count'] += row.job_card_count
+        operation['for_quantity'] += row.for_quantity
+        operation['completed_qty'] += row.total_completed_qty
+        operation['total_time_in_mins'] += row.total_time_in_mins
+
+    for summary in summaries.values():
+        summary['operations'] = list(summary['operations'].values())
+    return summaries
+
+
+def parse_expand(expand):
+    """
+    解析 expand 参数
+
+    支持逗号分隔字符串或 JSON 列表，例如
+    "required_items,operations,job_cards.time_logs,assignments,pattern_maker"；
+    "all" 或 "*" 表示展开全部（与旧版完整返回一致）。
+
+    Returns:
+        dict | None: {'all': bool, 'keys': set, 'job_card_tables': set}；未请求展开时返回 None
+    """
+    if not expand:
+        return None
+
+    if isinstance(expand, str):
+        try:
+            parsed = json.loads(expand)
+            expand = parsed if isinstance(parsed, list) else expand
+        except (json.JSONDecodeError, TypeError):
+            pass
+    if isinstance(expand, str):
+        expand = expand.split(',')
+
+    tokens = [str(token).strip() for token in expand if str(token).strip()]
+    if not tokens:
+        return None
+
+    spec = {'all': False, 'keys': set(), 'job_card_tables': set()}
+    for token in tokens:
+        if token in EXPAND_ALL:
+            spec['all'] = True
+        elif token.startswith(EXPAND_JOB_CARDS + '.'):
+            spec['keys'].add(EXPAND_JOB_CARDS)
+            sub_table = token.split('.', 1)[1]
+            if sub_table in JOB_CARD_SUB_TABLES:
+                spec['job_card_tables'].add(sub_table)
+            elif sub_table in EXPAND_ALL:
+                spec['job_card_tables'].update(JOB_CARD_SUB_TABLES)
+        else:
+            spec['keys'].add(token)
+    return spec
+
+
+def parse_child_fields(child_fields):
+    """
+    解析子表字段投影参数，例如
+    {"required_items": ["item_code", "required_qty"], "job_cards": ["name", "status"],
+     "job_cards.time_logs": ["employee", "completed_qty"]}
+    """
+    if not child_fields:
+        return {}
+    if isinstance(child_fields, str):
+        try:
+            child_fields = json.loads(child_fields)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+    if not isinstance(child_fields, dict):
+        return {}
+
+    parsed = {}
+    for key, fields in child_fields.items():
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(',') if f.strip()]
+        if isinstance(fields, list) and fields:
+            parsed[key] = fields
+    return parsed
+
+
+def expand_work_orders(work_orders, expand_spec, child_fields=None):
+    """
+    为列表查询得到的工单行按需附加 sub_tables，只加载 expand 中请求的数据
+
+    Args:
+        work_orders: 列表查询返回的工单行（需包含 name）
+        expand_spec: parse_expand 的结果
+        child_fields: parse_child_fields 的结果
+
+    Returns:
+        list: 附加了 sub_tables 的工单行
+    """
+    if not work_orders or not expand_spec:
+        return work_orders
+
+    if expand_spec['all']:
+        return hydrate_work_orders([wo.name for wo in work_orders])
+
+    child_fields = child_fields or {}
+    names = [wo.name for wo in work_orders]
+    keys = expand_spec['keys']
+    sub_tables_by_name = defaultdict(dict)
+
+    table_fields = [
+        fieldname for fieldname, _child in _get_table_fields('Work Order') if fieldname in keys
+    ]
+    if table_fields:
+        child_tables = load_child_tables(
+            'Work Order', names, only=table_fields, fields_map=child_fields
+        )
+        for fieldname, grouped in child_tables.items():
+            for name in names:
+                sub_tables_by_name[name][fieldname] = grouped.get(name, [])
+
+    if EXPAND_ASSIGNMENTS in keys:
+        assignments = load_assignments('Work Order', names)
+        for name in names:
+            sub_tables_by_name[name][EXPAND_ASSIGNMENTS] = assignments.get(name, [])
+
+    if EXPAND_PATTERN_MAKER in keys or EXPAND_PAPER_PATTERN in keys:
+        # 通过 work order 的 custom_sales_order 字段获取对应的纸样单
+        pattern_keys = {}
+        if frappe.get_meta('Work Order').has_field('custom_sales_order'):
+            pattern_keys = dict(frappe.get_all(
+                'Work Order',
+                filters={'name': ['in', names]},
+                fields=['name', 'custom_sales_order'],
+                as_list=True
+            ))
+        full_pattern = EXPAND_PAPER_PATTERN in keys
+        paper_patterns = load_docs(
+            'RG Paper Pattern',
+            pattern_keys.values(),
+            only_tables=None if full_pattern else [],
+            fields=child_fields.get(EXPAND_PAPER_PATTERN) if full_pattern else PATTERN_MAKER_FIELDS
+        )
+        output_key = EXPAND_PAPER_PATTERN if full_pattern else EXPAND_PATTERN_MAKER
+        for name in names:
+            sub_tables_by_name[name][output_key] = paper_patterns.get(pattern_keys.get(name)) or {}
+
+    if EXPAND_JOB_CARDS in keys:
+        job_card_tables = sorted(expand_spec['job_card_tables'])
+        job_cards = load_job_cards(
+            names,
+            fields=child_fields.get(EXPAND_JOB_CARDS) or JOB_CARD_LIST_FIELDS,
+            sub_tables=job_card_tables,
+            sub_table_fields={
+                table: child_fields[f'{EXPAND_JOB_CARDS}.{table}']
+                for table in job_card_tables
+                if f'{EXPAND_JOB_CARDS}.{table}' in child_fields
+            }
+        )
+        for name in names:
+            sub_tables_by_name[name][EXPAND_JOB_CARDS] = job_cards.get(name, [])
+
+    for work_order in work_orders:
+        work_order['sub_tables'] = sub_tables_by_name.get(work_order.name, {})
+    return work_orders
+
+
+def hydrate_work_orders(work_order_names):
+    """
+    按整页装配工单完整详情（主表、子表、分配、纸样单、Job Card），即 expand=all
+
+    查询数固定：工单主表 1 条 + 每个工单子表 1 条 + 分配 1 条
+    + 纸样单主表/子表若干条 + Job Card 1 条 + 每个 Job Card 子表 1 条。
+
+    Args:
+        work_order_names: 工单名称列表（决定返回顺序）
+
+    Returns:
+        list: 工单字典列表，结构与原逐条 get_doc(...).as_dict() 加 sub_tables 一致
+    """
+    work_order_names = [name for name in work_order_names if name]
+    if not work_order_names:
+        return []
+
+    work_orders = load_docs('Work Order', work_order_names)
+    table_fieldnames = [fieldname for fieldname, _child in _get_table_fields('Work Order')]
+
+    try:
+        assignments = load_assignments('Work Order', work_order_names)
+    except Exception as assignment_error:
+        assignments = {}
+        frappe.log_error(f"批量获取工单分配信息失败: {str(assignment_error)}")
+
+    # 通过 work order 的 custom_sales_order 字段获取对应的纸样单（含纸样师信息）
+    try:
+        paper_patterns = load_docs(
+            'RG Paper Pattern',
+            [wo.get('custom_sales_order') for wo in work_orders.values()]
+        )
+    except Exception as paper_pattern_error:
+        paper_patterns = {}
+        frappe.log_error(f"批量获取纸样单信息失败: {str(paper_pattern_error)}")
+
+    try:
+        job_cards = load_job_cards(work_order_names)
+    except Exception as job_card_error:
+        job_cards = {}
+        frappe.log_error(f"批量获取 Job Card 信息失败: {str(job_card_error)}")
+
+    detailed_work_orders = []
+    for name in work_order_names:
+        work_order = work_orders.get(name)
+        if not work_order:
+            continue
+
+        sub_tables = {}
+        for fieldname in table_fieldnames:
+            if work_order.get(fieldname):
+                sub_tables[fieldname] = work_order[fieldname]
+
+        sub_tables['assignments'] = assignments.get(name, [])
+        sub_tables['paper_pattern'] = paper_patterns.get(work_order.get('custom_sales_order')) or []
+        sub_tables['job_cards'] = job_cards.get(name, [])
+
+        work_order['sub_tables'] = sub_tables
+        detailed_work_orders.append(work_order)
+
+    return detailed_work_orders
@@ -0,0 +1,215 @@
+"""
+批量创建工单的预校验与 BOM 元数据复用
+
+预校验：收集整批工单中出现的 bom_no、production_item、company、仓库、工序和销售订单，
+每类只发一条 IN (...) 查询校验存在性与状态，逐行给出错误；全部通过后才开始插入。
+
+插入阶段：ERPNext 的 Work Order.validate 会对每一行重新展开 BOM 物料。
+BomExplosionCache 在一批内按 BOM 缓存展开结果，apply_bom_explosion 在插入前把结果设置到每个工单上，
+共用同一 BOM 的行只展开一次。BOM 的存在性、状态与所属物料已由预校验用集合查询检查。
+"""
+import copy
+
+import frappe
+from frappe.utils import cint, flt
+
+
+def _distinct(values):
+    """去重并去掉空值，保持原有顺序"""
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def _fetch_by_name(doctype, names, fields=None):
+    """按 name 批量查询，返回 {name: row}；fields 为空时只校验存在性"""
+    if not names:
+        return {}
+    fields = ['name'] + [f for f in (fields or []) if f != 'name']
+    rows = frappe.get_all(doctype, filters={'name': ['in', names]}, fields=fields)
+    return {row.name: row for row in rows}
+
+
+def _row_warehouses(work_order_data):
+    """一行工单引用的仓库：(字段说明, 仓库名)"""
+    warehouses = []
+    for field, label in (('fg_warehouse', '成品仓库'), ('wip_warehouse', '在制品仓库')):
+        if work_order_data.get(field):
+            warehouses.append((label, work_order_data.get(field)))
+    for item in work_order_data.get('required_items') or []:
+        if isinstance(item, dict) and item.get('source_warehouse'):
+            warehouses.append((f"物料 {item.get('item_code')} 的源仓库", item.get('source_warehouse')))
+    return warehouses
+
+
+def _row_operations(work_order_data):
+    """一行工单引用的工序名"""
+    operations = work_order_data.get('operations')
+    if not isinstance(operations, list):
+        return []
+    return [op.get('operation') for op in operations if isinstance(op, dict) and op.get('operation')]
+
+
+def prevalidate_work_orders(work_orders_data):
+    """
+    用集合查询预校验整批工单的链接字段
+
+    每类链接一条查询（物料、BOM、公司、仓库、工序、销售订单），与批量大小无关。
+    校验规则与 Work Order.validate 中对应的检查保持一致，提前在插入前失败。
+
+    Args:
+        work_orders_data: 工单数据列表（已通过必需字段检查）
+
+    Returns:
+        list: 错误信息列表，格式与 _create_work_orders_without_transaction 的 errors 一致
+    """
+    rows = [row if isinstance(row, dict) else {} for row in work_orders_data]
+
+    items = _fetch_by_name(
+        'Item',
+        _distinct(
+            [row.get('production_item') for row in rows]
+            + [item.get('item_code') for row in rows for item in (row.get('required_items') or []) if isinstance(item, dict)]
+        ),
+        ['disabled', 'has_variants', 'variant_of']
+    )
+    boms = _fetch_by_name(
+        'BOM', _distinct(row.get('bom_no') for row in rows), ['item', 'is_active', 'docstatus']
+    )
+    companies = _fetch_by_name('Company', _distinct(row.get('company') for row in rows))
+    warehouses = _fetch_by_name(
+        'Warehouse',
+        _distinct(wh for row in rows for _, wh in _row_warehouses(row)),
+        ['company']
+    )
+    operations = _fetch_by_name('Operation', _distinct(op for row in rows for op in _row_operations(row)))
+    sales_orders = _fetch_by_name(
+        'Sales Order', _distinct(row.get('sales_order') for row in rows), ['docstatus']
+    )
+
+    errors = []
+    for i, row in enumerate(rows):
+        prefix = f'第{i+1}个工单'
+
+        production_item = row.get('production_item')
+        item = items.get(production_item)
+        if production_item and not item:
+            errors.append(f'{prefix}的生产物料不存在: {production_item}')
+        elif item and item.disabled:
+            errors.append(f'{prefix}的生产物料已禁用: {production_item}')
+        elif item and item.has_variants:
+            errors.append(f'{prefix}的生产物料是模板物料，不能创建工单: {production_item}')
+
+        bom_no = row.get('bom_no')
+        bom = boms.get(bom_no)
+        if bom_no and not bom:
+            errors.append(f'{prefix}的BOM不存在: {bom_no}')
+        elif bom:
+            if bom.docstatus != 1:
+                errors.append(f'{prefix}的BOM未提交: {bom_no}')
+            elif not bom.is_active:
+                errors.append(f'{prefix}的BOM未启用: {bom_no}')
+            if item and bom.item not in (production_item, item.variant_of):
+                errors.append(f'{prefix}的BOM {bom_no} 不属于物料 {production_item}')
+
+        company = row.get('company')
+        if company and company not in companies:
+            errors.append(f'{prefix}的公司不存在: {company}')
+
+        for label, warehouse in _row_warehouses(row):
+            if warehouse not in warehouses:
+                errors.append(f'{prefix}的{label}不存在: {warehouse}')
+            elif company and warehouses[warehouse].company != company:
+                errors.append(f'{prefix}的{label} {warehouse} 不属于公司 {company}')
+
+        for required_item in row.get('required_items') or []:
+            if isinstance(required_item, dict) and required_item.get('item_code') \
+                    and required_item.get('item_code') not in items:
+                errors.append(f"{prefix}的所需物料不存在: {required_item.get('item_code')}")
+
+        for operation in _row_operations(row):
+            if operation not in operations:
+                errors.append(f'{prefix}的工序不存在: {operation}')
+
+        sales_order = row.get('sales_order')
+        if sales_order and sales_order not in sales_orders:
+            errors.append(f'{prefix}的销售订单不存在: {sales_order}')
+        elif sales_order and sales_orders[sales_order].docstatus != 1:
+            errors.append(f'{prefix}的销售订单未提交: {sales_order}')
+
+    return errors
+
+
+class BomExplosionCache:
+    """
+    一批工单内共用的 BOM 展开结果：每个 (BOM, 公司, 是否多级) 按单位数量展开一次，各行按自身数量缩放
+
+    由调用方创建并显式传给 apply_bom_explosion，只在本批次内有效，不影响其他请求。
+    """
+
+    def __init__(self):
+        self._unit_items = {}
+
+    def get_items(self, bom_no, company, qty, fetch_exploded=1):
+        from erpnext.manufacturing.doctype.bom.bom import get_bom_items_as_dict
+
+        key = (bom_no, company, cint(fetch_exploded))
+        if key not in self._unit_items:
+            self._unit_items[key] = get_bom_items_as_dict(bom_no, company, qty=1, fetch_exploded=cint(fetch_exploded))
+
+        # 展开结果的数量与 qty 成正比，其余字段与数量无关
+        item_dict = copy.deepcopy(self._unit_items[key])
+        for row in item_dict.values():
+            row['qty'] = flt(row.get('qty')) * flt(qty)
+        return item_dict
+
+
+def apply_bom_explosion(work_order, explosion_cache):
+    """
+    插入 / 提交前用批次缓存设置工单的所需物料
+
+    - 未提供 required_items 时按缓存的展开结果填充（字段与 Work Order.set_required_items 一致）
+    - 只替换该工单实例的 set_required_items：validate 中按数量重算 required_qty 时读取缓存，
+      不再对每行重新展开 BOM；其他情况仍调用 ERPNext 原方法
+    """
+    if work_order.doctype != 'Work Order' or not work_order.bom_no:
+        return
+
+    def get_item_dict():
+        return explosion_cache.get_items(
+            work_order.bom_no, work_order.company, work_order.qty, work_order.use_multi_level_bom
+        )
+
+    operations = work_order.get('operations') or []
+    operation = operations[0].operation if len(operations) == 1 else None
+
+    if work_order.qty and not work_order.get('required_items'):
+        for item in sorted(get_item_dict().values(), key=lambda d: d.get('idx') or float('inf')):
+            work_order.append('required_items', {
+                'rate': item.get('rate'),
+                'amount': flt(item.get('rate')) * flt(item.get('qty')),
+                'operation': item.get('operation') or operation,
+                'item_code': item.get('item_code'),
+                'item_name': item.get('item_name'),
+                'description': item.get('description'),
+                'allow_alternative_item': item.get('allow_alternative_item'),
+                'required_qty': item.get('qty'),
+                'source_warehouse': item.get('source_warehouse') or item.get('default_warehouse'),
+                'include_item_in_manufacturing': item.get('include_item_in_manufacturing')
+            })
+            if not work_order.project:
+                work_order.project = item.get('project')
+
+    original_set_required_items = work_order.set_required_items
+
+    def set_required_items(reset_only_qty=False):
+        if not (reset_only_qty and work_order.qty):
+            return original_set_required_items(reset_only_qty=reset_only_qty)
+
+        item_dict = get_item_dict()
+        for row in work_order.get('required_items'):
+            if item_dict.get(row.item_code):
+                row.required_qty = item_dict.get(row.item_code).get('qty')
+            if not row.operation:
+                row.operation = operation
+        work_order.set_available_qty()
+
+    work_order.set_required_items = set_required_items
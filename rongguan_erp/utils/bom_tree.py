@@ -0,0 +1,101 @@
+"""
+BOM 树
+
+从根 BOM 出发逐层加载：每一层的 BOM 头和 BOM Item 各一条 IN (...) 查询，
+子件通过 BOM Item.bom_no 指向下级 BOM。同一个下级 BOM（里布、辅料等公共半成品）
+无论被多少个父件引用只加载一次，在结果中也只出现一个节点。
+
+返回扁平的邻接表（nodes + children），前端可按需逐层渲染；
+可限制展开深度，超出深度的节点标记为 expandable，之后再以该 BOM 为根继续加载。
+层数超过 MAX_BOM_TREE_DEPTH 时停止展开，环通过拓扑排序检出并在结果中列出。
+"""
+import frappe
+from frappe.utils import cint, flt
+
+from rongguan_erp.utils.api.bom_dependency import topological_order
+
+
+# 防止异常数据导致无限展开的最大层数
+MAX_BOM_TREE_DEPTH = 20
+
+BOM_NODE_FIELDS = [
+    "name", "item", "item_name", "quantity", "uom", "company", "currency",
+    "is_active", "is_default", "docstatus", "total_cost", "raw_material_cost", "operating_cost"
+]
+BOM_EDGE_FIELDS = [
+    "parent", "idx", "item_code", "item_name", "qty", "uom", "stock_qty", "stock_uom",
+    "rate", "amount", "bom_no", "source_warehouse", "operation"
+]
+
+
+def load_bom_tree(root_bom, depth=None):
+    """
+    逐层加载 BOM 树
+
+    Args:
+        root_bom: 根 BOM 编号
+        depth: 展开深度（根为第 0 层，只加载到第 depth 层的 BOM）；为空时展开到 MAX_BOM_TREE_DEPTH
+
+    Returns:
+        dict: {
+            "root": 根 BOM,
+            "nodes": {bom_no: BOM 头信息 + depth（首次出现的层数）+ expandable},
+            "children": {bom_no: [子件行，bom_no 为下级 BOM 或 None]},
+            "truncated": 因深度限制未展开的 BOM,
+            "cyclic_boms": 处于环中的 BOM
+        }
+    """
+    max_depth = min(cint(depth), MAX_BOM_TREE_DEPTH) if depth not in (None, "") else MAX_BOM_TREE_DEPTH
+
+    nodes = {}
+    children = {}
+    level = [root_bom]
+    current_depth = 0
+    while level:
+        for bom in frappe.get_all("BOM", filters={"name": ["in", level]}, fields=BOM_NODE_FIELDS):
+            bom.depth = current_depth
+            bom.expandable = False
+            nodes[bom.name] = bom
+
+        loaded = [bom_no for bom_no in level if bom_no in nodes]
+        if current_depth >= max_depth:
+            break
+
+        for bom_no in loaded:
+            children[bom_no] = []
+        for row in frappe.get_all(
+            "BOM Item",
+            filters={"parent": ["in", loaded], "parenttype": "BOM"},
+            fields=BOM_EDGE_FIELDS,
+            order_by="parent asc, idx asc",
+            limit_page_length=0
+        ):
+            row.qty = flt(row.qty)
+            row.stock_qty = flt(row.stock_qty)
+            row.bom_no = row.bom_no or None
+            children[row.pop("parent")].append(row)
+
+        # 已加载过的下级 BOM 不再重复加载
+        level = list(dict.fromkeys(
+            row.bom_no for bom_no in loaded for row in children[bom_no]
+            if row.bom_no and row.bom_no not in nodes
+        ))
+        current_depth += 1
+
+    truncated = []
+    for bom_no, node in nodes.items():
+        if bom_no not in children:
+            node.expandable = True
+            truncated.append(bom_no)
+
+    _, cyclic = topological_order({
+        bom_no: [row.bom_no for row in rows if row.bom_no] for bom_no, rows in children.items()
+    })
+
+    return {
+        "root": root_bom,
+        "nodes": nodes,
+        "children": children,
+        "truncated": truncated,
+        "cyclic_boms": [bom_no for bom_no in cyclic if bom_no in children],
+    }
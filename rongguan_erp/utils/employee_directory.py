@@ -0,0 +1,120 @@
+"""
+员工 → 用户目录服务
+批量把员工ID或用户ID解析为用户ID（User.name），一批只需常数次查询。
+
+Employee → user_id 的映射缓存在站点缓存中，
+通过 hooks.py 的 doc_events 在 Employee / User 变更时失效。
+"""
+import json
+
+import frappe
+
+
+EMPLOYEE_USER_MAP_CACHE_KEY = "rg_employee_user_map"
+
+
+def parse_id_list(id_input):
+    """
+    把员工ID/用户ID输入统一为字符串列表
+
+    Args:
+        id_input: 单个ID字符串、JSON 数组字符串或列表
+    """
+    if not id_input:
+        return []
+
+    if isinstance(id_input, str):
+        try:
+            # 尝试解析JSON字符串
+            id_list = json.loads(id_input)
+            if not isinstance(id_list, list):
+                id_list = [id_input]
+        except (json.JSONDecodeError, TypeError):
+            # 如果不是JSON，则作为单个ID处理
+            id_list = [id_input]
+    elif isinstance(id_input, list):
+        id_list = id_input
+    else:
+        id_list = [str(id_input)]
+
+    return [str(i).strip() for i in id_list if str(i).strip()]
+
+
+def _build_employee_user_map():
+    """一次查询构建 Employee → user_id 映射（只包含用户确实存在的员工）"""
+    rows = frappe.db.sql("""
+        SELECT e.name, e.user_id
+        FROM `tabEmployee` e
+        INNER JOIN `tabUser` u ON u.name = e.user_id
+        WHERE IFNULL(e.user_id, '') != ''
+    """)
+    return {name: user_id for name, user_id in rows}
+
+
+def get_employee_user_map():
+    """获取缓存的 Employee → user_id 映射"""
+    return frappe.cache().get_value(EMPLOYEE_USER_MAP_CACHE_KEY, generator=_build_employee_user_map) or {}
+
+
+def clear_employee_user_map(doc=None, method=None):
+    """Employee / User 变更时清除缓存（doc_events 回调）"""
+    frappe.cache().delete_value(EMPLOYEE_USER_MAP_CACHE_KEY)
+
+
+def resolve_user_ids(ids):
+    """
+    批量解析员工ID或用户ID
+
+    含 @ 且用户存在的视为用户ID，否则按员工ID查找其 user_id。
+    用户存在性检查一批一条查询，员工映射走站点缓存。
+
+    Args:
+        ids: ID 列表
+
+    Returns:
+        dict: {输入ID: 用户ID 或 None}
+    """
+    ids = list(dict.fromkeys(str(i).strip() for i in ids if i and str(i).strip()))
+    if not ids:
+        return {}
+
+    emails = [i for i in ids if '@' in i]
+    existing_users = set()
+    if emails:
+        existing_users = set(frappe.get_all('User', filters={'name': ['in', emails]}, pluck='name'))
+
+    employee_user_map = get_employee_user_map()
+    resolved = {}
+    for id_ in ids:
+        if id_ in existing_users:
+            resolved[id_] = id_
+        else:
+            resolved[id_] = employee_user_map.get(id_)
+    return resolved
+
+
+def resolve_user_id_lists(id_inputs):
+    """
+    批量解析多组员工ID/用户ID输入（例如一批工单各自的 assign_to）
+
+    Args:
+        id_inputs: 输入列表，每个元素格式同 parse_id_list 的参数
+
+    Returns:
+        list: 与 id_inputs 一一对应的 (用户ID列表, 无法解析的ID列表)
+    """
+    parsed_inputs = [parse_id_list(id_input) for id_input in id_inputs]
+    resolved = resolve_user_ids([i for ids in parsed_inputs for i in ids])
+
+    results = []
+    for ids in parsed_inputs:
+        user_ids = []
+        unresolved = []
+        for id_ in ids:
+            user_id = resolved.get(id_)
+            if user_id:
+                user_ids.append(user_id)
+            else:
+                unresolved.append(id_)
+        results.append((user_ids, unresolved))
+    return results
@@ -0,0 +1,142 @@
+"""
+BOM 展开结果缓存
+
+ERPNext get_bom_items_as_dict(fetch_exploded=1) 的结果与数量成正比，
+因此每个 BOM 只按单位数量展开一次，以紧凑的 字段列表 + 行数组 形式存入站点缓存，
+任意数量的请求都由缓存结果按比例缩放得到。
+
+缓存键为 (bom_no, BOM.modified, include_non_stock_items)：BOM 本身修改后键自然变化。
+每条缓存同时登记在它引用的所有下级 BOM 名下，
+hooks.py 的 doc_events 在 BOM 提交后更新、取消或删除时清除该 BOM 及所有引用它的上级 BOM 的缓存。
+BOM 成本更新（update_cost）不触发文档事件，缓存另设过期时间兜底。
+
+命中 / 未命中次数记在站点缓存计数器中，可通过 get_exploded_bom_cache_stats 查看。
+"""
+import frappe
+from frappe.utils import flt
+
+
+EXPLODED_BOM_CACHE_PREFIX = "rg_exploded_bom:"
+EXPLODED_BOM_PARENTS_PREFIX = "rg_exploded_bom_parents:"
+EXPLODED_BOM_TTL = 6 * 60 * 60
+EXPLODED_BOM_HITS_KEY = "rg_exploded_bom_stats:hits"
+EXPLODED_BOM_MISSES_KEY = "rg_exploded_bom_stats:misses"
+
+# 缓存行的字段顺序；SCALED_FIELDS 中的字段按数量缩放
+EXPLODED_BOM_FIELDS = (
+    "item_code", "item_name", "qty", "stock_uom", "rate", "amount", "source_warehouse",
+    "operation", "description", "item_group", "allow_alternative_item",
+    "include_item_in_manufacturing", "sourced_by_supplier",
+)
+SCALED_FIELDS = ("qty", "amount")
+FLOAT_FIELDS = ("qty", "rate", "amount")
+
+
+def _cache_key(bom_no, modified, include_non_stock_items):
+    return f"{EXPLODED_BOM_CACHE_PREFIX}{bom_no}:{modified}:{1 if include_non_stock_items else 0}"
+
+
+def _get_sub_boms(bom_no):
+    """一条递归查询取出 BOM 树中引用的所有下级 BOM"""
+    return [
+        row[0] for row in frappe.db.sql("""
+            WITH RECURSIVE sub_boms (bom_no) AS (
+                SELECT bi.bom_no
+                FROM `tabBOM Item` bi
+                WHERE bi.parent = %(bom_no)s AND bi.parenttype = 'BOM' AND IFNULL(bi.bom_no, '') != ''
+                UNION
+                SELECT bi.bom_no
+                FROM sub_boms s
+                JOIN `tabBOM Item` bi ON bi.parent = s.bom_no AND bi.parenttype = 'BOM'
+                WHERE IFNULL(bi.bom_no, '') != ''
+            )
+            SELECT bom_no FROM sub_boms
+        """, {"bom_no": bom_no})
+    ]
+
+
+def _build_unit_explosion(bom_no, company, include_non_stock_items):
+    """按单位数量展开 BOM，返回按物料编码排序的紧凑行"""
+    from erpnext.manufacturing.doctype.bom.bom import get_bom_items_as_dict
+
+    exploded = get_bom_items_as_dict(
+        bom=bom_no,
+        company=company,
+        qty=1,
+        fetch_exploded=1,
+        include_non_stock_items=include_non_stock_items
+    )
+    rows = [
+        [flt(item.get(field)) if field in FLOAT_FIELDS else item.get(field) for field in EXPLODED_BOM_FIELDS]
+        for item in sorted(exploded.values(), key=lambda item: item.get("item_code") or "")
+    ]
+    return {"fields": list(EXPLODED_BOM_FIELDS), "rows": rows}
+
+
+def get_unit_explosion(bom, include_non_stock_items=True):
+    """
+    取单位数量的 BOM 展开结果（紧凑形式），未命中时展开并写入缓存
+
+    Args:
+        bom: 含 name、company、modified 的 BOM 行
+        include_non_stock_items: 是否包含非库存物料
+
+    Returns:
+        dict: {"fields": 字段列表, "rows": 行数组}
+    """
+    cache = frappe.cache()
+    key = _cache_key(bom.name, bom.modified, include_non_stock_items)
+    explosion = cache.get_value(key)
+    if explosion is not None:
+        cache.incr(cache.make_key(EXPLODED_BOM_HITS_KEY))
+        return explosion
+
+    cache.incr(cache.make_key(EXPLODED_BOM_MISSES_KEY))
+    explosion = _build_unit_explosion(bom.name, bom.company, include_non_stock_items)
+    cache.set_value(key, explosion, expires_in_sec=EXPLODED_BOM_TTL)
+    for sub_bom in _get_sub_boms(bom.name):
+        cache.sadd(f"{EXPLODED_BOM_PARENTS_PREFIX}{sub_bom}", bom.name)
+    return explosion
+
+
+def scale_explosion(explosion, qty):
+    """把单位数量的展开结果按 qty 缩放为物料字典列表"""
+    fields = explosion["fields"]
+    qty = flt(qty)
+    items = []
+    for row in explosion["rows"]:
+        item = dict(zip(fields, row))
+        for field in SCALED_FIELDS:
+            item[field] = flt(item.get(field)) * qty
+        items.append(item)
+    return items
+
+
+def get_exploded_bom(bom, qty=1, include_non_stock_items=True):
+    """按 qty 返回 BOM 展开后的物料列表（按物料编码排序）"""
+    return scale_explosion(get_unit_explosion(bom, include_non_stock_items), qty)
+
+
+def clear_exploded_bom_cache(doc, method=None):
+    """BOM 变更时清除它及所有引用它的上级 BOM 的展开缓存（doc_events 回调）"""
+    cache = frappe.cache()
+    parents_key = f"{EXPLODED_BOM_PARENTS_PREFIX}{doc.name}"
+    boms = {doc.name}
+    boms.update(member.decode() if isinstance(member, bytes) else member for member in cache.smembers(parents_key))
+    for bom_no in boms:
+        cache.delete_keys(f"{EXPLODED_BOM_CACHE_PREFIX}{bom_no}:")
+    cache.delete_value(parents_key)
+
+
+@frappe.whitelist()
+def get_exploded_bom_cache_stats():
+    """BOM 展开缓存的命中 / 未命中次数"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    hits = int(cache.get(cache.make_key(EXPLODED_BOM_HITS_KEY)) or 0)
+    misses = int(cache.get(cache.make_key(EXPLODED_BOM_MISSES_KEY)) or 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": flt(hits / (hits + misses), 4) if hits + misses else 0
+    }
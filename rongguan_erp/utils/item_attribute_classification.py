@@ -0,0 +1,250 @@
+"""
+物料属性分类服务
+按 Item Attribute 的 _user_tags 判定属性是颜色（含「颜色」）还是尺码（含「尺寸」），
+并批量解析物料的颜色/尺码，一批物料只需一条查询。
+
+属性 → 分类的映射缓存在站点缓存中，
+通过 hooks.py 的 doc_events 在 Item Attribute 变更或打标签时失效；
+移除标签不会触发文档事件，因此缓存另设较短的过期时间兜底。
+
+属性值目录（get_attribute_value_catalog）同样缓存在站点缓存中，缓存键带版本号，
+Item Attribute 变更时更新版本号，旧版本的缓存自然失效，版本号也用作 HTTP ETag。
+"""
+import hashlib
+import json
+
+import frappe
+
+
+ITEM_ATTRIBUTE_CLASSIFICATION_CACHE_KEY = "rg_item_attribute_classification"
+ITEM_ATTRIBUTE_CLASSIFICATION_TTL = 10 * 60
+
+ATTRIBUTE_CATALOG_VERSION_CACHE_KEY = "rg_attribute_catalog_version"
+ATTRIBUTE_CATALOG_CACHE_PREFIX = "rg_attribute_catalog:"
+# 删除标签走 frappe.db.delete，不触发 Tag Link 的 on_trash，目录版本号不会更新；
+# 版本号与目录和分类缓存一样按 ITEM_ATTRIBUTE_CLASSIFICATION_TTL 过期，过期后 ETag 随之变化
+ATTRIBUTE_CATALOG_TTL = ITEM_ATTRIBUTE_CLASSIFICATION_TTL
+
+COLOR_TAG = "颜色"
+SIZE_TAG = "尺寸"
+
+
+def _build_attribute_classification():
+    """一次查询构建 Item Attribute → {is_color, is_size, tags} 映射"""
+    rows = frappe.db.sql("SELECT name, _user_tags FROM `tabItem Attribute`")
+    classification = {}
+    for name, user_tags in rows:
+        user_tags = user_tags or ""
+        classification[name] = {
+            "is_color": COLOR_TAG in user_tags,
+            "is_size": SIZE_TAG in user_tags,
+            "tags": user_tags,
+        }
+    return classification
+
+
+def get_attribute_classification():
+    """获取缓存的 Item Attribute 分类映射"""
+    cache = frappe.cache()
+    classification = cache.get_value(ITEM_ATTRIBUTE_CLASSIFICATION_CACHE_KEY)
+    if classification is None:
+        classification = _build_attribute_classification()
+        cache.set_value(
+            ITEM_ATTRIBUTE_CLASSIFICATION_CACHE_KEY, classification,
+            expires_in_sec=ITEM_ATTRIBUTE_CLASSIFICATION_TTL
+        )
+    return classification
+
+
+def clear_attribute_classification(doc=None, method=None):
+    """Item Attribute 变更时清除分类缓存并更新属性值目录版本（doc_events 回调）"""
+    frappe.cache().delete_value(ITEM_ATTRIBUTE_CLASSIFICATION_CACHE_KEY)
+    bump_attribute_catalog_version()
+
+
+def clear_attribute_classification_on_tag(doc=None, method=None):
+    """Tag Link 变更时，仅当标签打在 Item Attribute 上才清除缓存"""
+    if doc is None or doc.get("document_type") == "Item Attribute":
+        clear_attribute_classification()
+
+
+def get_attribute_type(attribute):
+    """
+    返回属性类型：颜色属性返回 "color"，尺码属性返回 "size"，否则返回 ""
+    （同时含两个标签时按颜色处理，与原有判定顺序一致）
+    """
+    info = get_attribute_classification().get(attribute) or {}
+    if info.get("is_color"):
+        return "color"
+    if info.get("is_size"):
+        return "size"
+    return ""
+
+
+def get_attribute_tags(attribute):
+    """返回属性的 _user_tags 原始值"""
+    return (get_attribute_classification().get(attribute) or {}).get("tags") or ""
+
+
+def get_color_attributes():
+    """所有颜色属性名"""
+    return [name for name, info in get_attribute_classification().items() if info["is_color"]]
+
+
+def get_size_attributes():
+    """所有尺码属性名（不含同时标记为颜色的属性）"""
+    return [
+        name for name, info in get_attribute_classification().items()
+        if info["is_size"] and not info["is_color"]
+    ]
+
+
+def classify_attributes(attributes):
+    """
+    从变体属性行中解析 (颜色, 尺码)，不查询数据库
+
+    Args:
+        attributes: 可迭代的属性行，每行含 attribute、attribute_value（dict 或 Document）
+    """
+    color = ""
+    size = ""
+    for attr in attributes:
+        attribute_type = get_attribute_type(attr.get("attribute"))
+        value = (attr.get("attribute_value") or "").strip()
+        if attribute_type == "color" and not color:
+            color = value
+        elif attribute_type == "size" and not size:
+            size = value
+    return color, size
+
+
+def classify_items(item_codes):
+    """
+    批量解析物料的颜色、尺码
+
+    一条查询读取所有物料的颜色/尺码变体属性，属性分类走站点缓存。
+
+    Args:
+        item_codes: 物料代码列表
+
+    Returns:
+        dict: {item_code: (颜色, 尺码)}，没有对应属性时为空字符串
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    result = {code: ("", "") for code in item_codes}
+    if not item_codes:
+        return result
+
+    attributes = get_color_attributes() + get_size_attributes()
+    if not attributes:
+        return result
+
+    rows = frappe.db.sql("""
+        SELECT parent, attribute, attribute_value
+        FROM `tabItem Variant Attribute`
+        WHERE parenttype = 'Item'
+            AND parent IN %(item_codes)s
+            AND attribute IN %(attributes)s
+        ORDER BY parent, idx
+    """, {"item_codes": tuple(item_codes), "attributes": tuple(attributes)}, as_dict=True)
+
+    rows_by_item = {}
+    for row in rows:
+        rows_by_item.setdefault(row.parent, []).append(row)
+    for item_code, item_rows in rows_by_item.items():
+        result[item_code] = classify_attributes(item_rows)
+    return result
+
+
+def classify_item(item_code):
+    """解析单个物料的 (颜色, 尺码)"""
+    return classify_items([item_code]).get(item_code, ("", ""))
+
+
+def get_attribute_catalog_version():
+    """当前属性值目录版本号（缓存被清空或过期时重新生成）"""
+    cache = frappe.cache()
+    version = cache.get_value(ATTRIBUTE_CATALOG_VERSION_CACHE_KEY)
+    if not version:
+        version = frappe.generate_hash(length=12)
+        cache.set_value(ATTRIBUTE_CATALOG_VERSION_CACHE_KEY, version, expires_in_sec=ATTRIBUTE_CATALOG_TTL)
+    return version
+
+
+def bump_attribute_catalog_version():
+    """更新目录版本号，使所有已缓存的目录失效"""
+    frappe.cache().set_value(
+        ATTRIBUTE_CATALOG_VERSION_CACHE_KEY, frappe.generate_hash(length=12), expires_in_sec=ATTRIBUTE_CATALOG_TTL
+    )
+
+
+def _build_attribute_value_catalog(filters=None, customer=None):
+    """
+    一条 JOIN 查询构建属性值目录：Item Attribute Value + 父表 Item Attribute 信息
+
+    customer 不为 None 时在 SQL 中过滤：customer 为空（通用）或等于该客户。
+    其余 filters 作用于 Item Attribute Value，由 frappe.get_all 生成子查询。
+    """
+    conditions = ["iav.parenttype = 'Item Attribute'"]
+    values = {}
+    if filters:
+        names_query = frappe.get_all(
+            "Item Attribute Value", filters=filters, fields=["name"], limit_page_length=0, run=0
+        )
+        # 子查询中的 % 需要转义，避免与命名参数占位符冲突
+        conditions.append(f"iav.name IN ({names_query.replace('%', '%%')})")
+    if customer is not None:
+        conditions.append("(IFNULL(iav.customer, '') = '' OR iav.customer = %(customer)s)")
+        values["customer"] = customer
+
+    rows = frappe.db.sql(f"""
+        SELECT
+            iav.*,
+            ia.attribute_name AS ia_attribute_name,
+            ia.numeric_values AS ia_numeric_values,
+            ia.disabled AS ia_disabled,
+            ia._user_tags AS ia_user_tags
+        FROM `tabItem Attribute Value` iav
+        INNER JOIN `tabItem Attribute` ia ON ia.name = iav.parent
+        WHERE {' AND '.join(conditions)}
+        ORDER BY iav.parent, iav.idx
+    """, values, as_dict=True)
+
+    catalog = []
+    for row in rows:
+        user_tags = row.pop("ia_user_tags") or ""
+        row["doctype"] = "Item Attribute Value"
+        row["item_attribute"] = {
+            "attribute_name": row.pop("ia_attribute_name"),
+            "numeric_values": row.pop("ia_numeric_values"),
+            "disabled": row.pop("ia_disabled"),
+            "_user_tags": user_tags,
+            "is_size": 1 if SIZE_TAG in user_tags else 0,
+            "is_color": 1 if COLOR_TAG in user_tags else 0,
+        }
+        catalog.append(row)
+    return catalog
+
+
+def get_attribute_value_catalog(filters=None, customer=None):
+    """
+    获取（缓存的）属性值目录
+
+    Args:
+        filters: 作用于 Item Attribute Value 的过滤条件
+        customer: 仅返回该客户可用的属性值（None 表示不按客户过滤）
+
+    Returns:
+        tuple: (目录列表, etag)
+    """
+    version = get_attribute_catalog_version()
+    key_source = json.dumps([filters or {}, customer], sort_keys=True, default=str)
+    etag = hashlib.md5(f"{version}:{key_source}".encode()).hexdigest()
+    cache_key = f"{ATTRIBUTE_CATALOG_CACHE_PREFIX}{etag}"
+
+    cache = frappe.cache()
+    catalog = cache.get_value(cache_key)
+    if catalog is None:
+        catalog = _build_attribute_value_catalog(filters, customer)
+        cache.set_value(cache_key, catalog, expires_in_sec=ATTRIBUTE_CATALOG_TTL)
+    return catalog, etag
@@ -0,0 +1,172 @@
+"""
+物料反查索引（RG Material Where Used）
+
+按 (物料, BOM) 维护一行：成品物料、单位成品用量、是否直接用料。
+物料包括 BOM Item 中的直接用料（含半成品）和 BOM Explosion Item 中展开后的原材料，
+因此按物料一次索引查询即可得到所有直接或间接用到它的 BOM。
+
+索引行由 hooks.py 的 doc_events 维护：BOM 提交 / 提交后更新时重建该 BOM 的行，取消 / 删除时移除。
+销售订单与工单不进索引，查询时按 BOM 关联（Sales Order Item.custom_updated_bom_no / bom_no、
+Work Order.bom_no 上有索引），update_sales_order_item_bom_no 等改绑 BOM 后立即生效，
+订单关闭、工单完成等状态变化也无需另外维护。
+BOM 的启用 / 默认标志同样在查询时按主键关联 BOM 读取：ERPNext 切换默认 BOM 时用 SQL 直接清除其他 BOM 的
+is_default，BOM 更新工具也不触发文档事件，索引中保存这两个标志会过期。
+偏差可用 rebuild_material_where_used（bench rebuild-material-where-used）整体重建。
+"""
+import frappe
+from frappe.utils import flt, now_datetime
+
+
+WHERE_USED_DOCTYPE = "RG Material Where Used"
+
+# 整体重建时每批处理的 BOM 数
+REBUILD_BOM_CHUNK = 500
+
+# 视为已结束、不再列出的单据状态
+CLOSED_SALES_ORDER_STATUSES = ("Closed", "Completed")
+CLOSED_WORK_ORDER_STATUSES = ("Completed", "Stopped", "Closed", "Cancelled")
+
+
+def _compute_where_used_rows(bom_nos):
+    """为一批已提交的 BOM 计算索引行（BOM 头、BOM Item、BOM Explosion Item 各一条查询）"""
+    boms = {
+        bom.name: bom for bom in frappe.get_all(
+            "BOM",
+            filters={"name": ["in", bom_nos], "docstatus": 1},
+            fields=["name", "item", "quantity"]
+        )
+    }
+    if not boms:
+        return []
+
+    direct = frappe.db.sql("""
+        SELECT parent, item_code, SUM(stock_qty)
+        FROM `tabBOM Item`
+        WHERE parent IN %(boms)s AND parenttype = 'BOM'
+        GROUP BY parent, item_code
+    """, {"boms": tuple(boms)})
+    exploded = frappe.db.sql("""
+        SELECT parent, item_code, SUM(stock_qty)
+        FROM `tabBOM Explosion Item`
+        WHERE parent IN %(boms)s AND parenttype = 'BOM'
+        GROUP BY parent, item_code
+    """, {"boms": tuple(boms)})
+
+    # 同一物料既是直接用料又出现在展开结果中时合为一行：用量取展开后的总用量
+    rows = {}
+    for bom_no, material, stock_qty in direct:
+        rows[(material, bom_no)] = {"qty": flt(stock_qty), "is_direct": 1}
+    for bom_no, material, stock_qty in exploded:
+        row = rows.setdefault((material, bom_no), {"is_direct": 0})
+        row["qty"] = flt(stock_qty)
+
+    result = []
+    for (material, bom_no), row in rows.items():
+        bom = boms[bom_no]
+        result.append((material, bom_no, bom.item, row["qty"] / (flt(bom.quantity) or 1), row["is_direct"]))
+    return result
+
+
+def _insert_where_used_rows(rows):
+    fields = ["name", "owner", "creation", "modified", "modified_by", "docstatus",
+              "material", "bom", "finished_item", "qty_per_unit", "is_direct"]
+    now = now_datetime()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        WHERE_USED_DOCTYPE,
+        fields,
+        [(frappe.generate_hash(length=10), user, now, now, user, 0) + row for row in rows]
+    )
+
+
+def refresh_where_used(bom_nos):
+    """重建指定 BOM 的索引行（未提交或已取消的 BOM 只删除不写入）"""
+    bom_nos = list(dict.fromkeys(bom_no for bom_no in bom_nos if bom_no))
+    if not bom_nos:
+        return
+    rows = _compute_where_used_rows(bom_nos)
+    frappe.db.sql(
+        f"DELETE FROM `tab{WHERE_USED_DOCTYPE}` WHERE bom IN %(boms)s", {"boms": tuple(bom_nos)}
+    )
+    if rows:
+        _insert_where_used_rows(rows)
+
+
+def update_where_used(doc, method=None):
+    """doc_events 回调：BOM 提交、提交后更新、取消或删除时刷新该 BOM 的索引行"""
+    refresh_where_used([doc.name])
+
+
+def rebuild_material_where_used():
+    """整体重建物料反查索引（修复偏差）"""
+    frappe.db.sql(f"DELETE FROM `tab{WHERE_USED_DOCTYPE}`")
+    bom_nos = frappe.get_all("BOM", filters={"docstatus": 1}, pluck="name", order_by="name asc")
+    count = 0
+    for start in range(0, len(bom_nos), REBUILD_BOM_CHUNK):
+        rows = _compute_where_used_rows(bom_nos[start:start + REBUILD_BOM_CHUNK])
+        if rows:
+            _insert_where_used_rows(rows)
+        count += len(rows)
+    return count
+
+
+def get_where_used(material, include_inactive=False):
+    """
+    查询物料被哪些 BOM、成品、未结束的销售订单和工单使用
+
+    Args:
+        material: 物料编码
+        include_inactive: 是否包含已停用的 BOM
+
+    Returns:
+        list: 每个 BOM 一项，含 finished_item、qty_per_unit、is_direct 以及 sales_orders、work_orders
+    """
+    boms = frappe.db.sql(f"""
+        SELECT wu.bom, wu.finished_item, wu.qty_per_unit, wu.is_direct, bom.is_active, bom.is_default
+        FROM `tab{WHERE_USED_DOCTYPE}` wu
+        JOIN `tabBOM` bom ON bom.name = wu.bom
+        WHERE wu.material = %(material)s {"" if include_inactive else "AND bom.is_active = 1"}
+        ORDER BY wu.finished_item, wu.bom
+    """, {"material": material}, as_dict=True)
+    if not boms:
+        return []
+
+    values = {"boms": tuple(bom.bom for bom in boms)}
+
+    sales_orders = {}
+    for row in frappe.db.sql("""
+        SELECT
+            IF(IFNULL(soi.custom_updated_bom_no, '') != '', soi.custom_updated_bom_no, soi.bom_no) AS bom,
+            soi.parent AS sales_order, soi.name AS sales_order_item, soi.item_code,
+            soi.qty, soi.delivery_date, so.customer, so.status
+        FROM `tabSales Order Item` soi
+        JOIN `tabSales Order` so ON so.name = soi.parent
+        WHERE (
+                soi.custom_updated_bom_no IN %(boms)s
+                OR (IFNULL(soi.custom_updated_bom_no, '') = '' AND soi.bom_no IN %(boms)s)
+            )
+            AND so.docstatus = 1
+            AND so.status NOT IN %(closed_statuses)s
+        ORDER BY soi.delivery_date, soi.parent, soi.idx
+    """, {**values, "closed_statuses": CLOSED_SALES_ORDER_STATUSES}, as_dict=True):
+        sales_orders.setdefault(row.pop("bom"), []).append(row)
+
+    work_orders = {}
+    for row in frappe.get_all(
+        "Work Order",
+        filters={
+            "bom_no": ["in", values["boms"]],
+            "docstatus": ["<", 2],
+            "status": ["not in", CLOSED_WORK_ORDER_STATUSES]
+        },
+        fields=["name", "bom_no", "production_item", "qty", "produced_qty", "status", "sales_order",
+                "planned_start_date"],
+        order_by="planned_start_date asc",
+        limit_page_length=0
+    ):
+        work_orders.setdefault(row.pop("bom_no"), []).append(row)
+
+    for bom in boms:
+        bom.sales_orders = sales_orders.get(bom.bom, [])
+        bom.work_orders = work_orders.get(bom.bom, [])
+    return boms
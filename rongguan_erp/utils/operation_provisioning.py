@@ -0,0 +1,91 @@
+"""
+工序（Operation）批量准备
+
+保存 BOM / 物料工序时，先收集整个请求中出现的所有工序名，
+只对未知的工序发一条 IN (...) 查询，缺失的工序一次批量插入。
+
+已知工序名集合缓存在站点缓存中，Operation 删除或重命名时通过 hooks.py 的 doc_events 清除；
+新建的工序即使不在缓存里也只会多一次集合查询，不影响正确性。
+查到的和新建的工序都要等事务提交后才写入缓存（同一事务中早先插入的工序也会被查到），
+调用方回滚时缓存里不会留下未保存的工序。
+
+批量插入不经过 Operation.insert()，不触发其校验与文档事件（Operation 本身只有名称和工作站），
+因此在插入前单独检查 Operation 的创建权限。
+"""
+import frappe
+from frappe.utils import now_datetime
+
+
+KNOWN_OPERATIONS_CACHE_KEY = "rg_known_operations"
+KNOWN_OPERATIONS_TTL = 60 * 60
+
+
+def _get_known_operations():
+    return set(frappe.cache().get_value(KNOWN_OPERATIONS_CACHE_KEY) or [])
+
+
+def _set_known_operations(known):
+    frappe.cache().set_value(
+        KNOWN_OPERATIONS_CACHE_KEY, sorted(known), expires_in_sec=KNOWN_OPERATIONS_TTL
+    )
+
+
+def _remember_operations(names):
+    """把事务中查到或新建的工序并入缓存（提交后回调）"""
+    _set_known_operations(_get_known_operations() | set(names))
+
+
+def clear_known_operations(doc=None, method=None):
+    """Operation 删除或重命名时清除已知工序缓存（doc_events 回调）"""
+    frappe.cache().delete_value(KNOWN_OPERATIONS_CACHE_KEY)
+
+
+def provision_operations(operation_rows):
+    """
+    确保工序存在：缺失的工序一次批量创建
+
+    Args:
+        operation_rows: 可迭代的工序行，每行含 operation，可选 workstation
+                        （dict 或 Document；同名工序取第一次出现的工作站）
+
+    Returns:
+        list: 本次新建的工序名
+    """
+    workstations = {}
+    for row in operation_rows:
+        operation_name = (row.get("operation") or "").strip()
+        if operation_name and operation_name not in workstations:
+            workstations[operation_name] = row.get("workstation")
+
+    known = _get_known_operations()
+    unknown = [name for name in workstations if name not in known]
+    if not unknown:
+        return []
+
+    existing = set(frappe.get_all("Operation", filters={"name": ["in", unknown]}, pluck="name"))
+    missing = [name for name in unknown if name not in existing]
+
+    if missing:
+        frappe.has_permission("Operation", "create", throw=True)
+
+        # 工作站不存在时不写入，避免整条工序因链接校验失败而无法创建
+        requested_workstations = list({workstations[name] for name in missing if workstations[name]})
+        valid_workstations = set(
+            frappe.get_all("Workstation", filters={"name": ["in", requested_workstations]}, pluck="name")
+        ) if requested_workstations else set()
+
+        now = now_datetime()
+        user = frappe.session.user
+        frappe.db.bulk_insert(
+            "Operation",
+            ["name", "owner", "creation", "modified", "modified_by", "docstatus", "workstation"],
+            [
+                (name, user, now, now, user, 0,
+                 workstations[name] if workstations[name] in valid_workstations else None)
+                for name in missing
+            ],
+            ignore_duplicates=True
+        )
+
+    frappe.db.after_commit.add(lambda: _remember_operations(existing | set(missing)))
+    return missing
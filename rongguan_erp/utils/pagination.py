@@ -0,0 +1,232 @@
+"""
+列表接口通用的游标（keyset）分页与总数缓存
+
+- 游标为不透明字符串，编码了上一页最后一行的排序键 (sort_value, name) 和排序方式；
+  下一页通过 WHERE (sort_field, name) < (sort_value, name) 定位，避免 OFFSET 深翻页线性变慢。
+- 总数改为可选、可缓存的伴随调用（cached_count），游标模式默认不计算。
+"""
+import base64
+import hashlib
+import json
+import re
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+
+# 游标模式支持的排序写法：单字段 + 方向（name 作为并列时的第二排序键）
+_ORDER_BY_PATTERN = re.compile(r"^`?([a-zA-Z_][a-zA-Z0-9_]*)`?(?:\s+(asc|desc))?$", re.IGNORECASE)
+
+# 总数缓存默认有效期（秒）
+COUNT_CACHE_TTL = 30
+COUNT_CACHE_PREFIX = "rg_list_count:"
+# 每个 DocType 的总数缓存版本号：写入时 INCR 一次，旧版本的缓存键不再命中、随过期时间淘汰
+COUNT_CACHE_VERSION_PREFIX = "rg_list_count_version:"
+
+
+class InvalidCursorError(frappe.ValidationError):
+    pass
+
+
+def parse_order_by(order_by, default="creation desc"):
+    """
+    解析排序为 (sort_field, direction)；不是单字段排序时返回 None（此时不能使用游标分页）
+    """
+    match = _ORDER_BY_PATTERN.match((order_by or default).strip())
+    if not match:
+        return None
+    return match.group(1), (match.group(2) or "asc").lower()
+
+
+def encode_cursor(row, sort_field, direction):
+    """根据一行数据生成下一页游标"""
+    payload = {
+        "f": sort_field,
+        "d": direction,
+        "v": row.get(sort_field),
+        "n": row.get("name"),
+    }
+    raw = json.dumps(payload, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_field, direction):
+    """解析游标，并校验其排序方式与本次请求一致"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except Exception:
+        raise InvalidCursorError(_("无效的分页游标"))
+
+    if payload.get("f") != sort_field or payload.get("d") != direction or not payload.get("n"):
+        raise InvalidCursorError(_("分页游标与当前排序方式不一致"))
+    return payload["v"], payload["n"]
+
+
+def keyset_condition(sort_field, direction, cursor, table=None):
+    """
+    生成原生 SQL 用的游标条件
+
+    Returns:
+        tuple: (SQL 片段, 命名参数字典)；cursor 为空时返回 ("1=1", {})
+    """
+    if not cursor:
+        return "1=1", {}
+
+    sort_value, last_name = decode_cursor(cursor, sort_field, direction)
+    prefix = f"{table}." if table else ""
+    op = "<" if direction == "desc" else ">"
+    if sort_field == "name":
+        return f"{prefix}`name` {op} %(cursor_name)s", {"cursor_name": last_name}
+
+    condition = (
+        f"({prefix}`{sort_field}` {op} %(cursor_value)s OR "
+        f"({prefix}`{sort_field}` = %(cursor_value)s AND {prefix}`name` {op} %(cursor_name)s))"
+    )
+    return condition, {"cursor_value": sort_value, "cursor_name": last_name}
+
+
+def keyset_order_by(sort_field, direction, table=None):
+    """游标分页使用的稳定排序（name 作为第二排序键）"""
+    if not table:
+        if sort_field == "name":
+            return f"name {direction}"
+        return f"{sort_field} {direction}, name {direction}"
+    if sort_field == "name":
+        return f"{table}.`name` {direction}"
+    return f"{table}.`{sort_field}` {direction}, {table}.`name` {direction}"
+
+
+def filters_to_list(filters):
+    """把 dict 形式的 filters 转为 list 形式，便于追加游标条件"""
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        filters_list = []
+        for fieldname, value in filters.items():
+            if isinstance(value, (list, tuple)) and len(value) == 2:
+                filters_list.append([fieldname, value[0], value[1]])
+            else:
+                filters_list.append([fieldname, "=", value])
+        return filters_list
+    return [list(f) if isinstance(f, (list, tuple)) else f for f in filters]
+
+
+def keyset_get_all(doctype, filters=None, fields=None, order_by=None, page_size=20,
+                   cursor=None, getter=None, **kwargs):
+    """
+    基于 frappe.get_all/get_list 的游标分页
+
+    (sort_field, name) 的比较拆成两条可走索引的查询：先取与游标同排序值、name 更靠后的行，
+    不够一页时再取排序值严格更靠后的行。多取一行用于判断是否还有下一页。
+
+    Args:
+        doctype: DocType
+        filters: 过滤条件（dict 或 list）
+        fields: 查询字段（会自动补上排序字段和 name）
+        order_by: 单字段排序，如 "creation desc"
+        page_size: 每页数量
+        cursor: 上一页返回的 next_cursor，为空表示第一页
+        getter: 查询函数，默认 frappe.get_all（可传 frappe.get_list）
+        **kwargs: 透传给 getter 的其他参数
+
+    Returns:
+        dict: {'rows': [...], 'next_cursor': str | None, 'has_next': bool}
+    """
+    getter = getter or frappe.get_all
+    sort = parse_order_by(order_by)
+    if not sort:
+        raise InvalidCursorError(_("游标分页只支持单字段排序，当前排序: {0}").format(order_by))
+    sort_field, direction = sort
+
+    fields = list(fields or ["name"])
+    for required in (sort_field, "name"):
+        if required not in fields and "*" not in fields:
+            fields.append(required)
+
+    base_filters = filters_to_list(filters)
+    op = "<" if direction == "desc" else ">"
+    limit = page_size + 1
+    rows = []
+
+    if cursor:
+        sort_value, last_name = decode_cursor(cursor, sort_field, direction)
+        if sort_field != "name":
+            rows = getter(
+                doctype,
+                filters=base_filters + [[sort_field, "=", sort_value], ["name", op, last_name]],
+                fields=fields,
+                order_by=f"name {direction}",
+                limit_page_length=limit,
+                **kwargs
+            )
+            keyset_filters = base_filters + [[sort_field, op, sort_value]]
+        else:
+            keyset_filters = base_filters + [["name", op, last_name]]
+    else:
+        keyset_filters = base_filters
+
+    if len(rows) < limit:
+        rows += getter(
+            doctype,
+            filters=keyset_filters,
+            fields=fields,
+            order_by=keyset_order_by(sort_field, direction),
+            limit_page_length=limit - len(rows),
+            **kwargs
+        )
+
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        "rows": rows,
+        "next_cursor": encode_cursor(rows[-1], sort_field, direction) if has_next else None,
+        "has_next": has_next,
+    }
+
+
+def next_cursor_for(rows, order_by, has_next):
+    """为 OFFSET 分页结果生成 next_cursor，便于调用方从页码模式切换到游标模式"""
+    sort = parse_order_by(order_by)
+    if not sort or not rows or not has_next:
+        return None
+    if not rows[-1].get("name") or sort[0] not in rows[-1]:
+        return None
+    return encode_cursor(rows[-1], *sort)
+
+
+def cached_count(doctype, filters=None, counter=None, ttl=COUNT_CACHE_TTL, extra_key=None):
+    """
+    带短期缓存的总数查询，缓存键由 doctype 与过滤条件的哈希组成
+
+    Args:
+        doctype: DocType
+        filters: 过滤条件
+        counter: 自定义计数函数（无参），默认 frappe.db.count(doctype, filters)
+        ttl: 缓存秒数
+        extra_key: 参与缓存键计算的额外条件（如搜索关键词）
+    """
+    cache = frappe.cache()
+    version = cint(cache.get(cache.make_key(f"{COUNT_CACHE_VERSION_PREFIX}{doctype}")))
+    key_source = json.dumps([doctype, filters, extra_key], sort_keys=True, default=str)
+    cache_key = f"{COUNT_CACHE_PREFIX}{doctype}:{version}:{hashlib.md5(key_source.encode()).hexdigest()}"
+
+    cached = cache.get_value(cache_key)
+    if cached is not None:
+        return cint(cached)
+
+    total_count = counter() if counter else frappe.db.count(doctype, filters=filters)
+    cache.set_value(cache_key, total_count, expires_in_sec=ttl)
+    return total_count
+
+
+def clear_cached_counts(doctype):
+    """使某个 DocType 的全部总数缓存失效：只递增版本号（一次 INCR），不按模式扫描删除"""
+    cache = frappe.cache()
+    cache.incr(cache.make_key(f"{COUNT_CACHE_VERSION_PREFIX}{doctype}"))
+
+
+def clear_cached_counts_on_write(doc, method=None):
+    """文档新增、修改、删除时清除该 DocType 的总数缓存（doc_events 回调）"""
+    clear_cached_counts(doc.doctype)
@@ -0,0 +1,151 @@
+"""
+待处理请购数量汇总（RG Pending Request Qty）
+
+按 (物料, 仓库) 维护已提交 Material Request 的待处理数量 SUM(qty - ordered_qty)，
+库存接口与计划页面直接按物料读取汇总行，不再每次扫描全部请购明细。
+
+汇总行由 hooks.py 的 doc_events 维护：
+- Material Request 提交 / 取消 / 提交后更新：刷新该单据涉及的物料
+- Purchase Order 提交 / 取消 / 提交后更新：采购订单会回写请购的 ordered_qty，刷新引用了请购的物料
+- Stock Entry 提交 / 取消：调拨 / 领料类请购的 ordered_qty 由库存凭证回写，刷新引用了请购的物料
+- Work Order 提交 / 取消：生产类请购的 ordered_qty 由工单回写，刷新工单的生产物料
+这些回写都用 db.set_value，不触发 Material Request 的文档事件。
+刷新按物料重新汇总后整体替换，与事务一起提交或回滚；
+其他途径产生的偏差由每日定时任务整体重建兜底，也可手动执行 bench rebuild-pending-request-qty。
+"""
+import frappe
+from frappe.utils import flt
+
+
+PENDING_REQUEST_QTY_DOCTYPE = "RG Pending Request Qty"
+
+# 整体重建时每批写入的行数
+REBUILD_INSERT_CHUNK = 5000
+
+
+def _compute_pending_request_qty(item_codes=None):
+    """
+    从请购明细汇总待处理数量
+
+    Args:
+        item_codes: 物料列表；为 None 时汇总全部物料
+
+    Returns:
+        list: [(item_code, warehouse, pending_qty)]，warehouse 为空时为 ""
+    """
+    conditions = ["mr.docstatus = 1", "mr.status != 'Cancelled'"]
+    values = {}
+    if item_codes is not None:
+        conditions.append("mri.item_code IN %(item_codes)s")
+        values["item_codes"] = tuple(item_codes)
+
+    return frappe.db.sql(f"""
+        SELECT mri.item_code, IFNULL(mri.warehouse, ''), SUM(mri.qty - mri.ordered_qty)
+        FROM `tabMaterial Request Item` mri
+        JOIN `tabMaterial Request` mr ON mri.parent = mr.name
+        WHERE {' AND '.join(conditions)}
+        GROUP BY mri.item_code, IFNULL(mri.warehouse, '')
+    """, values)
+
+
+def _insert_pending_rows(rows):
+    """批量写入汇总行"""
+    fields = ["name", "owner", "creation", "modified", "modified_by", "docstatus",
+              "item_code", "warehouse", "pending_qty"]
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    values = [
+        (frappe.generate_hash(length=10), user, now, now, user, 0, item_code, warehouse, flt(pending_qty))
+        for item_code, warehouse, pending_qty in rows
+    ]
+    for start in range(0, len(values), REBUILD_INSERT_CHUNK):
+        frappe.db.bulk_insert(PENDING_REQUEST_QTY_DOCTYPE, fields, values[start:start + REBUILD_INSERT_CHUNK])
+
+
+def refresh_pending_request_qty(item_codes):
+    """重新汇总指定物料的待处理请购数量并替换汇总行"""
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    if not item_codes:
+        return
+
+    rows = _compute_pending_request_qty(item_codes)
+    frappe.db.sql(
+        f"DELETE FROM `tab{PENDING_REQUEST_QTY_DOCTYPE}` WHERE item_code IN %(item_codes)s",
+        {"item_codes": tuple(item_codes)}
+    )
+    _insert_pending_rows(rows)
+
+
+def update_pending_request_qty(doc, method=None):
+    """
+    doc_events 回调：Material Request / Purchase Order / Stock Entry / Work Order 提交、取消
+    或提交后更新时刷新相关物料
+    """
+    if doc.doctype in ("Purchase Order", "Stock Entry"):
+        item_codes = [row.item_code for row in doc.get("items") or [] if row.get("material_request")]
+    elif doc.doctype == "Work Order":
+        item_codes = [doc.production_item] if doc.get("material_request") else []
+    else:
+        item_codes = [row.item_code for row in doc.get("items") or []]
+    refresh_pending_request_qty(item_codes)
+
+
+def rebuild_pending_request_qty():
+    """整体重建汇总表（修复偏差，每日定时任务）"""
+    rows = _compute_pending_request_qty()
+    frappe.db.sql(f"DELETE FROM `tab{PENDING_REQUEST_QTY_DOCTYPE}`")
+    _insert_pending_rows(rows)
+    return len(rows)
+
+
+def get_pending_request_qty(item_codes, warehouses=None):
+    """
+    读取物料的待处理请购数量（按物料索引读取汇总行）
+
+    Args:
+        item_codes: 物料列表
+        warehouses: 仓库列表（可选，只统计这些仓库的请购）
+
+    Returns:
+        dict: {item_code: pending_qty}
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    if not item_codes:
+        return {}
+
+    conditions = ["item_code IN %(item_codes)s"]
+    values = {"item_codes": tuple(item_codes)}
+    if warehouses:
+        conditions.append("warehouse IN %(warehouses)s")
+        values["warehouses"] = tuple(warehouses)
+
+    return {
+        item_code: flt(pending_qty)
+        for item_code, pending_qty in frappe.db.sql(f"""
+            SELECT item_code, SUM(pending_qty)
+            FROM `tab{PENDING_REQUEST_QTY_DOCTYPE}`
+            WHERE {' AND '.join(conditions)}
+            GROUP BY item_code
+        """, values)
+    }
+
+
+def get_pending_request_qty_by_warehouse(item_codes):
+    """
+    按仓库读取物料的待处理请购数量
+
+    Returns:
+        dict: {item_code: {warehouse: pending_qty}}，请购未指定仓库时 warehouse 为 ""
+    """
+    item_codes = list(dict.fromkeys(code for code in item_codes if code))
+    result = {item_code: {} for item_code in item_codes}
+    if not item_codes:
+        return result
+
+    for item_code, warehouse, pending_qty in frappe.db.sql(f"""
+        SELECT item_code, warehouse, pending_qty
+        FROM `tab{PENDING_REQUEST_QTY_DOCTYPE}`
+        WHERE item_code IN %(item_codes)s
+    """, {"item_codes": tuple(item_codes)}):
+        result[item_code][warehouse or ""] = flt(pending_qty)
+    return result